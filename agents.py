@@ -1,10 +1,26 @@
 from multigrid.core.actions import ActionUpDown
+from multigrid.utils.scheduling import compile_schedule
+
+# ActionUpDown members, indexed by action value
+ACTIONS = tuple(ActionUpDown)
+
+# (dx, dy) of each movement action
+DELTAS = {
+    ActionUpDown.left: (-1, 0),
+    ActionUpDown.right: (1, 0),
+    ActionUpDown.up: (0, -1),
+    ActionUpDown.down: (0, 1),
+}
+
 
 class AgentCollection:
-    def __init__(self, num=0):
+    def __init__(self, num=0, navigator=None):
+        """
+        Create `num` agents, sharing an optional `Navigator` for obstacle-aware moves.
+        """
         self.agents = {}
         for i in range(num):
-            self.add_agent(BaseAgent(i))
+            self.add_agent(BaseAgent(i, navigator=navigator))
 
     def add_agent(self, agent):
         """
@@ -27,14 +43,48 @@ class AgentCollection:
         """
         for name, hla in hla_dict.items():
             self.agents[name].tell(hla)
+
+    def tell_plan(self, plan, replace=False):
+        """
+        Process a structured plan for all agents in it.
+        The plan is a `Plan` or a dict of agent name -> list of actions
+        (e.g. `Plan.agents`), applied without the string round trip of `tell`.
+        If `replace` is set, the agents in the plan drop their current actions first.
+        """
+        for name, actions in getattr(plan, "agents", plan).items():
+            agent = self.agents[name]
+            if replace:
+                agent.stop()
+            for action in actions:
+                agent.tell_action(action)
             
-    def act(self):
+    def compile(self, positions, passable=None, **kwargs):
+        """
+        Rewrite the action queues of all agents into a collision-free joint schedule,
+        for environments where agents cannot overlap (see `compile_schedule`).
+        `positions` maps agent names to their current (x, y) positions.
+        The passability mask defaults to the one of the agents' navigator, if any.
+        """
+        if passable is None:
+            navigators = [a.navigator for a in self.agents.values() if a.navigator]
+            if navigators:
+                passable = navigators[0].passable
+        queues = {name: agent.action_queue for name, agent in self.agents.items()}
+        schedules = compile_schedule(queues, positions, passable, **kwargs)
+        for name, schedule in schedules.items():
+            self.agents[name].set_path([ACTIONS[a] for a in schedule.tolist()])
+
+    def act(self, positions=None):
         """
         Call the `act` method on all agents and return their actions.
+        If `positions` (agent name -> observed (x, y) position) is given,
+        agents that are not where their plan expects re-anchor their
+        remaining actions first.
         """
         actions = {}
         for name, agent in self.agents.items():
-            action = agent.act()
+            position = positions.get(name) if positions is not None else None
+            action = agent.act(position)
             actions[name] = action
         return actions
     
@@ -58,9 +108,27 @@ class AgentCollection:
     
     
 class BaseAgent:
-    def __init__(self, name):
+    def __init__(self, name, navigator=None, max_stalls=3):
+        """
+        Without a `navigator`, moves and searches are expanded blindly
+        (x steps, then y steps). With a `multigrid.utils.navigation.Navigator`,
+        they follow shortest routes around walls and closed doors.
+
+        When `act` is given the agent's observed position, the agent tracks
+        where it should be and re-anchors its remaining actions when it is
+        elsewhere. Re-anchoring is given up after `max_stalls` attempts from
+        the same position, and the queue is then executed as it is.
+        """
         self.name = name
+        self.navigator = navigator
+        self.max_stalls = max_stalls
         self.action_queue = []
+        # High-level actions in the queue, as [kind, args, actions left, actions total]
+        self.segments = []
+        # Position the agent should be at (known once positions are given to `act`)
+        self.expected = None
+        self._anchor = None
+        self._stalls = 0
 
     def tell(self, hla):
         """
@@ -79,16 +147,111 @@ class BaseAgent:
             self.search(*coords)
         elif "stop" in hla:
             self.stop()
+
+    def tell_action(self, action):
+        """
+        Process a structured high-level action (e.g. a `MoveAction`) for the agent.
+        """
+        kind = action.action
+        if kind == "move":
+            self.move(action.cur_x, action.cur_y, action.tar_x, action.tar_y)
+        elif kind == "search":
+            self.search(
+                action.cur_x, action.cur_y, action.x1, action.y1, action.x2, action.y2
+            )
+        elif kind == "stop":
+            self.stop()
         
-    def act(self):
+    def act(self, position=None):
         """
         Return the next action from the action queue.
         If the queue is empty, return no-op.
+        If the observed `position` of the agent is given, the remaining
+        actions are first re-anchored to it (see `reanchor`).
         """
-        if self.action_queue:
-            return self.action_queue.pop(0)
-        return ActionUpDown.done  # Default action if queue is empty
-    
+        if position is not None:
+            position = (int(position[0]), int(position[1]))
+            self.reanchor(position)
+        if not self.action_queue:
+            self.expected = position
+            return ActionUpDown.done  # Default action if queue is empty
+
+        action = self.action_queue.pop(0)
+        if self.segments:
+            self.segments[0][2] -= 1
+            if self.segments[0][2] <= 0:
+                self.segments.pop(0)
+        if position is not None:
+            self.expected = self._predict(position, action)
+        return action
+
+    def reanchor(self, position):
+        """
+        Re-expand the remaining actions if the agent is not where they start.
+
+        A move or a search that has not started yet is expanded again from
+        `position` (e.g. when its `cur_x, cur_y` were wrong). Otherwise the
+        agent drifted (e.g. it was blocked): moves are expanded again towards
+        their target, and other actions get a route back to the expected position.
+
+        A search told to start at (1, 1) while the agent is at (2, 3):
+
+        >>> agent = BaseAgent(0)
+        >>> agent.search(1, 1, 2, 1, 3, 2)
+        >>> [a.name for a in agent.action_queue]
+        ['right', 'right', 'down', 'left']
+        >>> agent.act((2, 3)).name, [a.name for a in agent.action_queue]
+        ('up', ['up', 'right', 'down', 'left'])
+
+        A move that is blocked once, and one that stays blocked (re-anchoring
+        is given up after `max_stalls` attempts, so the queue still runs out):
+
+        >>> agent = BaseAgent(0)
+        >>> agent.move(1, 1, 4, 1)
+        >>> [agent.act(p).name for p in [(1, 1), (1, 1), (2, 1), (3, 1), (4, 1)]]
+        ['right', 'right', 'right', 'right', 'done']
+        >>> agent = BaseAgent(0, max_stalls=2)
+        >>> agent.move(1, 1, 3, 1)
+        >>> [agent.act((1, 1)).name for _ in range(5)]
+        ['right', 'right', 'right', 'right', 'done']
+        """
+        if not self.action_queue:
+            return
+        if sum(segment[2] for segment in self.segments) != len(self.action_queue):
+            # The queue was changed directly, its structure is unknown
+            n = len(self.action_queue)
+            self.segments = [["path", None, n, n]]
+
+        kind, args, left, total = self.segments[0]
+        started = left < total or kind == "path"
+        start = self.expected if started else tuple(args[:2])
+        if start is None or start == position:
+            self._stalls = 0
+            return
+
+        self._stalls = self._stalls + 1 if position == self._anchor else 0
+        self._anchor = position
+        if self._stalls >= self.max_stalls:
+            # Give up, the remaining actions are executed as they are
+            self.expected = position
+            return
+
+        if kind == "move":
+            actions = self._expand_move(*position, *args[2:])
+            args = (*position, *args[2:])
+        elif kind == "search" and not started:
+            actions = self._expand_search(*position, *args[2:])
+            args = (*position, *args[2:])
+        else:
+            actions = self._expand_move(*position, *start) + self.action_queue[:left]
+            kind, args = "path", None
+
+        self.action_queue[:left] = actions
+        self.segments[0] = [kind, args, len(actions), len(actions)]
+        if not actions:
+            self.segments.pop(0)
+        self.expected = position
+
     def is_empty(self):
         """
         Check if the action queue is empty.
@@ -100,42 +263,90 @@ class BaseAgent:
         1) Move to (x1, y1).
         2) Search the area of rectangle defined by (x1, y1) and (x2, y2).
         """
-        self.move(cur_x, cur_y, x1, y1)
-        isRight = x1 < x2
-        isDown = (y1 < y2)*2 - 1  # 1 if down, -1 if up
-        w = abs(x2 - x1)
-        
-        for y in range(y1, y2 + 1*isDown, isDown):
-            if isRight:
-                self.action_queue += [ActionUpDown.right] * w
-            else:
-                self.action_queue += [ActionUpDown.left] * w
-            if y < y2:
-                self.action_queue.append(ActionUpDown.down)
-            elif y > y2:
-                self.action_queue.append(ActionUpDown.up)
-            isRight = not isRight  # Toggle direction for next row
+        self._push("search", (cur_x, cur_y, x1, y1, x2, y2),
+                   self._expand_search(cur_x, cur_y, x1, y1, x2, y2))
 
     def stop(self):
         """
         Stop the agent by clearing the action queue.
         """
         self.action_queue.clear()
+        self.segments.clear()
     
     def move(self, x1, y1, x2, y2):
         """
         Move the agent from one position to another.
         """
+        self._push("move", (x1, y1, x2, y2), self._expand_move(x1, y1, x2, y2))
+
+    def set_path(self, actions):
+        """
+        Replace the action queue with a path of primitive actions
+        (e.g. a schedule from `AgentCollection.compile`).
+        """
+        self.stop()
+        self._push("path", None, list(actions))
+
+    def _push(self, kind, args, actions):
+        if actions:
+            self.action_queue += actions
+            self.segments.append([kind, args, len(actions), len(actions)])
+
+    def _expand_search(self, cur_x, cur_y, x1, y1, x2, y2):
+        if self.navigator is not None:
+            actions, _ = self.navigator.sweep((cur_x, cur_y), x1, y1, x2, y2)
+            return [ACTIONS[a] for a in actions.tolist()]
+
+        actions = self._expand_move(cur_x, cur_y, x1, y1)
+        isRight = x1 < x2
+        isDown = (y1 < y2)*2 - 1  # 1 if down, -1 if up
+        w = abs(x2 - x1)
+        
+        for y in range(y1, y2 + 1*isDown, isDown):
+            if isRight:
+                actions += [ActionUpDown.right] * w
+            else:
+                actions += [ActionUpDown.left] * w
+            if y < y2:
+                actions.append(ActionUpDown.down)
+            elif y > y2:
+                actions.append(ActionUpDown.up)
+            isRight = not isRight  # Toggle direction for next row
+        return actions
+
+    def _expand_move(self, x1, y1, x2, y2):
+        if self.navigator is not None:
+            route = self.navigator.route((x1, y1), (x2, y2))
+            if route is not None:
+                return [ACTIONS[a] for a in route[0].tolist()]
+
+        actions = []
         # move along x axis
         if x1 < x2:
-            self.action_queue += [ActionUpDown.right] * (x2 - x1)
+            actions += [ActionUpDown.right] * (x2 - x1)
         elif x1 > x2:
-            self.action_queue += [ActionUpDown.left] * (x1 - x2)
+            actions += [ActionUpDown.left] * (x1 - x2)
         # move along y axis
         if y1 < y2:
-            self.action_queue += [ActionUpDown.down] * (y2 - y1)
+            actions += [ActionUpDown.down] * (y2 - y1)
         elif y1 > y2:
-            self.action_queue += [ActionUpDown.up] * (y1 - y2)
+            actions += [ActionUpDown.up] * (y1 - y2)
+        return actions
+
+    def _predict(self, position, action):
+        """
+        Position after taking the action (walls are only known with a navigator).
+        """
+        if action not in DELTAS:
+            return position
+        dx, dy = DELTAS[action]
+        x, y = position[0] + dx, position[1] + dy
+        if self.navigator is not None:
+            passable = self.navigator.passable
+            inside = 0 <= x < passable.shape[0] and 0 <= y < passable.shape[1]
+            if not inside or not passable[x, y]:
+                return position
+        return x, y
 
     def __str__(self):
         return f"BaseAgent(name={self.name})"
\ No newline at end of file
@@ -0,0 +1,439 @@
+"""
+Benchmarks for environment stepping, observation, rendering and planning overhead.
+
+Usage (from the repository root)::
+
+    python benchmarks/bench.py                          # run and print results
+    python benchmarks/bench.py --save-baseline base.json
+    python benchmarks/bench.py --compare base.json      # exit 1 on regression
+    python benchmarks/bench.py -k env_step --quick
+
+Each benchmark reports the best per-operation time over several repeats,
+which is the most stable statistic on a busy machine. Baselines are only
+comparable when recorded on the same machine.
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+from typing import Callable, Dict, List, Tuple
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.chdir(ROOT)  # Planners load their prompts relative to the working directory
+
+import multigrid.envs
+from agents import AgentCollection
+from multigrid.utils.navigation import Navigator
+from multigrid.utils.obs import (
+    gen_obs_grid_encoding,
+    gen_obs_grid_encoding_batch,
+    gen_obs_grid_encoding_batch_parallel,
+    gen_obs_grid_encoding_parallel,
+)
+from multigrid.vector import MultiGoalVectorEnv
+from multigrid.wrappers import OneHotObsWrapper
+from planner import SuperPlanner
+from planner.schemas.plan import Plan, SearchAction
+from planner.utils.events import EventDetector
+from planner.utils.fake_llm import FakePlanChatModel
+
+GRID_SIZES = (20, 50, 100, 500)
+AGENT_COUNTS = (1, 5, 20)
+
+# name -> (setup() -> operation, operations per call)
+Benchmark = Tuple[Callable[[], Callable[[], None]], int]
+BENCHMARKS: Dict[str, Benchmark] = {}
+
+
+def benchmark(name: str, ops: int = 1):
+    def register(setup):
+        BENCHMARKS[name] = (setup, ops)
+        return setup
+
+    return register
+
+
+def make_env(size: int, num_agents: int, render_mode=None, **kwargs):
+    env = multigrid.envs.EmptyEnvV2(
+        size=size,
+        agents=num_agents,
+        goals=[(size - 2, size - 2)],
+        mission_space="find the target",
+        render_mode=render_mode,
+        hidden_goals=True,
+        max_steps=10**9,
+        **kwargs,
+    )
+    observations, infos = env.reset(seed=0)
+    return env, observations, infos
+
+
+# Environment ##################################################################
+
+STEPS = 200
+
+for _size in GRID_SIZES:
+    for _num_agents in AGENT_COUNTS:
+
+        @benchmark(f"env_step[size={_size},agents={_num_agents}]", ops=STEPS)
+        def bench_env_step(size=_size, num_agents=_num_agents):
+            env, _, _ = make_env(size, num_agents)
+            rng = np.random.default_rng(0)
+            actions = rng.integers(0, 4, size=(STEPS, num_agents))
+
+            def run():
+                for row in actions:
+                    env.step(dict(enumerate(row.tolist())))
+
+            return run
+
+
+for _num_envs in (1, 8, 32):
+
+    @benchmark(f"vector_env_step[envs={_num_envs},size=50,agents=5]", ops=STEPS * _num_envs)
+    def bench_vector_env_step(num_envs=_num_envs):
+        env = MultiGoalVectorEnv([
+            lambda: multigrid.envs.EmptyEnvV2(
+                size=50,
+                agents=5,
+                goals=[(48, 48)],
+                mission_space="find the target",
+                agent_view_size=7,
+                max_steps=10**9,
+            )
+        ] * num_envs)
+        env.reset(seed=0)
+        rng = np.random.default_rng(0)
+        actions = rng.integers(0, 4, size=(STEPS, num_envs, 5))
+
+        def run():
+            for row in actions:
+                env.step(row)
+
+        return run
+
+
+for _compact in (False, True):
+    for _size in (100, 500):
+
+        @benchmark(f"env_step[size={_size},agents=20,compact={_compact}]", ops=STEPS)
+        def bench_env_step_compact(size=_size, compact=_compact):
+            env, _, _ = make_env(size, 20, agent_view_size=7, compact=compact)
+            rng = np.random.default_rng(0)
+            actions = rng.integers(0, 4, size=(STEPS, 20))
+
+            def run():
+                for row in actions:
+                    env.step(dict(enumerate(row.tolist())))
+
+            return run
+
+    @benchmark(f"one_hot[agents=20,view=7,compact={_compact}]", ops=20)
+    def bench_one_hot(compact=_compact):
+        env, observations, _ = make_env(100, 20, agent_view_size=7, compact=compact)
+        dim_sizes = OneHotObsWrapper(env).dim_sizes
+        images = [observations[i]["image"] for i in range(20)]
+
+        def run():
+            for image in images:
+                OneHotObsWrapper.one_hot(image, dim_sizes)
+
+        return run
+
+
+for _num_agents in AGENT_COUNTS:
+
+    @benchmark(f"gen_obs_grid_encoding[size=100,agents={_num_agents}]", ops=100)
+    def bench_gen_obs(num_agents=_num_agents):
+        env, _, _ = make_env(100, num_agents)
+        env = env.unwrapped
+        grid_state, agent_states = env.grid.state, env.agent_states
+        view_size = env.agents[0].view_size
+        see_through_walls = env.agents[0].see_through_walls
+
+        def run():
+            for _ in range(100):
+                gen_obs_grid_encoding(
+                    grid_state, agent_states, view_size, see_through_walls
+                )
+
+        return run
+
+
+for _kernel in (gen_obs_grid_encoding, gen_obs_grid_encoding_parallel):
+    for _num_agents in (8, 64, 256):
+        for _view_size in (7, 15):
+
+            @benchmark(
+                f"{_kernel.__name__}[agents={_num_agents},view={_view_size}]", ops=10
+            )
+            def bench_gen_obs_parallel(
+                kernel=_kernel, num_agents=_num_agents, view_size=_view_size
+            ):
+                env = multigrid.envs.EmptyEnvV2(
+                    size=100,
+                    agents=num_agents,
+                    agent_start_pos=None,
+                    agent_view_size=view_size,
+                    see_through_walls=False,
+                    mission_space="find the target",
+                )
+                env.reset(seed=0)
+                env = env.unwrapped
+                grid_state, agent_states = env.grid.state, env.agent_states._view
+
+                def run():
+                    for _ in range(10):
+                        kernel(grid_state, agent_states, view_size, False)
+
+                return run
+
+
+for _kernel in (gen_obs_grid_encoding_batch, gen_obs_grid_encoding_batch_parallel):
+
+    @benchmark(f"{_kernel.__name__}[B=16,size=100,agents=20]", ops=10)
+    def bench_gen_obs_batch(kernel=_kernel):
+        envs = [make_env(100, 20)[0].unwrapped for _ in range(16)]
+        grid_state = np.stack([env.grid.state for env in envs])
+        agent_states = np.stack([env.agent_states._view for env in envs])
+        occupancy = np.stack([env.agent_occupancy for env in envs])
+        view_size = envs[0].agents[0].view_size
+
+        def run():
+            for _ in range(10):
+                kernel(grid_state, agent_states, occupancy, view_size, False)
+
+        return run
+
+
+for _size in (20, 50, 100):
+
+    @benchmark(f"grid_render[size={_size},agents=5]")
+    def bench_render(size=_size):
+        env, _, _ = make_env(size, 5, render_mode="rgb_array")
+        env = env.unwrapped
+
+        def run():
+            env.grid.render(env.tile_size, agents=env.agents)
+
+        return run
+
+
+# Planning #####################################################################
+
+
+def search_plan(size: int, num_agents: int) -> Plan:
+    edges = np.linspace(1, size - 1, num_agents + 1).round().astype(int)
+    return Plan(
+        agents={
+            i: [
+                SearchAction(
+                    cur_x=1, cur_y=1, x1=int(a), y1=1, x2=int(b) - 1, y2=size - 2
+                )
+            ]
+            for i, (a, b) in enumerate(zip(edges[:-1], edges[1:]))
+        }
+    )
+
+
+for _size in (20, 100, 500):
+
+    @benchmark(f"agents_tell[size={_size},agents=5]")
+    def bench_tell(size=_size):
+        plan = search_plan(size, 5)
+        hlas = {i: actions[0].serialize() for i, actions in plan.agents.items()}
+
+        def run():
+            AgentCollection(num=5).tell(hlas)
+
+        return run
+
+
+    @benchmark(f"agents_tell_plan[size={_size},agents=5]")
+    def bench_tell_plan(size=_size):
+        plan = search_plan(size, 5)
+
+        def run():
+            AgentCollection(num=5).tell_plan(plan)
+
+        return run
+
+
+    @benchmark(f"agents_tell_plan_navigator[size={_size},agents=5]")
+    def bench_tell_plan_navigator(size=_size):
+        env, _, _ = make_env(size, 5)
+        navigator = Navigator(env.unwrapped.grid)
+        plan = search_plan(size, 5)
+
+        def run():
+            AgentCollection(num=5, navigator=navigator).tell_plan(plan)
+
+        return run
+
+
+@benchmark("agents_compile[size=20,agents=10]")
+def bench_compile():
+    env, observations, _ = make_env(20, 10, allow_agent_overlap=False)
+    navigator = Navigator(env.unwrapped.grid)
+    positions = {i: tuple(observations[i]["location"]) for i in range(10)}
+    plan = search_plan(20, 10)
+
+    def run():
+        agents = AgentCollection(num=10, navigator=navigator)
+        agents.tell_plan(plan)
+        agents.compile(positions)
+
+    return run
+
+
+@benchmark("agents_act[size=100,agents=5]", ops=1000)
+def bench_act():
+    hlas = {i: a[0].serialize() for i, a in search_plan(100, 5).agents.items()}
+
+    def run():
+        agents = AgentCollection(num=5)
+        agents.tell(hlas)
+        for _ in range(1000):
+            agents.act()
+
+    return run
+
+
+@benchmark("events_observe[agents=50]", ops=1000)
+def bench_events_observe():
+    rng = np.random.default_rng(0)
+    rewards = [-1] * 50
+    queue_lengths = rng.integers(1, 20, size=50).tolist()
+    positions = [rng.integers(1, 99, size=2) for _ in range(50)]
+
+    def run():
+        events = EventDetector(50)
+        for _ in range(1000):
+            events.observe(rewards, queue_lengths, positions)
+
+    return run
+
+
+def make_planner(size: int, num_agents: int):
+    env, observations, infos = make_env(size, num_agents)
+    llm = FakePlanChatModel()
+    planner = SuperPlanner(
+        llm=llm, grid_size=size, observations=observations, infos=infos
+    )
+    _, plan = planner.initial_plan()
+    agents = AgentCollection(num=num_agents)
+    agents.tell_plan(plan)
+    observations, rewards, terminations, truncations, infos = env.step(agents.act())
+    return planner, agents, (observations, rewards, terminations, truncations, infos)
+
+
+@benchmark("superplanner_replan_noop[size=100,agents=5]", ops=100)
+def bench_replan_noop():
+    planner, agents, outputs = make_planner(100, 5)
+    observations, rewards, terminations, truncations, infos = outputs
+
+    def run():
+        for _ in range(100):
+            # `replan` consumes the "global" entry of the observations
+            obs = dict(observations)
+            planner.replan(agents, obs, rewards, terminations, truncations, infos)
+
+    return run
+
+
+@benchmark("superplanner_replan_llm[size=100,agents=5]", ops=20)
+def bench_replan_llm():
+    planner, _, outputs = make_planner(100, 5)
+    observations, rewards, terminations, truncations, infos = outputs
+    idle_agents = AgentCollection(num=5)
+
+    def run():
+        for _ in range(20):
+            obs = dict(observations)
+            planner.replan(idle_agents, obs, rewards, terminations, truncations, infos)
+
+    return run
+
+
+# Runner #######################################################################
+
+
+def measure(setup, ops: int, repeat: int, min_time: float) -> Dict[str, float]:
+    run = setup()
+    run()  # Warm up (numba compilation, caches)
+    timings = []
+    for _ in range(repeat):
+        calls, start = 0, time.perf_counter()
+        while True:
+            run()
+            calls += 1
+            elapsed = time.perf_counter() - start
+            if elapsed >= min_time:
+                break
+        timings.append(elapsed / (calls * ops))
+    return {"best": min(timings), "median": float(np.median(timings))}
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("-k", default="", help="only run benchmarks containing this")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--min-time", type=float, default=0.2)
+    parser.add_argument("--quick", action="store_true", help="one short repeat")
+    parser.add_argument("--save-baseline", metavar="PATH")
+    parser.add_argument("--compare", metavar="PATH")
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.2,
+        help="relative slowdown reported as a regression (default: 0.2)",
+    )
+    args = parser.parse_args(argv)
+    if args.quick:
+        args.repeat, args.min_time = 1, 0.0
+
+    baseline = {}
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)["results"]
+
+    results, regressions = {}, []
+    for name, (setup, ops) in BENCHMARKS.items():
+        if args.k not in name:
+            continue
+        result = measure(setup, ops, args.repeat, args.min_time)
+        results[name] = result
+        line = f"{name:<50} {result['best'] * 1e6:>12.1f} us/op"
+        if name in baseline:
+            ratio = result["best"] / baseline[name]["best"]
+            line += f"  x{ratio:.2f} vs baseline"
+            if ratio > 1 + args.tolerance:
+                line += "  REGRESSION"
+                regressions.append(name)
+        print(line, flush=True)
+
+    if args.save_baseline:
+        with open(args.save_baseline, "w") as f:
+            json.dump(
+                {
+                    "machine": platform.platform(),
+                    "python": platform.python_version(),
+                    "results": results,
+                },
+                f,
+                indent=2,
+            )
+
+    if regressions:
+        print(f"{len(regressions)} regression(s): {', '.join(regressions)}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,27 +1,184 @@
+"""
+Registry of the chat models used by the planners.
+
+Clients are built on first use (``get_llm("local")``) and cached, so importing
+this module needs neither credentials nor langchain. All OpenAI-compatible
+clients share one pair of keep-alive httpx connection pools, behind a common
+`RateLimiter` (max in-flight requests, RPM/TPM token buckets and jittered
+retries on 429/5xx). The limits can be set with the `LLM_MAX_IN_FLIGHT`,
+`LLM_RPM`, `LLM_TPM` and `LLM_MAX_RETRIES` environment variables.
+
+The historical module attributes (``gpt_llm``, ``claude_llm``, ``local_llm``)
+still work and resolve through the registry.
+"""
 import os
+import threading
+from functools import lru_cache
+
+MAX_CONNECTIONS = 32
+TIMEOUT = 120.0
+
+_lock = threading.Lock()
+_http_clients = None
+_limiter = None
+
+
+def _env_number(name, default=None):
+    value = os.environ.get(name)
+    return float(value) if value else default
+
+
+def limiter():
+    """
+    Rate limiter shared by all LLM clients, created on first use.
+    """
+    global _limiter
+    with _lock:
+        if _limiter is None:
+            from planner.utils.llm_client import RateLimiter
+
+            _load_dotenv()
+            _limiter = RateLimiter(
+                max_in_flight=int(_env_number("LLM_MAX_IN_FLIGHT", 8)),
+                rpm=_env_number("LLM_RPM"),
+                tpm=_env_number("LLM_TPM"),
+                max_retries=int(_env_number("LLM_MAX_RETRIES", 5)),
+            )
+        return _limiter
+
+
+def client_stats():
+    """
+    Request, retry, queue wait and service time totals of all LLM clients.
+    """
+    return limiter().stats()
+
+
+def http_clients():
+    """
+    Shared (sync, async) httpx clients, created on first use.
+    """
+    global _http_clients
+    rate_limiter = limiter()
+    with _lock:
+        if _http_clients is None:
+            import httpx
+
+            from planner.utils.llm_client import (
+                AsyncRateLimitedTransport,
+                RateLimitedTransport,
+            )
+
+            limits = httpx.Limits(
+                max_connections=MAX_CONNECTIONS,
+                max_keepalive_connections=MAX_CONNECTIONS,
+            )
+            transport = RateLimitedTransport(
+                httpx.HTTPTransport(limits=limits), rate_limiter
+            )
+            async_transport = AsyncRateLimitedTransport(
+                httpx.AsyncHTTPTransport(limits=limits), rate_limiter
+            )
+            _http_clients = (
+                httpx.Client(transport=transport, timeout=TIMEOUT),
+                httpx.AsyncClient(transport=async_transport, timeout=TIMEOUT),
+            )
+        return _http_clients
+
+
+def _gpt():
+    from langchain_openai import AzureChatOpenAI
+    from pydantic import SecretStr
+
+    http_client, http_async_client = http_clients()
+    return AzureChatOpenAI(
+        api_key=SecretStr(os.environ["GPT_API_KEY"]),
+        azure_endpoint=os.environ["GPT_AZURE_ENDPOINT"],
+        api_version="2025-01-01-preview",
+        model="gpt-4o",
+        http_client=http_client,
+        http_async_client=http_async_client,
+        # Retries are done by the shared transport
+        max_retries=0,
+    )
+
+
+def _claude():
+    from langchain_openai import ChatOpenAI
+    from pydantic import SecretStr
+
+    http_client, http_async_client = http_clients()
+    return ChatOpenAI(
+        api_key=SecretStr(os.environ["CLAUDE_API_KEY"]),
+        base_url=os.environ["CLAUDE_BASE_URL"],
+        model="databricks-claude-3-7-sonnet",
+        http_client=http_client,
+        http_async_client=http_async_client,
+        # Retries are done by the shared transport
+        max_retries=0,
+    )
+
+
+def _local():
+    from langchain_openai import ChatOpenAI
+    from pydantic import SecretStr
+
+    http_client, http_async_client = http_clients()
+    return ChatOpenAI(
+        api_key=SecretStr(os.environ["LOCAL_API_KEY"]),
+        base_url=os.environ["LOCAL_BASE_URL"],
+        model="qwen3-next",
+        presence_penalty=1.5,
+        http_client=http_client,
+        http_async_client=http_async_client,
+        # Retries are done by the shared transport
+        max_retries=0,
+    )
+
+
+def _fake():
+    from planner.utils.fake_llm import FakePlanChatModel
+
+    return FakePlanChatModel()
+
+
+MODELS = {
+    "gpt": _gpt,
+    "claude": _claude,
+    "local": _local,
+    "fake": _fake,
+}
+
+# Backward compatible module attributes
+ALIASES = {
+    "gpt_llm": "gpt",
+    "claude_llm": "claude",
+    "local_llm": "local",
+}
+
+
+@lru_cache(maxsize=None)
+def get_llm(name: str):
+    """
+    Return the (cached) chat model registered under `name`.
+
+    Raises a `KeyError` naming the missing variable if the model's
+    credentials are not set in the environment or in `.env`.
+    """
+    if name not in MODELS:
+        raise ValueError(f"Unknown model {name!r}, expected one of {list(MODELS)}")
+    _load_dotenv()
+    return MODELS[name]()
+
+
+@lru_cache(maxsize=None)
+def _load_dotenv():
+    from dotenv import load_dotenv
+
+    load_dotenv()
+
 
-from dotenv import load_dotenv
-from langchain_openai import AzureChatOpenAI, ChatOpenAI
-from pydantic import SecretStr
-
-load_dotenv()
-
-gpt_llm = AzureChatOpenAI(
-    api_key=SecretStr(os.environ["GPT_API_KEY"]),
-    azure_endpoint=os.environ["GPT_AZURE_ENDPOINT"],
-    api_version="2025-01-01-preview",
-    model="gpt-4o",
-)
-
-claude_llm = ChatOpenAI(
-    api_key=SecretStr(os.environ["CLAUDE_API_KEY"]),
-    base_url=os.environ["CLAUDE_BASE_URL"],
-    model="databricks-claude-3-7-sonnet",
-)
-
-local_llm = ChatOpenAI(
-    api_key=SecretStr(os.environ["LOCAL_API_KEY"]),
-    base_url=os.environ["LOCAL_BASE_URL"],
-    model="qwen3-next",
-    presence_penalty=1.5,
-)
+def __getattr__(name):
+    if name in ALIASES:
+        return get_llm(ALIASES[name])
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
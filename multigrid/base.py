@@ -4,8 +4,6 @@ from __future__ import annotations
 import gymnasium as gym
 import math
 import numpy as np
-import pygame
-import pygame.freetype
 
 from abc import ABC, abstractmethod
 from collections import defaultdict
@@ -16,11 +14,11 @@ from typing import Any, Callable, Iterable, Literal, SupportsFloat
 
 from .core.actions import Action
 from .core.agent import Agent, AgentState
-from .core.constants import Type, TILE_PIXELS
+from .core.constants import COMPACT_AGENT_DTYPE, COMPACT_GRID_DTYPE, Type, TILE_PIXELS
 from .core.grid import Grid
 from .core.mission import MissionSpace
 from .core.world_object import WorldObj
-from .utils.obs import gen_obs_grid_encoding
+from .utils.obs import gen_obs_grid_encoding_auto, gen_obs_grid_encoding_batch_auto
 from .utils.random import RandomMixin
 
 
@@ -101,7 +99,8 @@ class MultiGridEnv(gym.Env, RandomMixin, ABC):
         screen_size: int | None = 640,
         highlight: bool = True,
         tile_size: int = TILE_PIXELS,
-        agent_pov: bool = False):
+        agent_pov: bool = False,
+        compact: bool = False):
         """
         Parameters
         ----------
@@ -139,6 +138,9 @@ class MultiGridEnv(gym.Env, RandomMixin, ABC):
             Whether to highlight the view of each agent when rendering
         tile_size : int
             Width and height of each grid tiles (in pixels)
+        compact : bool
+            Whether to use compact dtypes (uint8 grid encodings and observations,
+            int16 agent states) instead of the platform integer
         """
         gym.Env.__init__(self)
         RandomMixin.__init__(self, self.np_random)
@@ -153,12 +155,15 @@ class MultiGridEnv(gym.Env, RandomMixin, ABC):
         width, height = (grid_size, grid_size) if grid_size else (width, height)
         assert width is not None and height is not None
         self.width, self.height = width, height
-        self.grid: Grid = Grid(width, height)
+        self.compact = compact
+        self.grid_dtype = COMPACT_GRID_DTYPE if compact else np.int_
+        self.agent_dtype = COMPACT_AGENT_DTYPE if compact else np.int_
+        self.grid: Grid = Grid(width, height, dtype=self.grid_dtype)
 
         # Initialize agents
         if isinstance(agents, int):
             self.num_agents = agents
-            self.agent_states = AgentState(agents) # joint agent state (vectorized)
+            self.agent_states = AgentState(agents, dtype=self.agent_dtype) # joint agent state (vectorized)
             self.agents: list[Agent] = []
             for i in range(agents):
                 agent = Agent(
@@ -172,7 +177,7 @@ class MultiGridEnv(gym.Env, RandomMixin, ABC):
         elif isinstance(agents, Iterable):
             assert {agent.index for agent in agents} == set(range(len(agents)))
             self.num_agents = len(agents)
-            self.agent_states = AgentState(self.num_agents)
+            self.agent_states = AgentState(self.num_agents, dtype=self.agent_dtype)
             self.agents: list[Agent] = sorted(agents, key=lambda agent: agent.index)
             for agent in self.agents:
                 self.agent_states[agent.index] = agent.state # copy to joint agent state
@@ -180,6 +185,11 @@ class MultiGridEnv(gym.Env, RandomMixin, ABC):
         else:
             raise ValueError(f"Invalid argument for agents: {agents}")
 
+        # Observations use the grid / agent state dtypes
+        for agent in self.agents:
+            agent.observation_space['image'].dtype = np.dtype(self.grid_dtype)
+            agent.observation_space['location'].dtype = np.dtype(self.agent_dtype)
+
         # Action enumeration for this environment
         self.actions = Action
 
@@ -203,6 +213,7 @@ class MultiGridEnv(gym.Env, RandomMixin, ABC):
 
         # Other
         self.allow_agent_overlap = allow_agent_overlap
+        self.agent_occupancy = None # number of agents per cell, set on reset
         self.joint_reward = joint_reward
         self.success_termination_mode = success_termination_mode
         self.failure_termination_mode = failure_termination_mode
@@ -272,13 +283,17 @@ class MultiGridEnv(gym.Env, RandomMixin, ABC):
         # Reset agents
         self.mission_space.seed(seed)
         self.mission = self.mission_space.sample()
-        self.agent_states = AgentState(self.num_agents)
+        self.agent_states = AgentState(self.num_agents, dtype=self.agent_dtype)
         for agent in self.agents:
             agent.state = self.agent_states[agent.index]
             agent.reset(mission=self.mission)
 
         # Generate a new random grid at the start of each episode
+        # (agent positions are in flux, so the occupancy grid is not used)
+        self.agent_occupancy = None
         self._gen_grid(self.width, self.height)
+        self.grid.set_dtype(self.grid_dtype) # in case _gen_grid made a default grid
+        self.agent_occupancy = self.build_agent_occupancy()
 
         # These fields should be defined by _gen_grid
         assert np.all(self.agent_states.pos >= 0)
@@ -359,12 +374,22 @@ class MultiGridEnv(gym.Env, RandomMixin, ABC):
                 * 'mission': textual mission string (instructions for the agent)
         """
         direction = self.agent_states.dir
-        image = gen_obs_grid_encoding(
-            self.grid.state,
-            self.agent_states,
-            self.agents[0].view_size,
-            self.agents[0].see_through_walls,
-        )
+        if self.agent_occupancy is not None:
+            # Batch of one environment, stamping agents via the occupancy grid
+            image = gen_obs_grid_encoding_batch_auto(
+                self.grid.state[None],
+                self.agent_states._view[None],
+                self.agent_occupancy[None],
+                self.agents[0].view_size,
+                self.agents[0].see_through_walls,
+            )[0]
+        else:
+            image = gen_obs_grid_encoding_auto(
+                self.grid.state,
+                self.agent_states,
+                self.agents[0].view_size,
+                self.agents[0].see_through_walls,
+            )
 
         observations = {}
         for i in range(self.num_agents):
@@ -424,12 +449,11 @@ class MultiGridEnv(gym.Env, RandomMixin, ABC):
 
                 if fwd_obj is None or fwd_obj.can_overlap():
                     if not self.allow_agent_overlap:
-                        agent_present = np.bitwise_and.reduce(
-                            self.agent_states.pos == fwd_pos, axis=1).any()
+                        agent_present = self.agent_present(fwd_pos)
                         if agent_present:
                             continue
 
-                    agent.state.pos = fwd_pos
+                    self.set_agent_pos(agent, fwd_pos)
                     if fwd_obj is not None:
                         if fwd_obj.type == Type.goal:
                             self.on_success(agent, rewards, {})
@@ -452,8 +476,7 @@ class MultiGridEnv(gym.Env, RandomMixin, ABC):
                 fwd_obj = self.grid.get(*fwd_pos)
 
                 if agent.state.carrying and fwd_obj is None:
-                    agent_present = np.bitwise_and.reduce(
-                        self.agent_states.pos == fwd_pos, axis=1).any()
+                    agent_present = self.agent_present(fwd_pos)
                     if not agent_present:
                         self.grid.set(*fwd_pos, agent.state.carrying)
                         agent.state.carrying.cur_pos = fwd_pos
@@ -602,6 +625,37 @@ class MultiGridEnv(gym.Env, RandomMixin, ABC):
         """
         return 1 - 0.9 * (self.step_count / self.max_steps)
 
+    def agent_present(self, pos: tuple[int, int]) -> bool:
+        """
+        Return whether any agent is at the given position.
+
+        Uses the agent occupancy grid when it is valid (O(1)),
+        and compares against all agent positions otherwise.
+        """
+        if self.agent_occupancy is not None:
+            return self.agent_occupancy[pos[0], pos[1]] > 0
+        return np.bitwise_and.reduce(self.agent_states.pos == pos, axis=1).any()
+
+    def set_agent_pos(self, agent: Agent, pos: tuple[int, int]):
+        """
+        Move an agent to the given position, keeping the occupancy grid up to date.
+        """
+        if self.agent_occupancy is not None:
+            x, y = agent.state.pos
+            self.agent_occupancy[x, y] -= 1
+            self.agent_occupancy[pos[0], pos[1]] += 1
+        agent.state.pos = pos
+
+    def build_agent_occupancy(self) -> ndarray[np.int_]:
+        """
+        Count the agents at each grid cell.
+        """
+        occupancy = np.zeros((self.width, self.height), dtype=int)
+        pos = self.agent_states.pos.reshape(-1, 2)
+        pos = pos[(pos >= 0).all(axis=1)]
+        np.add.at(occupancy, (pos[:, 0], pos[:, 1]), 1)
+        return occupancy
+
     def place_obj(
         self,
         obj: WorldObj | None,
@@ -633,27 +687,20 @@ class MultiGridEnv(gym.Env, RandomMixin, ABC):
         if size is None:
             size = (self.grid.width, self.grid.height)
 
-        num_tries = 0
-
-        while True:
-            # This is to handle with rare cases where rejection sampling
-            # gets stuck in an infinite loop
-            if num_tries > max_tries:
-                raise RecursionError("rejection sampling failed in place_obj")
-
-            num_tries += 1
-
-            pos = (
-                self._rand_int(top[0], min(top[0] + size[0], self.grid.width)),
-                self._rand_int(top[1], min(top[1] + size[1], self.grid.height)),
-            )
-
-            # Don't place the object on top of another object
-            if self.grid.get(*pos) is not None:
-                continue
+        # Visit the empty cells of the area in random order until one is accepted,
+        # with a partial Fisher-Yates shuffle of their indices (swaps are kept
+        # in a dict, so each try is O(1) and the cell ids are never copied)
+        ids = self.grid.free_cell_ids(top, size)
+        num_cells = len(ids)
+        swapped = {}
+        for k in range(int(min(num_cells, max_tries))):
+            j = self._rand_int(k, num_cells)
+            index = swapped.get(j, j)
+            swapped[j] = swapped.get(k, k)
+            pos = divmod(int(ids[index]), self.grid.height)
 
             # Don't place the object where agents are
-            if np.bitwise_and.reduce(self.agent_states.pos == pos, axis=1).any():
+            if self.agent_present(pos):
                 continue
 
             # Check if there is a filtering criterion
@@ -661,6 +708,8 @@ class MultiGridEnv(gym.Env, RandomMixin, ABC):
                 continue
 
             break
+        else:
+            raise RecursionError("rejection sampling failed in place_obj")
 
         self.grid.set(pos[0], pos[1], obj)
 
@@ -752,6 +801,7 @@ class MultiGridEnv(gym.Env, RandomMixin, ABC):
             tile_size,
             agents=self.agents,
             highlight_mask=highlight_mask if highlight else None,
+            agent_occupancy=self.agent_occupancy,
         )
 
         return img
@@ -790,6 +840,10 @@ class MultiGridEnv(gym.Env, RandomMixin, ABC):
         img = self.get_frame(self.highlight, self.tile_size)
 
         if self.render_mode == 'human':
+            # Imported here so that pygame is only loaded for on-screen rendering
+            import pygame
+            import pygame.freetype
+
             img = np.transpose(img, axes=(1, 0, 2))
             screen_size = (
                 self.screen_size * min(img.shape[0] / img.shape[1], 1.0),
@@ -839,4 +893,5 @@ class MultiGridEnv(gym.Env, RandomMixin, ABC):
         Close the rendering window.
         """
         if self.window:
+            import pygame
             pygame.quit()
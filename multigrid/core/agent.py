@@ -239,14 +239,16 @@ class AgentState(np.ndarray):
     # State vector dimension
     dim = 6 + WorldObj.dim
 
-    def __new__(cls, *dims: int):
+    def __new__(cls, *dims: int, dtype: np.dtype = int):
         """
         Parameters
         ----------
         dims : int, optional
             Shape of vectorized agent state
+        dtype : np.dtype
+            Data type of the state vector (must be signed, e.g. ``np.int16``)
         """
-        obj = np.zeros(dims + (cls.dim,), dtype=int).view(cls)
+        obj = np.zeros(dims + (cls.dim,), dtype=dtype).view(cls)
 
         # Set default values
         obj[..., AgentState.TYPE] = Type.agent
@@ -10,6 +10,11 @@ from ..utils.enum import IndexedEnum
 #: Tile size for rendering grid cell
 TILE_PIXELS = 32
 
+#: Compact dtypes for grid encodings / observations and agent states
+#: (agent states hold -1 for unset positions and directions, so they are signed)
+COMPACT_GRID_DTYPE = np.uint8
+COMPACT_AGENT_DTYPE = np.int16
+
 COLORS = {
     'red': np.array([255, 0, 0]),
     'green': np.array([0, 255, 0]),
@@ -3,7 +3,6 @@ from __future__ import annotations
 
 import numpy as np
 
-from collections import defaultdict
 from functools import cached_property
 from numpy.typing import NDArray as ndarray
 from typing import Any, Callable, Iterable
@@ -35,12 +34,27 @@ class Grid:
         Dictionary of world objects in the grid, indexed by (x, y) location
     state : ndarray[int] of shape (width, height, WorldObj.dim)
         Grid state, where each (x, y) entry is a world object encoding
+    dtype : np.dtype
+        Data type of the grid state
+
+    version : int
+        Number of changes made to the grid so far
+
+    Notes
+    -----
+    An index of empty cells (used for random object placement) and a log of
+    changed cells (see :meth:`changed_cells`) are maintained by :meth:`set`
+    and :meth:`update`. Code that writes to :attr:`state` directly must call
+    :meth:`invalidate_free_cells` afterwards.
     """
 
+    # Maximum length of the changed cell log (beyond that, consumers start over)
+    max_change_log = 4096
+
     # Static cache of pre-renderer tiles
     _tile_cache = {}
 
-    def __init__(self, width: int, height: int):
+    def __init__(self, width: int, height: int, dtype: np.dtype = int):
         """
         Parameters
         ----------
@@ -48,13 +62,28 @@ class Grid:
             Width of the grid
         height : int
             Height of the grid
+        dtype : np.dtype
+            Data type of the grid state (e.g. ``np.uint8`` for a compact grid)
         """
         assert width >= 3
         assert height >= 3
         self.world_objects = {} # indexed by location
-        self.state = np.zeros((width, height, WorldObj.dim), dtype=int)
+        self.state = np.zeros((width, height, WorldObj.dim), dtype=dtype)
         self.state[...] = WorldObj.empty()
 
+        # Index of empty cells, with cell id x * height + y:
+        # the first `_num_free` entries of `_free_ids` are the empty cells,
+        # and `_free_slot[id]` is the position of a cell in `_free_ids` (or -1)
+        self._free_ids = None
+        self._free_slot = None
+        self._num_free = 0
+
+        # Log of changed cells, where `_changes[i]` is the change
+        # that brought the grid to version `_changes_start + i + 1`
+        self.version = 0
+        self._changes = []
+        self._changes_start = 0
+
     @cached_property
     def width(self) -> int:
         """
@@ -69,6 +98,25 @@ class Grid:
         """
         return self.state.shape[1]
 
+    @property
+    def dtype(self) -> np.dtype:
+        """
+        Data type of the grid state.
+        """
+        return self.state.dtype
+
+    def set_dtype(self, dtype: np.dtype):
+        """
+        Convert the grid state to the given data type (no-op if it already matches).
+
+        Parameters
+        ----------
+        dtype : np.dtype
+            Data type of the grid state
+        """
+        if self.state.dtype != dtype:
+            self.state = self.state.astype(dtype)
+
     @property
     def grid(self) -> list[WorldObj | None]:
         """
@@ -100,6 +148,9 @@ class Grid:
         else:
             raise TypeError(f"cannot set grid value to {type(obj)}")
 
+        self._update_free_cell(x, y)
+        self._log_change(x, y)
+
     def get(self, x: int, y: int) -> WorldObj | None:
         """
         Get the world object at the given coordinates.
@@ -130,6 +181,140 @@ class Grid:
         """
         if (x, y) in self.world_objects:
             self.state[x, y] = self.world_objects[x, y]
+            self._update_free_cell(x, y)
+            self._log_change(x, y)
+
+    def free_cells(
+        self,
+        top: tuple[int, int] = (0, 0),
+        size: tuple[int, int] | None = None) -> ndarray[np.int]:
+        """
+        Return the empty cells within a rectangular area.
+
+        Parameters
+        ----------
+        top : tuple[int, int]
+            Top-left position of the rectangular area
+        size : tuple[int, int] or None
+            Width and height of the rectangular area (whole grid if None)
+
+        Returns
+        -------
+        cells : ndarray[int] of shape (num_cells, 2)
+            (x, y) positions of empty cells, in no particular order
+        """
+        ids = self.free_cell_ids(top, size)
+        return np.stack(np.divmod(ids, self.height), axis=-1)
+
+    def free_cell_ids(
+        self,
+        top: tuple[int, int] = (0, 0),
+        size: tuple[int, int] | None = None) -> ndarray[np.int]:
+        """
+        Return the ids (``x * height + y``) of the empty cells within a rectangular area.
+
+        For the whole grid, this is a view into the empty cell index (no copy),
+        which is only valid until the grid is next modified. Otherwise only the
+        cells of the rectangular area are enumerated.
+
+        Parameters
+        ----------
+        top : tuple[int, int]
+            Top-left position of the rectangular area
+        size : tuple[int, int] or None
+            Width and height of the rectangular area (whole grid if None)
+
+        Returns
+        -------
+        ids : ndarray[int] of shape (num_cells,)
+            Ids of empty cells, in no particular order
+        """
+        x, y = max(top[0], 0), max(top[1], 0)
+        if size is None or (
+            x == 0 and y == 0 and size[0] >= self.width and size[1] >= self.height):
+            if self._free_ids is None:
+                self._build_free_cells()
+            return self._free_ids[:self._num_free]
+
+        w, h = size
+        area = self.state[x:x + w, y:y + h, WorldObj.TYPE]
+        dx, dy = np.nonzero(area == Type.empty.to_index())
+        return (dx + x) * self.height + (dy + y)
+
+    def invalidate_free_cells(self):
+        """
+        Mark the empty cell index as stale (e.g. after writing to ``state`` directly).
+
+        Since the changed cells are unknown, the changed cell log is cleared as well.
+        """
+        self._free_ids = None
+        self._free_slot = None
+        self.version += 1
+        self._changes.clear()
+        self._changes_start = self.version
+
+    def changed_cells(self, since: int) -> list[tuple[int, int]] | None:
+        """
+        Return the cells changed since the given grid version.
+
+        Parameters
+        ----------
+        since : int
+            Grid version (i.e. a previous value of :attr:`version`)
+
+        Returns
+        -------
+        cells : list[tuple[int, int]] or None
+            (x, y) positions of changed cells (possibly repeated), or None if
+            the changes are no longer known and the whole grid must be re-read
+        """
+        if since < self._changes_start:
+            return None
+        return self._changes[since - self._changes_start:]
+
+    def _log_change(self, x: int, y: int):
+        """
+        Record a change to the given cell.
+        """
+        self.version += 1
+        if len(self._changes) >= self.max_change_log:
+            self._changes.clear()
+            self._changes_start = self.version
+        else:
+            self._changes.append((x, y))
+
+    def _build_free_cells(self):
+        """
+        Build the empty cell index from the grid state.
+        """
+        empty = (self.state[..., WorldObj.TYPE] == Type.empty.to_index()).ravel()
+        ids = np.flatnonzero(empty)
+        self._free_ids = np.empty(empty.size, dtype=int)
+        self._free_ids[:len(ids)] = ids
+        self._free_slot = np.full(empty.size, -1, dtype=int)
+        self._free_slot[ids] = np.arange(len(ids))
+        self._num_free = len(ids)
+
+    def _update_free_cell(self, x: int, y: int):
+        """
+        Add or remove a cell from the empty cell index (swap-remove).
+        """
+        if self._free_ids is None:
+            return
+
+        cell = x * self.height + y
+        slot = self._free_slot[cell]
+        is_empty = self.state[x, y, WorldObj.TYPE] == Type.empty.to_index()
+        if is_empty and slot < 0:
+            self._free_ids[self._num_free] = cell
+            self._free_slot[cell] = self._num_free
+            self._num_free += 1
+        elif not is_empty and slot >= 0:
+            last = self._free_ids[self._num_free - 1]
+            self._free_ids[slot] = last
+            self._free_slot[last] = slot
+            self._free_slot[cell] = -1
+            self._num_free -= 1
 
     def horz_wall(
         self,
@@ -152,6 +337,7 @@ class Grid:
         """
         length = self.width - x if length is None else length
         self.state[x:x+length, y] = obj_type()
+        self.invalidate_free_cells()
 
     def vert_wall(
         self,
@@ -174,6 +360,7 @@ class Grid:
         """
         length = self.height - y if length is None else length
         self.state[x, y:y+length] = obj_type()
+        self.invalidate_free_cells()
 
     def wall_rect(self, x: int, y: int, w: int, h: int):
         """
@@ -261,7 +448,8 @@ class Grid:
         self,
         tile_size: int,
         agents: Iterable[Agent] = (),
-        highlight_mask = None):
+        highlight_mask = None,
+        agent_occupancy = None):
         """
         Render this grid at a given scale.
 
@@ -273,13 +461,16 @@ class Grid:
             Agents to render
         highlight_mask: ndarray
             Boolean mask indicating which grid locations to highlight
+        agent_occupancy: ndarray[int] of shape (width, height), optional
+            Number of agents at each grid location (to skip agent lookups
+            for empty cells)
         """
         if highlight_mask is None:
             highlight_mask = np.zeros(shape=(self.width, self.height), dtype=bool)
 
         # Get agent locations
         # For overlapping agents, non-terminated agents get priority
-        location_to_agent = defaultdict(type(None))
+        location_to_agent = {}
         for agent in sorted(agents, key=lambda a: not a.terminated):
             location_to_agent[tuple(agent.pos)] = agent
 
@@ -293,9 +484,13 @@ class Grid:
             for i in range(0, self.width):
                 assert highlight_mask is not None
                 cell = self.get(i, j)
+                if agent_occupancy is None or agent_occupancy[i, j]:
+                    agent = location_to_agent.get((i, j))
+                else:
+                    agent = None
                 tile_img = Grid.render_tile(
                     cell,
-                    agent=location_to_agent[i, j],
+                    agent=agent,
                     highlight=highlight_mask[i, j],
                     tile_size=tile_size,
                 )
@@ -321,7 +516,7 @@ class Grid:
             vis_mask = np.ones((self.width, self.height), dtype=bool)
 
         encoding = self.state.copy()
-        encoding[~vis_mask][..., WorldObj.TYPE] = Type.unseen.to_index()
+        encoding[~vis_mask, WorldObj.TYPE] = Type.unseen.to_index()
         return encoding
 
     @staticmethod
@@ -345,6 +540,7 @@ class Grid:
         assert dim == WorldObj.dim
 
         vis_mask = (array[..., WorldObj.TYPE] != Type.unseen.to_index())
-        grid = Grid(width, height)
+        grid = Grid(width, height, dtype=array.dtype)
         grid.state[vis_mask] = array[vis_mask]
+        grid.invalidate_free_cells()
         return grid, vis_mask
@@ -153,7 +153,7 @@ class EmptyEnv(MultiGridEnv):
         :meta private:
         """
         # Create an empty grid
-        self.grid = Grid(width, height)
+        self.grid = Grid(width, height, dtype=self.grid_dtype)
 
         # Generate the surrounding walls
         self.grid.wall_rect(0, 0, width, height)
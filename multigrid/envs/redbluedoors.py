@@ -143,7 +143,7 @@ class RedBlueDoorsEnv(MultiGridEnv):
         :meta private:
         """
         # Create an empty grid
-        self.grid = Grid(width, height)
+        self.grid = Grid(width, height, dtype=self.grid_dtype)
 
         # Generate the grid walls
         room_top = (width // 4, 0)
@@ -28,15 +28,29 @@ Wrap an environment class with :func:`.to_rllib_env()`:
     >>> MyEnv = to_rllib_env(EmptyEnv, default_config={'size': 8})
     >>> config = {'agents': 2, 'render_mode': 'human'}
     >>> env = MyEnv(config)
+
+Step a batch of ``MultiGoalGridEnv`` copies with :class:`.RLlibVectorEnv`
+(one joint controller per environment copy):
+
+    >>> from multigrid.envs import EmptyEnvV2
+    >>> from multigrid.rllib import to_rllib_vector_env
+    >>> MyVectorEnv = to_rllib_vector_env(EmptyEnvV2, num_envs=32)
+    >>> env = MyVectorEnv({'size': 20, 'agents': 4, 'goals': [(18, 18)]})
 """
 
 import gymnasium as gym
+import numpy as np
 
+from gymnasium import spaces
 from ray.rllib.env import MultiAgentEnv
+from ray.rllib.env.vector_env import VectorEnv
 from ray.tune.registry import register_env
 
 from ..base import MultiGridEnv
+from ..base_multigoal import MultiGoalGridEnv
+from ..core.actions import ActionUpDown
 from ..envs import CONFIGURATIONS
+from ..vector import MultiGoalVectorEnv
 from ..wrappers import OneHotObsWrapper
 
 
@@ -105,6 +119,111 @@ def to_rllib_env(
     return RLlibEnv
 
 
+class RLlibVectorEnv(VectorEnv):
+    """
+    RLlib ``VectorEnv`` over a :class:`.MultiGoalVectorEnv`.
+
+    Each environment copy is one sub-environment with a joint controller:
+    observations stack the agents (e.g. 'image' has shape
+    ``(num_agents, view_size, view_size, C)``), actions are ``MultiDiscrete``
+    over agents, and the reward is the environment's joint reward
+    (``info['cur_reward']``). Observations are returned as views into the
+    stacked arrays of the vectorized environment.
+    """
+
+    def __init__(self, vector_env: MultiGoalVectorEnv):
+        self.vector_env = vector_env
+        env = vector_env.envs[0]
+        num_agents = vector_env.num_agents
+
+        observations, _ = vector_env.reset()
+        image = observations['image'][0]
+        observation_space = spaces.Dict({
+            'image': spaces.Box(
+                low=0,
+                high=np.iinfo(image.dtype).max if image.dtype.kind in 'iu' else 255,
+                shape=image.shape,
+                dtype=image.dtype,
+            ),
+            'direction': spaces.Box(
+                low=0, high=3, shape=(num_agents,), dtype=env.agent_dtype),
+            'location': spaces.Box(
+                low=0,
+                high=max(env.width, env.height) - 1,
+                shape=(num_agents, 2),
+                dtype=env.agent_dtype,
+            ),
+        })
+        action_space = spaces.MultiDiscrete([len(ActionUpDown)] * num_agents)
+        super().__init__(observation_space, action_space, vector_env.num_envs)
+
+    def vector_reset(self, *, seeds=None, options=None):
+        observations, infos = self.vector_env.reset(seed=seeds)
+        return self._split(observations), [dict(info) for info in infos]
+
+    def reset_at(self, index=None, *, seed=None, options=None):
+        observations, info = self.vector_env.reset_at(index or 0, seed=seed)
+        return observations, dict(info)
+
+    def vector_step(self, actions):
+        observations, _, terminations, truncations, infos = self.vector_env.step(
+            np.asarray(actions, dtype=int))
+        return (
+            self._split(observations),
+            [float(info['cur_reward']) for info in infos],
+            terminations.all(axis=1).tolist(),
+            truncations.all(axis=1).tolist(),
+            [dict(info) for info in infos],
+        )
+
+    def get_sub_environments(self):
+        return self.vector_env.envs
+
+    def _split(self, observations: dict) -> list[dict]:
+        """
+        Split stacked observations into one observation per environment.
+        """
+        return [
+            {key: value[k] for key, value in observations.items()}
+            for k in range(self.num_envs)
+        ]
+
+
+def to_rllib_vector_env(
+    env_cls: type[MultiGoalGridEnv],
+    num_envs: int,
+    image_format: str = 'one_hot',
+    default_config: dict = {}) -> type[VectorEnv]:
+    """
+    Convert a ``MultiGoalGridEnv`` environment class to an RLlib ``VectorEnv`` class
+    that steps ``num_envs`` copies with batched kernels.
+
+    Parameters
+    ----------
+    env_cls : type[MultiGoalGridEnv]
+        ``MultiGoalGridEnv`` environment class
+    num_envs : int
+        Number of environment copies
+    image_format : 'index' or 'one_hot' or 'sparse'
+        Format of image observations (see :class:`.MultiGoalVectorEnv`)
+    default_config : dict
+        Default configuration for the environment
+
+    Returns
+    -------
+    rllib_env_cls : type[VectorEnv]
+        RLlib ``VectorEnv`` environment class
+    """
+    class RLlibEnv(RLlibVectorEnv):
+        def __init__(self, config: dict = {}):
+            config = {**default_config, **config}
+            super().__init__(MultiGoalVectorEnv(
+                [lambda: env_cls(**config)] * num_envs, image_format=image_format))
+
+    RLlibEnv.__name__ = f"RLlibVector_{env_cls.__name__}"
+    return RLlibEnv
+
+
 
 # Register environments with RLlib
 for name, (env_cls, config) in CONFIGURATIONS.items():
@@ -0,0 +1,580 @@
+from __future__ import annotations
+
+import numba as nb
+import numpy as np
+
+from collections import OrderedDict
+from numpy.typing import NDArray as ndarray
+from typing import TYPE_CHECKING
+
+from ..core.actions import ActionUpDown
+from ..core.constants import Type
+from ..core.world_object import WorldObj
+from .step import can_overlap
+
+if TYPE_CHECKING:
+    from ..core.grid import Grid
+
+
+
+### Constants
+
+TYPE = WorldObj.TYPE
+LAVA = int(Type.lava)
+
+LEFT = int(ActionUpDown.left)
+RIGHT = int(ActionUpDown.right)
+UP = int(ActionUpDown.up)
+DOWN = int(ActionUpDown.down)
+
+# (dx, dy) for each movement action, indexed by action
+ACTION_DX = np.array([-1, 1, 0, 0], dtype=np.int64)
+ACTION_DY = np.array([0, 0, -1, 1], dtype=np.int64)
+
+UNREACHABLE = -1
+
+# Placeholder for a distance field that is not known yet
+NO_FIELD = np.empty((0, 0), dtype=np.int32)
+
+
+
+### Navigator
+
+class Navigator:
+    """
+    Shortest routes between grid cells for agents moving left / right / up / down.
+
+    Routes follow BFS distance fields over the passable cells of the grid
+    (cells an agent can move into, except lava). Distance fields are cached
+    per target cell and only dropped when the passability of a cell changes
+    (e.g. a wall is placed or a door is opened), which is detected from the
+    grid's changed cell log (see :meth:`.Grid.changed_cells`).
+
+    Examples
+    --------
+    >>> from multigrid.envs import EmptyEnvV2
+    >>> env = EmptyEnvV2(size=8, agents=1)
+    >>> obs, infos = env.reset()
+    >>> grid = env.unwrapped.grid
+    >>> navigator = Navigator(grid)
+    >>> actions, end = navigator.route((1, 1), (5, 3))
+    >>> actions.tolist(), end
+    ([1, 1, 1, 1, 3, 3], (5, 3))
+
+    Routes go around walls, and follow changes to the grid:
+
+    >>> grid.vert_wall(3, 1, length=5)
+    >>> actions, end = navigator.route((1, 1), (5, 1))
+    >>> actions.tolist(), end
+    ([1, 3, 3, 3, 3, 3, 1, 1, 1, 2, 2, 2, 2, 2], (5, 1))
+    >>> grid.vert_wall(3, 6, length=1)
+    >>> navigator.route((1, 1), (5, 1)) is None
+    True
+
+    Attributes
+    ----------
+    grid : Grid
+        Grid to navigate (may be replaced, e.g. after an environment reset)
+    max_fields : int
+        Maximum number of cached distance fields
+    """
+
+    def __init__(self, grid: Grid, max_fields: int = 64):
+        """
+        Parameters
+        ----------
+        grid : Grid
+            Grid to navigate
+        max_fields : int
+            Maximum number of cached distance fields
+        """
+        self.grid = grid
+        self.max_fields = max_fields
+        self._fields: OrderedDict[tuple[int, int], ndarray[np.int32]] = OrderedDict()
+        self._passable = None
+        self._seen_grid = None
+        self._seen_version = None
+
+    @property
+    def passable(self) -> ndarray[np.bool_]:
+        """
+        Passability mask of shape (width, height), up to date with the grid.
+        """
+        self.refresh()
+        return self._passable
+
+    def refresh(self) -> bool:
+        """
+        Bring the passability mask up to date with the grid.
+
+        Returns
+        -------
+        changed : bool
+            Whether the passability changed (and cached distance fields were dropped)
+        """
+        grid = self.grid
+        if grid is self._seen_grid and grid.version == self._seen_version:
+            return False
+
+        changed = False
+        cells = None
+        if grid is self._seen_grid:
+            cells = grid.changed_cells(self._seen_version)
+
+        if cells is None:
+            passable = passable_mask(grid.state)
+            changed = self._passable is None or not np.array_equal(passable, self._passable)
+            self._passable = passable
+        else:
+            for x, y in set(cells):
+                value = is_passable(grid.state[x, y])
+                if value != self._passable[x, y]:
+                    self._passable[x, y] = value
+                    changed = True
+
+        if changed:
+            self._fields.clear()
+        self._seen_grid, self._seen_version = grid, grid.version
+        return changed
+
+    def distance_field(self, target: tuple[int, int]) -> ndarray[np.int32]:
+        """
+        Get the BFS distance from every cell to the target cell.
+
+        Parameters
+        ----------
+        target : tuple[int, int]
+            Target (x, y) position
+
+        Returns
+        -------
+        dist : ndarray[int32] of shape (width, height)
+            Number of steps to the target (-1 for unreachable cells).
+            The array is cached and must not be modified.
+        """
+        self.refresh()
+        target = (int(target[0]), int(target[1]))
+        dist = self._fields.get(target)
+        if dist is None:
+            dist = bfs_distances(self._passable, target[0], target[1])
+            self._fields[target] = dist
+            if len(self._fields) > self.max_fields:
+                self._fields.popitem(last=False)
+        else:
+            self._fields.move_to_end(target)
+        return dist
+
+    def route(
+        self,
+        start: tuple[int, int],
+        target: tuple[int, int],
+    ) -> tuple[ndarray[np.int8], tuple[int, int]] | None:
+        """
+        Get the movement actions along a shortest route between two cells.
+
+        If the target cell is not passable, the route ends next to it.
+        Where several routes are shortest, moves along the x-axis come first,
+        so in open space the route is the same as an x-then-y move.
+
+        Parameters
+        ----------
+        start : tuple[int, int]
+            Start (x, y) position
+        target : tuple[int, int]
+            Target (x, y) position
+
+        Returns
+        -------
+        route : tuple[ndarray[int8], tuple[int, int]] or None
+            Movement actions and end position, or None if the target
+            is outside the grid or unreachable from the start
+        """
+        passable = self.passable
+        width, height = passable.shape
+        sx, sy = int(start[0]), int(start[1])
+        tx, ty = int(target[0]), int(target[1])
+        if not (0 <= sx < width and 0 <= sy < height):
+            return None
+        if not (0 <= tx < width and 0 <= ty < height):
+            return None
+
+        # Fast path: the x-then-y move is clear
+        if passable[tx, ty]:
+            actions = np.empty(abs(tx - sx) + abs(ty - sy), dtype=np.int8)
+            if straight_path(passable, sx, sy, tx, ty, actions):
+                return actions, (tx, ty)
+
+        dist = self.distance_field((tx, ty))
+        if dist[sx, sy] == UNREACHABLE:
+            return None
+
+        actions = np.empty(dist[sx, sy], dtype=np.int8)
+        descend(dist, sx, sy, tx, ty, actions)
+        if len(actions) > 0 and not passable[tx, ty]:
+            # Stop in front of the target
+            last = actions[-1]
+            actions = actions[:-1]
+            tx, ty = tx - int(ACTION_DX[last]), ty - int(ACTION_DY[last])
+        return actions, (tx, ty)
+
+    def sweep(
+        self,
+        start: tuple[int, int],
+        x1: int,
+        y1: int,
+        x2: int,
+        y2: int,
+    ) -> tuple[ndarray[np.int8], tuple[int, int]]:
+        """
+        Get the movement actions of a serpentine sweep over a rectangle.
+
+        Rows are visited from ``y1`` to ``y2``, the first one from ``x1`` towards
+        ``x2`` and each next one in the opposite direction. Within a row, each
+        run of passable cells is walked end to end, and consecutive runs are
+        connected by shortest routes. Unreachable runs are skipped.
+        Runs are walked by :func:`walk_runs`, and connections that are not a
+        clear x-then-y move follow the cached distance field of the run start
+        (see :meth:`distance_field`).
+
+        Parameters
+        ----------
+        start : tuple[int, int]
+            Start (x, y) position
+        x1, y1 : int
+            Corner of the rectangle where the sweep starts
+        x2, y2 : int
+            Opposite corner of the rectangle
+
+        Returns
+        -------
+        actions : ndarray[int8]
+            Movement actions
+        end : tuple[int, int]
+            End position
+        """
+        passable = self.passable
+        width = passable.shape[0]
+        x_lo, x_hi = max(min(x1, x2), 0), min(max(x1, x2), width - 1)
+        runs = sweep_runs(passable, x_lo, x_hi, int(y1), int(y2), x1 <= x2)
+        buffer = np.empty(max(64, (x_hi - x_lo + 2) * (abs(y2 - y1) + 1)), dtype=np.int8)
+        n, x, y, k = 0, int(start[0]), int(start[1]), 0
+        dist = NO_FIELD
+
+        # Connections that are not a clear x-then-y move follow the cached
+        # distance field of the run start
+        while True:
+            buffer, n, x, y, k = walk_runs(passable, runs, k, buffer, n, x, y, dist)
+            if k == len(runs):
+                break
+            dist = self.distance_field((int(runs[k, 1]), int(runs[k, 0])))
+
+        return buffer[:n].copy(), (x, y)
+
+
+
+### Kernels
+
+@nb.njit(cache=True)
+def is_passable(world_obj: ndarray[np.int_]) -> bool:
+    """
+    Can an agent safely move onto this world object?
+
+    Parameters
+    ----------
+    world_obj : ndarray[int] of shape (encode_dim,)
+        World object encoding
+    """
+    return can_overlap(world_obj) and world_obj[TYPE] != LAVA
+
+@nb.njit(cache=True)
+def passable_mask(grid_state: ndarray[np.int_]) -> ndarray[np.bool_]:
+    """
+    Get the passability mask of a grid.
+
+    Parameters
+    ----------
+    grid_state : ndarray[int] of shape (width, height, grid_state_dim)
+        Array representation for each grid object
+
+    Returns
+    -------
+    passable : ndarray[bool] of shape (width, height)
+        Whether each cell is passable
+    """
+    width, height = grid_state.shape[0], grid_state.shape[1]
+    passable = np.empty((width, height), dtype=np.bool_)
+    for x in range(width):
+        for y in range(height):
+            passable[x, y] = is_passable(grid_state[x, y])
+
+    return passable
+
+@nb.njit(cache=True)
+def bfs_distances(passable: ndarray[np.bool_], tx: int, ty: int) -> ndarray[np.int32]:
+    """
+    Get the BFS distance from every cell to a target cell.
+
+    The target itself is always a source, even if it is not passable.
+
+    Parameters
+    ----------
+    passable : ndarray[bool] of shape (width, height)
+        Whether each cell is passable
+    tx, ty : int
+        Target position
+
+    Returns
+    -------
+    dist : ndarray[int32] of shape (width, height)
+        Number of steps to the target (-1 for unreachable cells)
+    """
+    width, height = passable.shape
+    dist = np.full((width, height), UNREACHABLE, dtype=np.int32)
+    queue = np.empty(width * height, dtype=np.int64)
+    dist[tx, ty] = 0
+    queue[0] = tx * height + ty
+    head, tail = 0, 1
+    while head < tail:
+        cell = queue[head]
+        head += 1
+        x, y = cell // height, cell % height
+        for a in range(4):
+            nx, ny = x + ACTION_DX[a], y + ACTION_DY[a]
+            if 0 <= nx < width and 0 <= ny < height:
+                if passable[nx, ny] and dist[nx, ny] == UNREACHABLE:
+                    dist[nx, ny] = dist[x, y] + 1
+                    queue[tail] = nx * height + ny
+                    tail += 1
+
+    return dist
+
+@nb.njit(cache=True)
+def descend(
+    dist: ndarray[np.int32],
+    sx: int,
+    sy: int,
+    tx: int,
+    ty: int,
+    out: ndarray[np.int8]):
+    """
+    Follow decreasing distances from a start cell to the target of a distance field.
+
+    Parameters
+    ----------
+    dist : ndarray[int32] of shape (width, height)
+        Distance field of the target (see :func:`bfs_distances`)
+    sx, sy : int
+        Start position (must be reachable)
+    tx, ty : int
+        Target position, used to prefer moves along the x-axis towards it
+    out : ndarray[int8] of shape (dist[sx, sy],)
+        Output movement actions
+    """
+    width, height = dist.shape
+    x, y = sx, sy
+    order = np.empty(4, dtype=np.int64)
+    for n in range(dist[sx, sy]):
+        order[0] = RIGHT if tx > x else LEFT
+        order[1] = DOWN if ty > y else UP
+        order[2] = LEFT if order[0] == RIGHT else RIGHT
+        order[3] = UP if order[1] == DOWN else DOWN
+        d = dist[x, y]
+        for k in range(4):
+            a = order[k]
+            nx, ny = x + ACTION_DX[a], y + ACTION_DY[a]
+            if 0 <= nx < width and 0 <= ny < height and dist[nx, ny] == d - 1:
+                break
+        out[n] = a
+        x, y = nx, ny
+
+@nb.njit(cache=True)
+def straight_path(
+    passable: ndarray[np.bool_],
+    sx: int,
+    sy: int,
+    tx: int,
+    ty: int,
+    out: ndarray[np.int8]) -> bool:
+    """
+    Write the actions of an x-then-y move if all cells along it are passable.
+
+    Parameters
+    ----------
+    passable : ndarray[bool] of shape (width, height)
+        Whether each cell is passable
+    sx, sy : int
+        Start position
+    tx, ty : int
+        Target position
+    out : ndarray[int8] of shape (|tx - sx| + |ty - sy|,)
+        Output movement actions
+
+    Returns
+    -------
+    clear : bool
+        Whether the move is clear (otherwise ``out`` is partially written)
+    """
+    x, y, n = sx, sy, 0
+    a = RIGHT if tx > sx else LEFT
+    while x != tx:
+        x += ACTION_DX[a]
+        if not passable[x, y]:
+            return False
+        out[n] = a
+        n += 1
+
+    a = DOWN if ty > sy else UP
+    while y != ty:
+        y += ACTION_DY[a]
+        if not passable[x, y]:
+            return False
+        out[n] = a
+        n += 1
+
+    return True
+
+@nb.njit(cache=True)
+def reserve(buffer: ndarray[np.int8], n: int, length: int) -> ndarray[np.int8]:
+    """
+    Make room for ``length`` more actions after the first ``n`` in a buffer.
+
+    Parameters
+    ----------
+    buffer : ndarray[int8]
+        Action buffer
+    n : int
+        Number of actions in the buffer
+    length : int
+        Number of actions to append
+
+    Returns
+    -------
+    buffer : ndarray[int8]
+        The same buffer, or a larger copy of it when full
+    """
+    if n + length <= len(buffer):
+        return buffer
+    grown = np.empty(max(2 * len(buffer), n + length), dtype=np.int8)
+    grown[:n] = buffer[:n]
+    return grown
+
+@nb.njit(cache=True)
+def sweep_runs(
+    passable: ndarray[np.bool_],
+    x_lo: int,
+    x_hi: int,
+    y1: int,
+    y2: int,
+    rightward: bool) -> ndarray[np.int64]:
+    """
+    Get the runs of passable cells of a serpentine sweep, in sweep order.
+
+    Parameters
+    ----------
+    passable : ndarray[bool] of shape (width, height)
+        Whether each cell is passable
+    x_lo, x_hi : int
+        Column range of the sweep (inclusive, within the grid)
+    y1, y2 : int
+        First and last row of the sweep
+    rightward : bool
+        Whether the first row is swept from left to right
+
+    Returns
+    -------
+    runs : ndarray[int] of shape (num_runs, 3)
+        Row, first column and last column of each run (in walking order)
+    """
+    height = passable.shape[1]
+    y_step = 1 if y2 >= y1 else -1
+    runs = np.empty(((x_hi - x_lo + 2) // 2 * (abs(y2 - y1) + 1), 3), dtype=np.int64)
+    k = 0
+
+    for row in range(y1, y2 + y_step, y_step):
+        if 0 <= row < height:
+            x_step = 1 if rightward else -1
+            first = x_lo if rightward else x_hi
+            last = x_hi if rightward else x_lo
+            run_start = -1
+            for col in range(first, last + x_step, x_step):
+                if passable[col, row]:
+                    if run_start < 0:
+                        run_start = col
+                    if col == last or not passable[col + x_step, row]:
+                        runs[k, 0], runs[k, 1], runs[k, 2] = row, run_start, col
+                        k += 1
+                        run_start = -1
+        rightward = not rightward
+
+    return runs[:k]
+
+@nb.njit(cache=True)
+def walk_runs(
+    passable: ndarray[np.bool_],
+    runs: ndarray[np.int64],
+    k: int,
+    buffer: ndarray[np.int8],
+    n: int,
+    x: int,
+    y: int,
+    dist: ndarray[np.int32]) -> tuple[ndarray[np.int8], int, int, int, int]:
+    """
+    Walk the runs of a sweep (see :func:`sweep_runs`), starting from run ``k``.
+
+    Each run is reached with an x-then-y move and walked end to end.
+    If the move to run ``k`` is blocked, it follows ``dist`` instead
+    (or skips the run if unreachable). The walk stops at the next run
+    whose move is blocked, so the caller can get its distance field.
+
+    Parameters
+    ----------
+    passable : ndarray[bool] of shape (width, height)
+        Whether each cell is passable
+    runs : ndarray[int] of shape (num_runs, 3)
+        Row, first column and last column of each run
+    k : int
+        Index of the first run to walk
+    buffer : ndarray[int8]
+        Action buffer (reallocated when full)
+    n : int
+        Number of actions in the buffer
+    x, y : int
+        Current position
+    dist : ndarray[int32] of shape (width, height) or (0, 0)
+        Distance field of the start of run ``k`` (see :func:`bfs_distances`),
+        or an empty array if not known yet
+
+    Returns
+    -------
+    buffer : ndarray[int8]
+        Action buffer
+    n : int
+        Number of actions in the buffer
+    x, y : int
+        New position
+    k : int
+        Index of the blocked run (``len(runs)`` when all runs were walked)
+    """
+    while k < len(runs):
+        row, run_start, run_end = runs[k, 0], runs[k, 1], runs[k, 2]
+        length = abs(run_start - x) + abs(row - y)
+        buffer = reserve(buffer, n, length + abs(run_end - run_start))
+        if not straight_path(passable, x, y, run_start, row, buffer[n:n + length]):
+            if dist.shape[0] == 0:
+                break
+            # Follow the distance field, which only applies to this run
+            length = dist[x, y]
+            if length == UNREACHABLE:
+                dist = dist[:0, :0]
+                k += 1
+                continue
+            buffer = reserve(buffer, n, length + abs(run_end - run_start))
+            descend(dist, x, y, run_start, row, buffer[n:n + length])
+        dist = dist[:0, :0]
+        n += length
+        length = abs(run_end - run_start)
+        buffer[n:n + length] = RIGHT if run_end >= run_start else LEFT
+        n, x, y = n + length, run_end, row
+        k += 1
+
+    return buffer, n, x, y, k
@@ -43,6 +43,9 @@ DOWN = int(Direction.down)
 
 ### Observation Functions
 
+# Observation encodings are allocated with the dtype of the grid state, so the
+# kernels are compiled separately for default (int) and compact (uint8) grids.
+
 @nb.njit(cache=True)
 def see_behind(world_obj: ndarray[np.int_]) -> bool:
     """
@@ -161,7 +164,8 @@ def gen_obs_grid(
 
     # Get grid encoding
     if num_agents > 1:
-        grid_encoding = np.empty((*grid_state.shape[:-1], ENCODE_DIM), dtype=np.int_)
+        grid_encoding = np.empty(
+            (*grid_state.shape[:-1], ENCODE_DIM), dtype=grid_state.dtype)
         grid_encoding[...] = grid_state[..., GRID_ENCODING_IDX]
 
         # Insert agent grid encodings
@@ -178,7 +182,8 @@ def gen_obs_grid(
 
     # Populate observation grids
     num_left_rotations = (agent_dir + 1) % 4
-    obs_grid = np.empty((num_agents, obs_width, obs_height, ENCODE_DIM), dtype=np.int_)
+    obs_grid = np.empty(
+        (num_agents, obs_width, obs_height, ENCODE_DIM), dtype=grid_state.dtype)
     for agent in range(num_agents):
         for i in range(0, obs_width):
             for j in range(0, obs_height):
@@ -314,3 +319,339 @@ def get_view_exts(
     top_left[agent_dir == UP, 1] = agent_y[agent_dir == UP] - agent_view_size + 1
 
     return top_left
+
+
+
+### Batched Observation Functions
+
+@nb.njit(cache=True)
+def get_view_top_left(
+    agent_dir: int,
+    agent_x: int,
+    agent_y: int,
+    agent_view_size: int) -> tuple[int, int]:
+    """
+    Get the top-left corner of the square set of grid cells visible to an agent
+    (single-agent version of :func:`get_view_exts`).
+    """
+    if agent_dir == RIGHT:
+        return agent_x, agent_y - agent_view_size // 2
+    elif agent_dir == DOWN:
+        return agent_x - agent_view_size // 2, agent_y
+    elif agent_dir == LEFT:
+        return agent_x - agent_view_size + 1, agent_y - agent_view_size // 2
+    elif agent_dir == UP:
+        return agent_x - agent_view_size // 2, agent_y - agent_view_size + 1
+    return 0, 0
+
+@nb.njit(cache=True)
+def fill_obs_grid(
+    grid_state: ndarray[np.int_],
+    agent_state: ndarray[np.int_],
+    agent_occupancy: ndarray[np.int_],
+    agent: int,
+    agent_view_size: int,
+    obs_grid: ndarray[np.int_]):
+    """
+    Fill the sub-grid observed by one agent (WITHOUT visibility mask).
+
+    Other agents are stamped into the view by checking the occupancy grid
+    of each visible cell, so the world grid is never copied.
+
+    Parameters
+    ----------
+    grid_state : ndarray[int] of shape (width, height, grid_state_dim)
+        Array representation for each grid object
+    agent_state : ndarray[int] of shape (num_agents, agent_state_dim)
+        Array representation for each agent
+    agent_occupancy : ndarray[int] of shape (width, height)
+        Number of agents at each grid cell
+    agent : int
+        Index of the observing agent
+    agent_view_size : int
+        Width and height of observation sub-grids
+    obs_grid : ndarray[int] of shape (view_size, view_size, encode_dim)
+        Output observation sub-grid
+    """
+    num_agents = agent_state.shape[0]
+    width, height = grid_state.shape[0], grid_state.shape[1]
+    obs_width, obs_height = agent_view_size, agent_view_size
+
+    agent_dir = agent_state[agent, AGENT_DIR_IDX]
+    agent_x = agent_state[agent, AGENT_POS_IDX][0]
+    agent_y = agent_state[agent, AGENT_POS_IDX][1]
+    topX, topY = get_view_top_left(agent_dir, agent_x, agent_y, agent_view_size)
+    num_left_rotations = (agent_dir + 1) % 4
+
+    for i in range(0, obs_width):
+        for j in range(0, obs_height):
+            # Absolute coordinates in world grid
+            x, y = topX + i, topY + j
+
+            # Rotated relative coordinates for observation grid
+            if num_left_rotations == 0:
+                i_rot, j_rot = i, j
+            elif num_left_rotations == 1:
+                i_rot, j_rot = j, obs_width - i - 1
+            elif num_left_rotations == 2:
+                i_rot, j_rot = obs_width - i - 1, obs_height - j - 1
+            else:
+                i_rot, j_rot = obs_height - j - 1, i
+
+            if not (0 <= x < width and 0 <= y < height):
+                obs_grid[i_rot, j_rot] = WALL_ENCODING
+                continue
+
+            obs_grid[i_rot, j_rot] = grid_state[x, y, GRID_ENCODING_IDX]
+
+            # Stamp the (highest index, non-terminated) agent in this cell
+            if num_agents > 1 and agent_occupancy[x, y] > 0:
+                for other in range(num_agents - 1, -1, -1):
+                    if agent_state[other, AGENT_TERMINATED_IDX]:
+                        continue
+                    pos = agent_state[other, AGENT_POS_IDX]
+                    if pos[0] == x and pos[1] == y:
+                        obs_grid[i_rot, j_rot] = agent_state[other, AGENT_ENCODING_IDX]
+                        break
+
+    # The agent sees what it's carrying at its own position
+    obs_grid[obs_width // 2, obs_height - 1] = agent_state[agent, AGENT_CARRYING_IDX]
+
+@nb.njit(cache=True)
+def gen_obs_grid_encoding_batch(
+    grid_state: ndarray[np.int_],
+    agent_state: ndarray[np.int_],
+    agent_occupancy: ndarray[np.int_],
+    agent_view_size: int,
+    see_through_walls: bool) -> ndarray[np.int_]:
+    """
+    Batched version of :func:`gen_obs_grid_encoding` over B environments.
+
+    Per step, this costs O(B * N * V^2) regardless of the grid size.
+
+    Parameters
+    ----------
+    grid_state : ndarray[int] of shape (B, width, height, grid_state_dim)
+        Array representation for each grid object
+    agent_state : ndarray[int] of shape (B, num_agents, agent_state_dim)
+        Array representation for each agent
+    agent_occupancy : ndarray[int] of shape (B, width, height)
+        Number of agents at each grid cell
+    agent_view_size : int
+        Width and height of observation sub-grids
+    see_through_walls : bool
+        Whether the agent can see through walls
+
+    Returns
+    -------
+    img : ndarray[int] of shape (B, num_agents, view_size, view_size, encode_dim)
+        Encoding of observed sub-grid for each agent
+    """
+    batch_size, num_agents = agent_state.shape[0], agent_state.shape[1]
+    obs_grid = np.empty(
+        (batch_size, num_agents, agent_view_size, agent_view_size, ENCODE_DIM),
+        dtype=grid_state.dtype,
+    )
+    for b in range(batch_size):
+        for agent in range(num_agents):
+            fill_obs_grid(
+                grid_state[b], agent_state[b], agent_occupancy[b],
+                agent, agent_view_size, obs_grid[b, agent])
+            if not see_through_walls:
+                apply_vis_mask(obs_grid[b, agent:agent+1])
+
+    return obs_grid
+
+@nb.njit(cache=True, parallel=True)
+def gen_obs_grid_encoding_batch_parallel(
+    grid_state: ndarray[np.int_],
+    agent_state: ndarray[np.int_],
+    agent_occupancy: ndarray[np.int_],
+    agent_view_size: int,
+    see_through_walls: bool) -> ndarray[np.int_]:
+    """
+    Parallel version of :func:`gen_obs_grid_encoding_batch`
+    (environments and agents are processed in parallel).
+    """
+    batch_size, num_agents = agent_state.shape[0], agent_state.shape[1]
+    obs_grid = np.empty(
+        (batch_size, num_agents, agent_view_size, agent_view_size, ENCODE_DIM),
+        dtype=grid_state.dtype,
+    )
+    for k in nb.prange(batch_size * num_agents):
+        b, agent = k // num_agents, k % num_agents
+        fill_obs_grid(
+            grid_state[b], agent_state[b], agent_occupancy[b],
+            agent, agent_view_size, obs_grid[b, agent])
+        if not see_through_walls:
+            apply_vis_mask(obs_grid[b, agent:agent+1])
+
+    return obs_grid
+
+@nb.njit(cache=True)
+def apply_vis_mask(obs_grid: ndarray[np.int_]):
+    """
+    Replace the cells hidden from each agent by the unseen encoding (in place).
+
+    Parameters
+    ----------
+    obs_grid : ndarray[int] of shape (num_agents, view_size, view_size, encode_dim)
+        Grid object array for each agent observation
+    """
+    vis_mask = get_vis_mask(obs_grid)
+    num_agents, width, height = obs_grid.shape[:3]
+    for agent in range(num_agents):
+        for i in range(width):
+            for j in range(height):
+                if not vis_mask[agent, i, j]:
+                    obs_grid[agent, i, j] = UNSEEN_ENCODING
+
+
+
+### Parallel Observation Functions
+
+# Minimum amount of work per call (observed cells, i.e. num_agents * view_size^2)
+# for the parallel kernels to be worth their threading overhead
+PARALLEL_THRESHOLD = 64 * 7 * 7
+
+def use_parallel(num_views: int, agent_view_size: int) -> bool:
+    """
+    Whether to dispatch observation work to the parallel (prange) kernels.
+
+    Parameters
+    ----------
+    num_views : int
+        Number of agent views to generate (over all environments)
+    agent_view_size : int
+        Width and height of observation sub-grids
+    """
+    # Check the amount of work first, since querying the number of threads
+    # launches the threading layer (which makes forking processes unsafe)
+    return (
+        num_views * agent_view_size * agent_view_size >= PARALLEL_THRESHOLD
+        and nb.get_num_threads() > 1
+    )
+
+def gen_obs_grid_encoding_auto(
+    grid_state: ndarray[np.int_],
+    agent_state: ndarray[np.int_],
+    agent_view_size: int,
+    see_through_walls: bool) -> ndarray[np.int_]:
+    """
+    Call :func:`gen_obs_grid_encoding` or :func:`gen_obs_grid_encoding_parallel`,
+    depending on the amount of work.
+    """
+    if use_parallel(len(agent_state), agent_view_size):
+        kernel = gen_obs_grid_encoding_parallel
+    else:
+        kernel = gen_obs_grid_encoding
+    return kernel(grid_state, agent_state, agent_view_size, see_through_walls)
+
+def gen_obs_grid_encoding_batch_auto(
+    grid_state: ndarray[np.int_],
+    agent_state: ndarray[np.int_],
+    agent_occupancy: ndarray[np.int_],
+    agent_view_size: int,
+    see_through_walls: bool) -> ndarray[np.int_]:
+    """
+    Call :func:`gen_obs_grid_encoding_batch` or
+    :func:`gen_obs_grid_encoding_batch_parallel`, depending on the amount of work.
+    """
+    num_views = agent_state.shape[0] * agent_state.shape[1]
+    if use_parallel(num_views, agent_view_size):
+        kernel = gen_obs_grid_encoding_batch_parallel
+    else:
+        kernel = gen_obs_grid_encoding_batch
+    return kernel(
+        grid_state, agent_state, agent_occupancy, agent_view_size, see_through_walls)
+
+@nb.njit(cache=True, parallel=True)
+def gen_obs_grid_encoding_parallel(
+    grid_state: ndarray[np.int_],
+    agent_state: ndarray[np.int_],
+    agent_view_size: int,
+    see_through_walls: bool) -> ndarray[np.int_]:
+    """
+    Parallel version of :func:`gen_obs_grid_encoding`.
+    """
+    obs_grid = gen_obs_grid_parallel(grid_state, agent_state, agent_view_size)
+    if not see_through_walls:
+        vis_mask = get_vis_mask_parallel(obs_grid)
+        for agent in nb.prange(len(agent_state)):
+            for i in range(agent_view_size):
+                for j in range(agent_view_size):
+                    if not vis_mask[agent, i, j]:
+                        obs_grid[agent, i, j] = UNSEEN_ENCODING
+
+    return obs_grid
+
+@nb.njit(cache=True, parallel=True)
+def gen_obs_grid_parallel(
+    grid_state: ndarray[np.int_],
+    agent_state: ndarray[np.int_],
+    agent_view_size: int) -> ndarray[np.int_]:
+    """
+    Parallel version of :func:`gen_obs_grid` (agents are processed in parallel).
+
+    Agents are stamped via an occupancy grid rather than a copy of the world grid.
+    """
+    num_agents = len(agent_state)
+    width, height = grid_state.shape[0], grid_state.shape[1]
+    agent_occupancy = np.zeros((width, height), dtype=np.int_)
+    for agent in range(num_agents):
+        x, y = agent_state[agent, AGENT_POS_IDX][0], agent_state[agent, AGENT_POS_IDX][1]
+        if 0 <= x < width and 0 <= y < height:
+            agent_occupancy[x, y] += 1
+
+    obs_grid = np.empty(
+        (num_agents, agent_view_size, agent_view_size, ENCODE_DIM), dtype=grid_state.dtype)
+    for agent in nb.prange(num_agents):
+        fill_obs_grid(
+            grid_state, agent_state, agent_occupancy,
+            agent, agent_view_size, obs_grid[agent])
+
+    return obs_grid
+
+@nb.njit(cache=True, parallel=True)
+def get_see_behind_mask_parallel(grid_array: ndarray[np.int_]) -> ndarray[np.int_]:
+    """
+    Parallel version of :func:`get_see_behind_mask`.
+    """
+    num_agents, width, height = grid_array.shape[:3]
+    see_behind_mask = np.zeros((num_agents, width, height), dtype=np.bool_)
+    for agent in nb.prange(num_agents):
+        for i in range(width):
+            for j in range(height):
+                see_behind_mask[agent, i, j] = see_behind(grid_array[agent, i, j])
+
+    return see_behind_mask
+
+@nb.njit(cache=True, parallel=True)
+def get_vis_mask_parallel(obs_grid: ndarray[np.int_]) -> ndarray[np.bool_]:
+    """
+    Parallel version of :func:`get_vis_mask`.
+    """
+    num_agents, width, height = obs_grid.shape[:3]
+    see_behind_mask = get_see_behind_mask_parallel(obs_grid)
+    vis_mask = np.zeros((num_agents, width, height), dtype=np.bool_)
+
+    for agent in nb.prange(num_agents):
+        vis_mask[agent, width // 2, height - 1] = True # agent relative position
+        for j in range(height - 1, -1, -1):
+            # Forward pass
+            for i in range(0, width - 1):
+                if vis_mask[agent, i, j] and see_behind_mask[agent, i, j]:
+                    vis_mask[agent, i + 1, j] = True
+                    if j > 0:
+                        vis_mask[agent, i + 1, j - 1] = True
+                        vis_mask[agent, i, j - 1] = True
+
+            # Backward pass
+            for i in range(width - 1, 0, -1):
+                if vis_mask[agent, i, j] and see_behind_mask[agent, i, j]:
+                    vis_mask[agent, i - 1, j] = True
+                    if j > 0:
+                        vis_mask[agent, i - 1, j - 1] = True
+                        vis_mask[agent, i, j - 1] = True
+
+    return vis_mask
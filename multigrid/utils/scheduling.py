@@ -0,0 +1,410 @@
+from __future__ import annotations
+
+import numpy as np
+
+from collections import deque
+from numpy.typing import NDArray as ndarray
+from typing import Hashable, Iterable, Mapping, Sequence
+
+from ..core.actions import ActionUpDown
+from .navigation import bfs_distances, descend, UNREACHABLE
+
+
+
+### Constants
+
+LEFT = int(ActionUpDown.left)
+RIGHT = int(ActionUpDown.right)
+UP = int(ActionUpDown.up)
+DOWN = int(ActionUpDown.down)
+WAIT = int(ActionUpDown.done)
+
+# (dx, dy) for each movement action
+MOVES = {LEFT: (-1, 0), RIGHT: (1, 0), UP: (0, -1), DOWN: (0, 1)}
+REVERSE = {LEFT: RIGHT, RIGHT: LEFT, UP: DOWN, DOWN: UP}
+
+
+
+### Reservation Table
+
+class ReservationTable:
+    """
+    Space-time reservations of grid cells by agents.
+
+    An agent at cell ``c`` at time ``t`` reserves ``(c, t)``. An agent that has
+    finished its schedule is parked at its last cell for all later times.
+
+    Agents act in a random order within a step and cannot move into occupied
+    cells, so a move into cell ``c`` arriving at time ``t`` is only guaranteed
+    to succeed if no other agent is at ``c`` at time ``t - 1`` or ``t``.
+    An agent at ``c`` at time ``t`` also blocks anyone arriving at ``t + 1``.
+
+    Agents may start stacked in one cell, where they do not block each other
+    until they leave it.
+    """
+
+    def __init__(self):
+        self.reserved: dict[tuple[int, int, int], set[Hashable]] = {}
+        self.parked: dict[tuple[int, int], tuple[Hashable, int]] = {}
+        self.last_use: dict[tuple[int, int], int] = {}
+        self.start: dict[Hashable, tuple[int, int]] = {}
+        self.leave_time: dict[Hashable, int] = {}
+
+    def is_free(
+        self,
+        cell: tuple[int, int],
+        t: int,
+        agent: Hashable,
+        stacked: bool = False) -> bool:
+        """
+        Whether the cell is free of other agents at time ``t``.
+
+        With ``stacked``, agents that started in the same cell as the agent
+        (and have not left it yet) are ignored.
+        """
+        for other in self.reserved.get((*cell, t), ()):
+            if other == agent:
+                continue
+            if (
+                stacked
+                and self.start.get(other) == cell
+                and t <= self.leave_time.get(other, t)
+            ):
+                continue
+            return False
+        parked = self.parked.get(cell)
+        return parked is None or parked[0] == agent or parked[1] > t
+
+    def can_enter(self, cell: tuple[int, int], t: int, agent: Hashable) -> bool:
+        """
+        Whether the agent can move into the cell, arriving at time ``t``.
+        """
+        return (
+            self.is_free(cell, t - 1, agent)
+            and self.is_free(cell, t, agent)
+            and self.is_free(cell, t + 1, agent)
+        )
+
+    def can_stay(self, cell: tuple[int, int], t: int, agent: Hashable) -> bool:
+        """
+        Whether the agent can stay in the cell at time ``t``.
+        """
+        stacked = agent not in self.leave_time and self.start.get(agent) == cell
+        return (
+            self.is_free(cell, t, agent, stacked)
+            and self.is_free(cell, t + 1, agent, stacked)
+        )
+
+    def reserve(self, cell: tuple[int, int], t: int, agent: Hashable):
+        """
+        Reserve the cell at time ``t``.
+        """
+        if t == 0:
+            self.start[agent] = cell
+        elif agent not in self.leave_time and cell != self.start.get(agent):
+            self.leave_time[agent] = t - 1
+        self.reserved.setdefault((*cell, t), set()).add(agent)
+        self.last_use[cell] = max(self.last_use.get(cell, -1), t)
+
+    def park(self, cell: tuple[int, int], t: int, agent: Hashable):
+        """
+        Reserve the cell from time ``t`` onwards.
+        """
+        self.leave_time.setdefault(agent, t)
+        self.parked[cell] = (agent, t)
+
+
+
+### Schedule Compiler
+
+def compile_schedule(
+    queues: Mapping[Hashable, Sequence[int]],
+    positions: Mapping[Hashable, tuple[int, int]],
+    passable: ndarray[np.bool_] | None = None,
+    order: Iterable[Hashable] | None = None,
+    max_wait: int = 8) -> dict[Hashable, ndarray[np.int8]]:
+    """
+    Turn the action queues of several agents into a collision-free joint schedule.
+
+    Agents are scheduled one at a time against a :class:`ReservationTable`
+    (prioritized, cooperative planning). Each agent follows its own queue,
+    and when its next cell is taken it:
+
+        * waits in place (emitting ``done``), for at most ``max_wait`` steps
+        * steps aside and back, if a higher priority agent passes its cell
+        * detours around agents parked for good on its route
+
+    Agents that stay blocked have their queue cut short at that point, so they
+    go idle (and can be replanned) instead of bumping into other agents.
+    Any agent whose route still runs into another agent (e.g. a lower priority
+    agent that had no room to make way) is cut short before reaching it.
+
+    Moves into walls are kept as they are, and like non-movement actions
+    they are treated as waiting. Steps aside and detours require the passability mask.
+
+    Parameters
+    ----------
+    queues : Mapping[Hashable, Sequence[int]]
+        Action queue of each agent (e.g. ``BaseAgent.action_queue``)
+    positions : Mapping[Hashable, tuple[int, int]]
+        Current (x, y) position of each agent
+    passable : ndarray[bool] of shape (width, height) or None
+        Whether each cell is passable (e.g. ``Navigator.passable``)
+    order : Iterable[Hashable] or None
+        Agent priorities, highest first (by default, idle agents come first,
+        then agents by decreasing queue length)
+    max_wait : int
+        Maximum number of consecutive waits before a queue is cut short
+
+    Returns
+    -------
+    schedules : dict[Hashable, ndarray[int8]]
+        Collision-free action array for each agent
+
+    Examples
+    --------
+    Two agents swapping places in a room: agent 1 goes first, while agent 0
+    steps aside (up), lets it pass, and continues (down, right).
+
+    >>> room = np.zeros((6, 5), dtype=bool)
+    >>> room[1:-1, 1:-1] = True
+    >>> queues = {0: [RIGHT, RIGHT], 1: [LEFT, LEFT]}
+    >>> schedules = compile_schedule(queues, {0: (1, 2), 1: (3, 2)}, room)
+    >>> schedules[0].tolist(), schedules[1].tolist()
+    ([2, 1, 3, 1], [0, 0])
+
+    In a corridor, there is no room to make way: agent 0 stays idle, and
+    agent 1 stops next to it instead of bumping into it.
+
+    >>> corridor = np.zeros((6, 3), dtype=bool)
+    >>> corridor[1:-1, 1] = True
+    >>> schedules = compile_schedule(queues, {0: (1, 1), 1: (3, 1)}, corridor)
+    >>> schedules[0].tolist(), schedules[1].tolist()
+    ([], [0])
+    """
+    if order is None:
+        order = sorted(positions, key=lambda agent: len(queues.get(agent, ())))
+        order = (
+            [agent for agent in order if not queues.get(agent)]
+            + [agent for agent in reversed(order) if queues.get(agent)]
+        )
+
+    table = ReservationTable()
+    for agent, pos in positions.items():
+        table.reserve(_cell(pos), 0, agent)
+
+    schedules = {}
+    for agent in order:
+        schedule, pos, t = [], _cell(positions[agent]), 0
+        pending = deque(int(action) for action in queues.get(agent, ()))
+        pos, t = _follow(table, agent, pending, schedule, pos, t, passable, max_wait)
+
+        # Leave the final cell if a higher priority agent passes it later
+        for _ in range(max_wait):
+            if table.last_use.get(pos, -1) <= t or passable is None:
+                break
+            route = _parking_route(table, agent, pos, t, passable)
+            if route is None:
+                break
+            pos, t = _follow(
+                table, agent, deque(route), schedule, pos, t, passable, max_wait)
+
+        table.park(pos, t, agent)
+        schedules[agent] = schedule
+
+    _cut_conflicts(schedules, positions, passable)
+    return {
+        agent: np.array(schedule, dtype=np.int8)
+        for agent, schedule in schedules.items()
+    }
+
+def _cut_conflicts(schedules, positions, passable):
+    """
+    Cut schedules short before any move into a cell that another agent is in
+    at that time or just before (e.g. a lower priority agent that had no room
+    to make way), until there are no such moves left.
+    """
+    paths = {
+        agent: _trace(_cell(positions[agent]), schedule, passable)
+        for agent, schedule in schedules.items()
+    }
+    occupied = {} # (x, y, t) -> agents in the cell at time t
+    stopped = {} # (x, y) -> {agent: time from which it stays in the cell}
+    for agent, path in paths.items():
+        for t, cell in enumerate(path):
+            occupied.setdefault((*cell, t), set()).add(agent)
+        stopped.setdefault(path[-1], {})[agent] = len(path) - 1
+
+    changed = True
+    while changed:
+        changed = False
+        for agent, path in paths.items():
+            for t in range(1, len(path)):
+                x, y = cell = path[t]
+                if cell == path[t - 1]:
+                    continue
+                taken = any(
+                    since <= t for other, since in stopped[cell].items() if other != agent
+                ) if cell in stopped else False
+                for time in (t - 1, t):
+                    others = occupied.get((x, y, time))
+                    if others and (len(others) > 1 or agent not in others):
+                        taken = True
+                if taken:
+                    # Stop before the move (other agents are checked again)
+                    for time in range(t, len(path)):
+                        occupied[(*path[time], time)].discard(agent)
+                    del stopped[path[-1]][agent]
+                    del path[t:]
+                    del schedules[agent][t - 1:]
+                    stopped.setdefault(path[-1], {})[agent] = t - 1
+                    changed = True
+                    break
+
+def _trace(pos, schedule, passable) -> list[tuple[int, int]]:
+    """
+    Get the cell of an agent at each time step of its schedule.
+    """
+    path = [pos]
+    for action in schedule:
+        if action in MOVES and _is_passable(passable, _shift(pos, action)):
+            pos = _shift(pos, action)
+        path.append(pos)
+    return path
+
+def _cell(pos) -> tuple[int, int]:
+    return int(pos[0]), int(pos[1])
+
+def _is_passable(passable, cell: tuple[int, int]) -> bool:
+    if passable is None:
+        return True
+    x, y = cell
+    return 0 <= x < passable.shape[0] and 0 <= y < passable.shape[1] and passable[x, y]
+
+def _follow(table, agent, pending, schedule, pos, t, passable, max_wait):
+    """
+    Schedule the pending actions of one agent against the reservation table,
+    appending to its schedule from position ``pos`` at time ``t``.
+
+    Returns the end position and the end time.
+    """
+    waits = 0
+    while pending:
+        action = pending[0]
+        if action not in MOVES or not _is_passable(passable, _shift(pos, action)):
+            # Non-movement action or move into a wall (as in the original queue),
+            # which keeps the agent in place
+            if not table.can_stay(pos, t + 1, agent):
+                if _step_aside(table, agent, schedule, pending, pos, t, passable):
+                    pos = _shift(pos, schedule[-1])
+                    t += 1
+                    continue
+            pending.popleft()
+            schedule.append(action)
+            t += 1
+            table.reserve(pos, t, agent)
+            continue
+
+        target = _shift(pos, action)
+        if table.can_enter(target, t + 1, agent):
+            pending.popleft()
+            schedule.append(action)
+            pos, t, waits = target, t + 1, 0
+            table.reserve(pos, t, agent)
+            continue
+
+        parked = table.parked.get(target)
+        if parked is not None and parked[0] != agent and passable is not None:
+            # Blocked for good, go around
+            if _detour(table, agent, pending, pos, passable):
+                continue
+            break
+
+        if waits >= max_wait:
+            break
+
+        if table.can_stay(pos, t + 1, agent):
+            schedule.append(WAIT)
+            t, waits = t + 1, waits + 1
+            table.reserve(pos, t, agent)
+        elif _step_aside(table, agent, schedule, pending, pos, t, passable):
+            pos, t, waits = _shift(pos, schedule[-1]), t + 1, waits + 1
+        else:
+            break
+
+    return pos, t
+
+def _shift(pos: tuple[int, int], action: int) -> tuple[int, int]:
+    dx, dy = MOVES[action]
+    return pos[0] + dx, pos[1] + dy
+
+def _step_aside(table, agent, schedule, pending, pos, t, passable) -> bool:
+    """
+    Move to a free neighboring cell and queue the move back.
+    """
+    if passable is None:
+        return False
+    for action in MOVES:
+        cell = _shift(pos, action)
+        if _is_passable(passable, cell) and table.can_enter(cell, t + 1, agent):
+            schedule.append(action)
+            pending.appendleft(REVERSE[action])
+            table.reserve(cell, t + 1, agent)
+            return True
+    return False
+
+def _detour(table, agent, pending, pos, passable) -> bool:
+    """
+    Replace the pending moves up to the first cell that is not parked on
+    with a shortest route around parked agents.
+    """
+    blocked = {cell for cell, (other, _) in table.parked.items() if other != agent}
+    mask = passable.copy()
+    for x, y in blocked:
+        mask[x, y] = False
+
+    # First cell on the remaining route that is not blocked
+    cell, skipped = pos, 0
+    for action in pending:
+        skipped += 1
+        if action in MOVES and _is_passable(passable, _shift(cell, action)):
+            cell = _shift(cell, action)
+            if cell not in blocked:
+                break
+    else:
+        return False
+
+    dist = bfs_distances(mask, cell[0], cell[1])
+    if dist[pos] == UNREACHABLE:
+        return False
+
+    route = np.empty(dist[pos], dtype=np.int8)
+    descend(dist, pos[0], pos[1], cell[0], cell[1], route)
+    for _ in range(skipped):
+        pending.popleft()
+    pending.extendleft(reversed(route.tolist()))
+    return True
+
+def _parking_route(table, agent, pos, t, passable) -> list[int] | None:
+    """
+    Get a shortest route to the nearest cell that no other agent uses after time ``t``.
+    """
+    mask = passable.copy()
+    for (x, y), (other, _) in table.parked.items():
+        if other != agent:
+            mask[x, y] = False
+
+    dist = bfs_distances(mask, pos[0], pos[1])
+    candidates = (dist > 0) & mask
+    for (x, y), last_use in table.last_use.items():
+        if last_use >= t:
+            candidates[x, y] = False
+    if not candidates.any():
+        return None
+
+    # Route from the nearest candidate back to the agent, reversed
+    dist_to = np.where(candidates, dist, np.iinfo(dist.dtype).max)
+    cx, cy = np.unravel_index(np.argmin(dist_to), dist.shape)
+    route = np.empty(dist[cx, cy], dtype=np.int8)
+    descend(dist, cx, cy, pos[0], pos[1], route)
+    return [REVERSE[action] for action in reversed(route.tolist())]
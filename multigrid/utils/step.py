@@ -0,0 +1,218 @@
+import numba as nb
+import numpy as np
+
+from ..core.actions import ActionUpDown
+from ..core.agent import AgentState
+from ..core.constants import State, Type
+from ..core.world_object import WorldObj
+
+from numpy.typing import NDArray as ndarray
+
+
+
+### Constants
+
+EMPTY_ENCODING = WorldObj.empty().encode()
+
+AGENT_POS_IDX = AgentState.POS
+AGENT_TERMINATED_IDX = AgentState.TERMINATED
+
+TYPE = WorldObj.TYPE
+STATE = WorldObj.STATE
+
+EMPTY = int(Type.empty)
+GOAL = int(Type.goal)
+FLOOR = int(Type.floor)
+LAVA = int(Type.lava)
+DOOR = int(Type.door)
+
+OPEN = int(State.open)
+
+LEFT = int(ActionUpDown.left)
+RIGHT = int(ActionUpDown.right)
+UP = int(ActionUpDown.up)
+DOWN = int(ActionUpDown.down)
+DONE = int(ActionUpDown.done)
+
+NO_ACTION = -1
+
+# Actions handled by `move_agents` (all others need the Python object model)
+KERNEL_ACTIONS = frozenset((LEFT, RIGHT, UP, DOWN, DONE))
+
+
+
+### Step Functions
+
+@nb.njit(cache=True)
+def can_overlap(world_obj: ndarray[np.int_]) -> bool:
+    """
+    Can an agent overlap with this world object?
+
+    Parameters
+    ----------
+    world_obj : ndarray[int] of shape (encode_dim,)
+        World object encoding
+    """
+    obj_type = world_obj[TYPE]
+    if obj_type == EMPTY or obj_type == GOAL or obj_type == FLOOR or obj_type == LAVA:
+        return True
+    return obj_type == DOOR and world_obj[STATE] == OPEN
+
+@nb.njit(cache=True)
+def move_agents(
+    grid_state: ndarray[np.int_],
+    agent_state: ndarray[np.int_],
+    agent_occupancy: ndarray[np.int_],
+    goal_counts: ndarray[np.int_],
+    num_goals: int,
+    actions: ndarray[np.int_],
+    order: ndarray[np.int_],
+    allow_agent_overlap: bool,
+    success_any: bool,
+    failure_any: bool) -> ndarray[np.int_]:
+    """
+    Apply movement (left / right / up / down) and done actions for one step.
+
+    Agents act in the given order. An agent reaching a goal gets a reward of 1
+    (all other agents get -1), the goal is removed, and its cell is cleared once
+    no goal is left there. Reaching the last goal or lava terminates agents
+    according to the success / failure termination modes.
+
+    Parameters
+    ----------
+    grid_state : ndarray[int] of shape (width, height, grid_state_dim)
+        Array representation for each grid object (updated in place)
+    agent_state : ndarray[int] of shape (num_agents, agent_state_dim)
+        Array representation for each agent (updated in place)
+    agent_occupancy : ndarray[int] of shape (width, height)
+        Number of agents at each grid cell (updated in place)
+    goal_counts : ndarray[int] of shape (width, height)
+        Number of remaining goals at each grid cell (updated in place)
+    num_goals : int
+        Total number of remaining goals
+    actions : ndarray[int] of shape (num_agents,)
+        Action for each agent (NO_ACTION if the agent does not act)
+    order : ndarray[int] of shape (num_agents,)
+        Order in which agents act
+    allow_agent_overlap : bool
+        Whether agents can move into cells occupied by other agents
+    success_any : bool
+        Whether reaching the last goal terminates all agents
+    failure_any : bool
+        Whether stepping on lava terminates all agents
+
+    Returns
+    -------
+    rewards : ndarray[int] of shape (num_agents,)
+        Reward for each agent
+    """
+    num_agents = agent_state.shape[0]
+    width, height = grid_state.shape[0], grid_state.shape[1]
+    rewards = np.full(num_agents, -1, dtype=np.int64)
+
+    for i in order:
+        action = actions[i]
+        if action == NO_ACTION or agent_state[i, AGENT_TERMINATED_IDX]:
+            continue
+
+        x, y = agent_state[i, AGENT_POS_IDX][0], agent_state[i, AGENT_POS_IDX][1]
+        if action == LEFT:
+            x -= 1
+        elif action == RIGHT:
+            x += 1
+        elif action == UP:
+            y -= 1
+        elif action == DOWN:
+            y += 1
+        else:
+            continue
+
+        if x < 0 or x >= width or y < 0 or y >= height:
+            continue
+        if not can_overlap(grid_state[x, y]):
+            continue
+
+        if not allow_agent_overlap and agent_occupancy[x, y] > 0:
+            continue
+
+        pos = agent_state[i, AGENT_POS_IDX]
+        agent_occupancy[pos[0], pos[1]] -= 1
+        agent_occupancy[x, y] += 1
+        pos[0], pos[1] = x, y
+
+        obj_type = grid_state[x, y, TYPE]
+        if obj_type == GOAL:
+            rewards[i] = 1
+            num_goals -= 1
+            goal_counts[x, y] -= 1
+            if goal_counts[x, y] <= 0:
+                grid_state[x, y] = EMPTY_ENCODING
+            if num_goals == 0:
+                if success_any:
+                    agent_state[:, AGENT_TERMINATED_IDX] = 1
+                else:
+                    agent_state[i, AGENT_TERMINATED_IDX] = 1
+
+        elif obj_type == LAVA:
+            if failure_any:
+                agent_state[:, AGENT_TERMINATED_IDX] = 1
+            else:
+                agent_state[i, AGENT_TERMINATED_IDX] = 1
+
+    return rewards
+
+@nb.njit(cache=True)
+def move_agents_batch(
+    grid_state: ndarray[np.int_],
+    agent_state: ndarray[np.int_],
+    agent_occupancy: ndarray[np.int_],
+    goal_counts: ndarray[np.int_],
+    num_goals: ndarray[np.int_],
+    actions: ndarray[np.int_],
+    order: ndarray[np.int_],
+    active: ndarray[np.bool_],
+    allow_agent_overlap: bool,
+    success_any: bool,
+    failure_any: bool) -> ndarray[np.int_]:
+    """
+    Batched version of :func:`move_agents` over a batch of B environments.
+
+    Parameters
+    ----------
+    grid_state : ndarray[int] of shape (B, width, height, grid_state_dim)
+        Array representation for each grid object (updated in place)
+    agent_state : ndarray[int] of shape (B, num_agents, agent_state_dim)
+        Array representation for each agent (updated in place)
+    agent_occupancy : ndarray[int] of shape (B, width, height)
+        Number of agents at each grid cell (updated in place)
+    goal_counts : ndarray[int] of shape (B, width, height)
+        Number of remaining goals at each grid cell (updated in place)
+    num_goals : ndarray[int] of shape (B,)
+        Total number of remaining goals in each environment
+    actions : ndarray[int] of shape (B, num_agents)
+        Action for each agent (NO_ACTION if the agent does not act)
+    order : ndarray[int] of shape (B, num_agents)
+        Order in which agents act
+    active : ndarray[bool] of shape (B,)
+        Whether to step each environment
+    allow_agent_overlap : bool
+        Whether agents can move into cells occupied by other agents
+    success_any : bool
+        Whether reaching the last goal terminates all agents
+    failure_any : bool
+        Whether stepping on lava terminates all agents
+
+    Returns
+    -------
+    rewards : ndarray[int] of shape (B, num_agents)
+        Reward for each agent (-1 in inactive environments)
+    """
+    rewards = np.full(actions.shape, -1, dtype=np.int64)
+    for b in range(actions.shape[0]):
+        if active[b]:
+            rewards[b] = move_agents(
+                grid_state[b], agent_state[b], agent_occupancy[b], goal_counts[b],
+                num_goals[b], actions[b], order[b],
+                allow_agent_overlap, success_any, failure_any)
+
+    return rewards
@@ -0,0 +1,337 @@
+"""
+This package provides a vectorized version of :class:`.MultiGoalGridEnv`
+that steps a batch of environment copies inside one process.
+
+*****
+Usage
+*****
+
+Create a vectorized environment from environment constructors:
+
+    >>> from multigrid.envs import EmptyEnvV2
+    >>> from multigrid.vector import MultiGoalVectorEnv
+    >>> env = MultiGoalVectorEnv(
+    ...     [lambda: EmptyEnvV2(size=20, agents=4, goals=[(18, 18)])] * 8)
+    >>> obs, infos = env.reset(seed=0)
+    >>> obs['image'].shape
+    (8, 4, 1, 1, 3)
+
+Step all environments with a ``(num_envs, num_agents)`` array of actions:
+
+    >>> actions = np.random.randint(4, size=(env.num_envs, env.num_agents))
+    >>> obs, rewards, terminations, truncations, infos = env.step(actions)
+    >>> rewards.shape
+    (8, 4)
+
+Finished environments are not reset automatically (see :meth:`.MultiGoalVectorEnv.reset_at`).
+"""
+
+from __future__ import annotations
+
+import numpy as np
+
+from numpy.typing import NDArray as ndarray
+from typing import Any, Callable, Literal, Sequence
+
+from ..base_multigoal import MultiGoalGridEnv
+from ..core.agent import AgentState
+from ..core.constants import Color, Direction, State, Type
+from ..utils.obs import gen_obs_grid_encoding_batch_auto
+from ..utils.step import KERNEL_ACTIONS, NO_ACTION, move_agents_batch
+from ..wrappers import OneHotObsWrapper
+
+
+
+class MultiGoalVectorEnv:
+    """
+    Batch of ``MultiGoalGridEnv`` copies stepped with batched kernels.
+
+    The grid, agent, occupancy and goal arrays of every environment are views
+    into batched arrays, so movement steps of all environments run in one call
+    to :func:`.move_agents_batch` and observations of all agents are generated
+    in one call to :func:`.gen_obs_grid_encoding_batch_auto`. Steps with other
+    actions (pickup, drop, toggle) fall back to the environment's own
+    :meth:`~MultiGoalGridEnv.handle_actions`.
+
+    All environments must share the same grid size, number of agents,
+    agent view, dtypes, overlap rule and termination modes.
+
+    Observations are stacked arrays:
+
+        * 'image': ndarray of shape (num_envs, num_agents, view_size, view_size, C)
+        * 'direction': ndarray[int] of shape (num_envs, num_agents)
+        * 'location': ndarray[int] of shape (num_envs, num_agents, 2)
+
+    Attributes
+    ----------
+    envs : list[MultiGoalGridEnv]
+        Environment copies
+    num_envs : int
+        Number of environments
+    num_agents : int
+        Number of agents in each environment
+    """
+
+    def __init__(
+        self,
+        env_fns: Sequence[Callable[[], MultiGoalGridEnv]],
+        image_format: Literal['index', 'one_hot', 'sparse'] = 'index',
+        reuse_buffer: bool = False):
+        """
+        Parameters
+        ----------
+        env_fns : Sequence[Callable() -> MultiGoalGridEnv]
+            Functions that create the environment copies
+        image_format : 'index' or 'one_hot' or 'sparse'
+            Format of image observations: grid encodings, one-hot encodings,
+            or active one-hot feature indices (see :class:`.OneHotObsWrapper`)
+        reuse_buffer : bool
+            Whether to encode 'one_hot' or 'sparse' images into one buffer that
+            is overwritten at every step (returning a read-only view) instead
+            of a new array
+        """
+        assert image_format in ('index', 'one_hot', 'sparse')
+        self.envs: list[MultiGoalGridEnv] = [env_fn().unwrapped for env_fn in env_fns]
+        self.num_envs = len(self.envs)
+        self.image_format = image_format
+        self.reuse_buffer = reuse_buffer
+        assert self.num_envs > 0
+
+        env = self.envs[0]
+        self.num_agents = env.num_agents
+        self.view_size = env.agents[0].view_size
+        self.see_through_walls = env.agents[0].see_through_walls
+        for other in self.envs:
+            assert (other.width, other.height) == (env.width, env.height)
+            assert other.num_agents == self.num_agents
+            assert other.agents[0].view_size == self.view_size
+            assert other.agents[0].see_through_walls == self.see_through_walls
+            assert other.allow_agent_overlap == env.allow_agent_overlap
+            assert other.success_termination_mode == env.success_termination_mode
+            assert other.failure_termination_mode == env.failure_termination_mode
+
+        # Batched state (each environment holds views into these arrays)
+        shape = (self.num_envs, env.width, env.height)
+        self.grid_states = np.zeros(shape + env.grid.state.shape[-1:], dtype=env.grid_dtype)
+        self.agent_states = np.zeros(
+            (self.num_envs, self.num_agents, AgentState.dim), dtype=env.agent_dtype)
+        self.agent_occupancy = np.zeros(shape, dtype=int)
+        self.goal_counts = np.zeros(shape, dtype=int)
+
+        # One-hot encoding (as in OneHotObsWrapper)
+        dim_sizes = np.array([len(Type), len(Color), max(len(State), len(Direction))])
+        self._dim_offsets = np.concatenate([[0], np.cumsum(dim_sizes)[:-1]])
+        self._one_hot_dim = int(dim_sizes.sum())
+        self._image = None # image buffer (if reuse_buffer)
+
+    def reset(
+        self,
+        seed: int | Sequence[int] | None = None,
+    ) -> tuple[dict[str, ndarray], list[dict[str, Any]]]:
+        """
+        Reset all environments.
+
+        Parameters
+        ----------
+        seed : int or Sequence[int] or None
+            Seed for the random number generators (environment ``k`` uses
+            ``seed + k``), or one seed per environment
+
+        Returns
+        -------
+        observations : dict[str, ndarray]
+            Stacked observations
+        infos : list[dict[str, Any]]
+            Additional information for each environment
+        """
+        if seed is None or isinstance(seed, Sequence):
+            seeds = [None] * self.num_envs if seed is None else list(seed)
+        else:
+            seeds = [seed + k for k in range(self.num_envs)]
+
+        infos = [self._reset_env(k, seeds[k]) for k in range(self.num_envs)]
+
+        return self.gen_obs(), infos
+
+    def reset_at(
+        self,
+        index: int,
+        seed: int | None = None) -> tuple[dict[str, ndarray], dict[str, Any]]:
+        """
+        Reset a single environment.
+
+        Parameters
+        ----------
+        index : int
+            Index of the environment
+        seed : int or None
+            Seed for the random number generator
+
+        Returns
+        -------
+        observations : dict[str, ndarray]
+            Observations of the environment (without the batch dimension)
+        info : dict[str, Any]
+            Additional information for the environment
+        """
+        info = self._reset_env(index, seed)
+        observations = self.gen_obs()
+        return {key: value[index] for key, value in observations.items()}, info
+
+    def step(self, actions: ndarray[np.int]) -> tuple[
+        dict[str, ndarray],
+        ndarray[np.int],
+        ndarray[np.bool],
+        ndarray[np.bool],
+        list[dict[str, Any]]]:
+        """
+        Run one timestep of all environments.
+
+        Parameters
+        ----------
+        actions : ndarray[int] of shape (num_envs, num_agents)
+            Action for each agent in each environment (-1 if the agent does not act)
+
+        Returns
+        -------
+        observations : dict[str, ndarray]
+            Stacked observations
+        rewards : ndarray[int] of shape (num_envs, num_agents)
+            Reward for each agent
+        terminations : ndarray[bool] of shape (num_envs, num_agents)
+            Whether the episode has been terminated for each agent
+        truncations : ndarray[bool] of shape (num_envs, num_agents)
+            Whether the episode has been truncated for each agent
+        infos : list[dict[str, Any]]
+            Additional information for each environment
+        """
+        actions = np.asarray(actions, dtype=int).reshape(self.num_envs, self.num_agents)
+        order = np.zeros(actions.shape, dtype=int)
+        active = np.zeros(self.num_envs, dtype=bool)
+        num_goals = np.zeros(self.num_envs, dtype=int)
+
+        # Select environments for the batched kernel, drawing their agent order
+        # exactly like MultiGoalGridEnv.handle_actions
+        python_rewards = {}
+        for k, env in enumerate(self.envs):
+            env.step_count += 1
+            if all(a in KERNEL_ACTIONS or a == NO_ACTION for a in actions[k].tolist()):
+                if self.num_agents > 1:
+                    order[k] = env.np_random.random(size=self.num_agents).argsort()
+                active[k] = True
+                num_goals[k] = len(env.goals)
+            else:
+                python_rewards[k] = env.handle_actions({
+                    i: action for i, action in enumerate(actions[k].tolist())
+                    if action != NO_ACTION
+                })
+
+        env = self.envs[0]
+        rewards = move_agents_batch(
+            self.grid_states,
+            self.agent_states,
+            self.agent_occupancy,
+            self.goal_counts,
+            num_goals,
+            actions,
+            order,
+            active,
+            env.allow_agent_overlap,
+            env.success_termination_mode == 'any',
+            env.failure_termination_mode == 'any',
+        )
+
+        infos = []
+        for k, env in enumerate(self.envs):
+            if active[k]:
+                env.sync_moves(rewards[k])
+            else:
+                rewards[k] = list(python_rewards[k].values())
+            infos.append(env.combine_rewards(rewards[k]))
+
+        terminations = self.agent_states[..., AgentState.TERMINATED].astype(bool)
+        truncations = np.repeat(
+            [[env.step_count >= env.max_steps] for env in self.envs],
+            self.num_agents, axis=1)
+
+        return self.gen_obs(), rewards, terminations, truncations, infos
+
+    def gen_obs(self) -> dict[str, ndarray]:
+        """
+        Generate stacked observations for all agents in all environments.
+
+        With ``reuse_buffer``, 'one_hot' and 'sparse' images are a read-only
+        view that is overwritten at the next step.
+        """
+        image = gen_obs_grid_encoding_batch_auto(
+            self.grid_states,
+            self.agent_states,
+            self.agent_occupancy,
+            self.view_size,
+            self.see_through_walls,
+        )
+        if self.image_format != 'index':
+            batch = image.reshape(-1, *image.shape[2:])
+            if self.image_format == 'one_hot':
+                shape = batch.shape[:-1] + (self._one_hot_dim,)
+            else:
+                shape = batch.shape
+            if not self.reuse_buffer:
+                out = np.empty(shape, dtype=np.uint8)
+            elif self._image is None or self._image.shape != shape:
+                out = self._image = np.empty(shape, dtype=np.uint8)
+            else:
+                out = self._image
+            if self.image_format == 'one_hot':
+                OneHotObsWrapper.one_hot_batch(batch, self._dim_offsets, out)
+            else:
+                OneHotObsWrapper.sparse_indices(batch, self._dim_offsets, out)
+            image = out.reshape(*image.shape[:2], *shape[1:])
+            if self.reuse_buffer:
+                image = image.view()
+                image.setflags(write=False)
+
+        return {
+            'image': image,
+            'direction': self.agent_states[..., AgentState.DIR].copy(),
+            'location': self.agent_states[..., AgentState.POS].copy(),
+        }
+
+    def close(self):
+        """
+        Close all environments.
+        """
+        for env in self.envs:
+            env.close()
+
+    def _reset_env(self, k: int, seed: int | None) -> dict[str, Any]:
+        """
+        Reset environment ``k`` and make its state arrays views into the batch arrays.
+        """
+        env = self.envs[k]
+        _, info = env.reset(seed=seed)
+
+        self.grid_states[k] = env.grid.state
+        env.grid.state = self.grid_states[k]
+
+        self.agent_occupancy[k] = env.agent_occupancy
+        env.agent_occupancy = self.agent_occupancy[k]
+
+        self.goal_counts[k] = env.goal_counts
+        env.goal_counts = self.goal_counts[k]
+
+        # Rebuild the joint agent state on top of the batch array
+        agent_states = env.agent_states
+        self.agent_states[k] = agent_states._view
+        view = self.agent_states[k]
+        env.agent_states = view.view(AgentState)
+        env.agent_states._view = view
+        env.agent_states._carried_obj = agent_states._carried_obj
+        env.agent_states._terminated = agent_states._terminated
+        for agent in env.agents:
+            agent.state = env.agent_states[agent.index]
+
+        return info
+
+
+from .subproc import SubprocMultiGoalVectorEnv
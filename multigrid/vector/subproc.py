@@ -0,0 +1,473 @@
+from __future__ import annotations
+
+import multiprocessing as mp
+import numpy as np
+import traceback
+
+from gymnasium.vector.utils import CloudpickleWrapper
+from multiprocessing.shared_memory import SharedMemory
+from numpy.typing import NDArray as ndarray
+from typing import Any, Callable, Literal, Sequence
+
+from ..base_multigoal import MultiGoalGridEnv
+from ..core.constants import Color, Direction, State, Type
+from . import MultiGoalVectorEnv
+
+
+
+#: Alignment of arrays in shared memory (in bytes)
+ALIGNMENT = 64
+
+
+class SubprocMultiGoalVectorEnv:
+    """
+    Batch of ``MultiGoalGridEnv`` copies stepped in worker processes.
+
+    Each worker runs a :class:`.MultiGoalVectorEnv` over a contiguous slice of
+    the environment copies. Actions are read from a shared array, and outputs
+    (observations, rewards, termination flags and joint rewards) are written to
+    a ring of ``ring_size`` slots in shared memory, with a fixed layout derived
+    from the agent observation space. Only a short command and acknowledgement
+    cross the pipe to each worker per step.
+
+    Outputs are views into the current ring slot: they stay valid until
+    ``ring_size`` further steps (or resets), so copy them to keep them longer.
+
+    Observations contain 'image', 'direction' and 'location' stacked over
+    environments and agents (the mission and global observations are not
+    transported).
+
+    Examples
+    --------
+    >>> from multigrid.envs import EmptyEnvV2
+    >>> from multigrid.vector import SubprocMultiGoalVectorEnv
+    >>> env = SubprocMultiGoalVectorEnv(
+    ...     [lambda: EmptyEnvV2(size=20, agents=4, goals=[(18, 18)])] * 8,
+    ...     num_workers=2)
+    >>> obs, infos = env.reset(seed=0)
+    >>> obs['image'].shape
+    (8, 4, 1, 1, 3)
+    >>> actions = np.random.randint(4, size=(env.num_envs, env.num_agents))
+    >>> obs, rewards, terminations, truncations, infos = env.step(actions)
+    >>> infos['cur_reward'].shape
+    (8,)
+    >>> env.close()
+    """
+
+    def __init__(
+        self,
+        env_fns: Sequence[Callable[[], MultiGoalGridEnv]],
+        num_workers: int | None = None,
+        image_format: Literal['index', 'one_hot', 'sparse'] = 'index',
+        ring_size: int = 2,
+        context: str | None = 'spawn'):
+        """
+        Parameters
+        ----------
+        env_fns : Sequence[Callable() -> MultiGoalGridEnv]
+            Functions that create the environment copies
+        num_workers : int or None
+            Number of worker processes (defaults to the number of CPUs)
+        image_format : 'index' or 'one_hot' or 'sparse'
+            Format of image observations (see :class:`.MultiGoalVectorEnv`)
+        ring_size : int
+            Number of output slots in shared memory
+        context : str or None
+            Multiprocessing start method. 'fork' starts faster, but is unsafe
+            once numba has launched its threading layer (e.g. after running
+            parallel observation kernels) in the main process.
+        """
+        assert ring_size >= 1
+        self.num_envs = len(env_fns)
+        self.ring_size = ring_size
+        num_workers = min(num_workers or mp.cpu_count(), self.num_envs)
+
+        # Derive the output layout from the observation space of one copy
+        env = env_fns[0]().unwrapped
+        self.num_agents = env.num_agents
+        self.layout = output_layout(env, self.num_envs, image_format)
+        self.slot_bytes = layout_size(self.layout)
+        env.close()
+
+        self._outputs_shm = SharedMemory(create=True, size=self.slot_bytes * ring_size)
+        self._actions_shm = SharedMemory(
+            create=True, size=self.num_envs * self.num_agents * np.dtype(np.int64).itemsize)
+        self._outputs = output_views(self._outputs_shm.buf, self.layout, ring_size)
+        self._actions = np.ndarray(
+            (self.num_envs, self.num_agents), dtype=np.int64, buffer=self._actions_shm.buf)
+
+        # Start workers, each with a contiguous slice of environments
+        ctx = mp.get_context(context)
+        bounds = np.linspace(0, self.num_envs, num_workers + 1).astype(int)
+        self._slices = [slice(a, b) for a, b in zip(bounds[:-1], bounds[1:])]
+        self._conns, self._processes = [], []
+        for envs in self._slices:
+            parent_conn, child_conn = ctx.Pipe()
+            process = ctx.Process(
+                target=_worker,
+                args=(
+                    CloudpickleWrapper(list(env_fns[envs])),
+                    envs,
+                    image_format,
+                    child_conn,
+                    self._outputs_shm.name,
+                    self._actions_shm.name,
+                    self.layout,
+                    ring_size,
+                    (self.num_envs, self.num_agents),
+                ),
+                daemon=True,
+            )
+            process.start()
+            child_conn.close()
+            self._conns.append(parent_conn)
+            self._processes.append(process)
+
+        self._slot = 0
+        self._waiting = False
+        self._closed = False
+
+    def reset(
+        self,
+        seed: int | Sequence[int] | None = None) -> tuple[dict[str, ndarray], dict[str, ndarray]]:
+        """
+        Reset all environments.
+
+        Parameters
+        ----------
+        seed : int or Sequence[int] or None
+            Seed for the random number generators (environment ``k`` uses
+            ``seed + k``), or one seed per environment
+
+        Returns
+        -------
+        observations : dict[str, ndarray]
+            Stacked observations
+        infos : dict[str, ndarray]
+            Joint reward ('cur_reward') and total reward ('total_reward') of each environment
+        """
+        if seed is None or isinstance(seed, Sequence):
+            seeds = [None] * self.num_envs if seed is None else list(seed)
+        else:
+            seeds = [seed + k for k in range(self.num_envs)]
+
+        slot = self._next_slot()
+        for conn, envs in zip(self._conns, self._slices):
+            conn.send(('reset', (slot, seeds[envs])))
+        self._receive()
+
+        outputs = self._outputs[slot]
+        return self._observations(outputs), self._infos(outputs)
+
+    def reset_at(
+        self,
+        index: int,
+        seed: int | None = None) -> tuple[dict[str, ndarray], dict[str, Any]]:
+        """
+        Reset a single environment.
+
+        The new observations are written to the most recent ring slot
+        (i.e. the outputs of the last step are updated for this environment).
+
+        Parameters
+        ----------
+        index : int
+            Index of the environment
+        seed : int or None
+            Seed for the random number generator
+
+        Returns
+        -------
+        observations : dict[str, ndarray]
+            Observations of the environment (copied, without the batch dimension)
+        info : dict[str, Any]
+            Joint reward and total reward of the environment
+        """
+        worker = next(i for i, envs in enumerate(self._slices) if envs.start <= index < envs.stop)
+        self._conns[worker].send(('reset_at', (self._slot, index, seed)))
+        self._receive([worker])
+
+        outputs = self._outputs[self._slot]
+        observations = {key: value[index].copy() for key, value in self._observations(outputs).items()}
+        info = {key: value[index].item() for key, value in self._infos(outputs).items()}
+        return observations, info
+
+    def step_async(self, actions: ndarray[np.int]):
+        """
+        Send actions to the workers without waiting for the results.
+
+        Parameters
+        ----------
+        actions : ndarray[int] of shape (num_envs, num_agents)
+            Action for each agent in each environment (-1 if the agent does not act)
+        """
+        assert not self._waiting, "step_wait() must be called before the next step_async()"
+        self._actions[...] = np.asarray(actions).reshape(self._actions.shape)
+        slot = self._next_slot()
+        for conn in self._conns:
+            conn.send(('step', slot))
+        self._waiting = True
+
+    def step_wait(self) -> tuple[
+        dict[str, ndarray],
+        ndarray[np.int],
+        ndarray[np.bool],
+        ndarray[np.bool],
+        dict[str, ndarray]]:
+        """
+        Wait for the results of :meth:`step_async`.
+
+        Returns
+        -------
+        observations : dict[str, ndarray]
+            Stacked observations
+        rewards : ndarray[int] of shape (num_envs, num_agents)
+            Reward for each agent
+        terminations : ndarray[bool] of shape (num_envs, num_agents)
+            Whether the episode has been terminated for each agent
+        truncations : ndarray[bool] of shape (num_envs, num_agents)
+            Whether the episode has been truncated for each agent
+        infos : dict[str, ndarray]
+            Joint reward ('cur_reward') and total reward ('total_reward') of each environment
+        """
+        assert self._waiting, "step_async() must be called before step_wait()"
+        self._waiting = False
+        self._receive()
+
+        outputs = self._outputs[self._slot]
+        return (
+            self._observations(outputs),
+            outputs['rewards'],
+            outputs['terminations'],
+            outputs['truncations'],
+            self._infos(outputs),
+        )
+
+    def step(self, actions: ndarray[np.int]):
+        """
+        Run one timestep of all environments (see :meth:`step_wait`).
+        """
+        self.step_async(actions)
+        return self.step_wait()
+
+    def close(self):
+        """
+        Stop the workers and release the shared memory.
+        """
+        if self._closed:
+            return
+        self._closed = True
+        if self._waiting:
+            self._receive()
+        for conn in self._conns:
+            try:
+                conn.send(('close', None))
+            except (BrokenPipeError, OSError):
+                pass
+        for process in self._processes:
+            process.join(timeout=5)
+            if process.is_alive():
+                process.terminate()
+        for conn in self._conns:
+            conn.close()
+
+        self._outputs = self._actions = None
+        for shm in (self._outputs_shm, self._actions_shm):
+            shm.close()
+            shm.unlink()
+
+    def __del__(self):
+        if not getattr(self, '_closed', True):
+            self.close()
+
+    def _next_slot(self) -> int:
+        """
+        Advance to the next ring slot.
+        """
+        self._slot = (self._slot + 1) % self.ring_size
+        return self._slot
+
+    def _receive(self, workers: Sequence[int] | None = None):
+        """
+        Wait for acknowledgements, raising worker errors.
+        """
+        errors = []
+        for i in range(len(self._conns)) if workers is None else workers:
+            status, message = self._conns[i].recv()
+            if status == 'error':
+                errors.append(f"Worker {i}:\n{message}")
+        if errors:
+            raise RuntimeError("\n".join(errors))
+
+    @staticmethod
+    def _observations(outputs: dict[str, ndarray]) -> dict[str, ndarray]:
+        return {key: outputs[key] for key in ('image', 'direction', 'location')}
+
+    @staticmethod
+    def _infos(outputs: dict[str, ndarray]) -> dict[str, ndarray]:
+        return {key: outputs[key] for key in ('cur_reward', 'total_reward')}
+
+
+
+### Shared Memory Layout
+
+def output_layout(
+    env: MultiGoalGridEnv,
+    num_envs: int,
+    image_format: str) -> dict[str, tuple[int, tuple[int, ...], np.dtype]]:
+    """
+    Layout of one ring slot, derived from the agent observation space.
+
+    Parameters
+    ----------
+    env : MultiGoalGridEnv
+        One of the environment copies
+    num_envs : int
+        Number of environment copies
+    image_format : 'index' or 'one_hot' or 'sparse'
+        Format of image observations
+
+    Returns
+    -------
+    layout : dict[str, tuple[int, tuple[int, ...], np.dtype]]
+        Byte offset, shape and dtype of each output array
+    """
+    observation_space = env.agents[0].observation_space
+    image_space, location_space = observation_space['image'], observation_space['location']
+    batch = (num_envs, env.num_agents)
+
+    image_shape, image_dtype = image_space.shape, image_space.dtype
+    if image_format == 'one_hot':
+        dim = len(Type) + len(Color) + max(len(State), len(Direction))
+        image_shape, image_dtype = image_shape[:-1] + (dim,), np.dtype(np.uint8)
+    elif image_format == 'sparse':
+        image_dtype = np.dtype(np.uint8)
+
+    specs = [
+        ('image', batch + image_shape, image_dtype),
+        ('direction', batch, location_space.dtype),
+        ('location', batch + location_space.shape, location_space.dtype),
+        ('rewards', batch, np.dtype(np.int64)),
+        ('terminations', batch, np.dtype(np.bool_)),
+        ('truncations', batch, np.dtype(np.bool_)),
+        ('cur_reward', (num_envs,), np.dtype(np.float64)),
+        ('total_reward', (num_envs,), np.dtype(np.float64)),
+    ]
+
+    layout, offset = {}, 0
+    for name, shape, dtype in specs:
+        layout[name] = (offset, shape, np.dtype(dtype))
+        size = int(np.prod(shape)) * np.dtype(dtype).itemsize
+        offset += -(-size // ALIGNMENT) * ALIGNMENT
+
+    return layout
+
+def layout_size(layout: dict[str, tuple[int, tuple[int, ...], np.dtype]]) -> int:
+    """
+    Size of one ring slot in bytes.
+    """
+    size = max(
+        offset + int(np.prod(shape)) * dtype.itemsize
+        for offset, shape, dtype in layout.values()
+    )
+    return -(-size // ALIGNMENT) * ALIGNMENT
+
+def output_views(
+    buffer: memoryview,
+    layout: dict[str, tuple[int, tuple[int, ...], np.dtype]],
+    ring_size: int) -> list[dict[str, ndarray]]:
+    """
+    Array views of each ring slot in a shared memory buffer.
+    """
+    slot_bytes = layout_size(layout)
+    return [
+        {
+            name: np.ndarray(shape, dtype=dtype, buffer=buffer, offset=slot * slot_bytes + offset)
+            for name, (offset, shape, dtype) in layout.items()
+        }
+        for slot in range(ring_size)
+    ]
+
+
+
+### Worker
+
+def _worker(
+    env_fns: CloudpickleWrapper,
+    envs: slice,
+    image_format: str,
+    conn: mp.connection.Connection,
+    outputs_name: str,
+    actions_name: str,
+    layout: dict,
+    ring_size: int,
+    actions_shape: tuple[int, int]):
+    """
+    Worker process loop, stepping a slice of environments.
+    """
+    outputs_shm = _attach(outputs_name)
+    actions_shm = _attach(actions_name)
+    outputs = output_views(outputs_shm.buf, layout, ring_size)
+    actions = np.ndarray(actions_shape, dtype=np.int64, buffer=actions_shm.buf)
+
+    def write(slot, rows, observations, rewards=0, terminations=False, truncations=False):
+        """
+        Write outputs of the given environments (global rows) to a ring slot.
+        """
+        out = outputs[slot]
+        for key, value in observations.items():
+            out[key][rows] = value
+        out['rewards'][rows] = rewards
+        out['terminations'][rows] = terminations
+        out['truncations'][rows] = truncations
+        local = slice(rows.start - envs.start, rows.stop - envs.start)
+        for k, env in enumerate(vector_env.envs[local], start=rows.start):
+            out['cur_reward'][k] = infos[k - envs.start].get('cur_reward', 0.0)
+            out['total_reward'][k] = env.total_rewards
+
+    try:
+        # Observations are copied to shared memory, so the image buffer can be reused
+        vector_env = MultiGoalVectorEnv(
+            env_fns.fn, image_format=image_format, reuse_buffer=True)
+        infos = [{} for _ in vector_env.envs]
+        while True:
+            command, data = conn.recv()
+            if command == 'step':
+                observations, rewards, terminations, truncations, infos = vector_env.step(
+                    actions[envs])
+                write(data, envs, observations, rewards, terminations, truncations)
+            elif command == 'reset':
+                slot, seeds = data
+                observations, _ = vector_env.reset(seed=seeds)
+                infos = [{} for _ in vector_env.envs]
+                write(slot, envs, observations)
+            elif command == 'reset_at':
+                slot, index, seed = data
+                observations, _ = vector_env.reset_at(index - envs.start, seed=seed)
+                infos[index - envs.start] = {}
+                observations = {key: value[None] for key, value in observations.items()}
+                write(slot, slice(index, index + 1), observations)
+            elif command == 'close':
+                break
+            else:
+                raise ValueError(f"Unknown command: {command}")
+            conn.send(('ok', None))
+    except (KeyboardInterrupt, EOFError):
+        pass
+    except Exception:
+        conn.send(('error', traceback.format_exc()))
+    finally:
+        outputs = actions = None
+        outputs_shm.close()
+        actions_shm.close()
+        conn.close()
+
+def _attach(name: str) -> SharedMemory:
+    """
+    Attach to shared memory owned by the main process.
+
+    Workers share the resource tracker of the main process (for both 'fork'
+    and 'spawn'), so the registration made here is the same as the owner's,
+    and the main process unlinks the memory on :meth:`.SubprocMultiGoalVectorEnv.close`.
+    """
+    return SharedMemory(name=name)
@@ -9,6 +9,7 @@ from gymnasium.core import ObservationWrapper
 from numpy.typing import NDArray as ndarray
 
 from .base import MultiGridEnv, AgentID, ObsType
+from .core.agent import AgentState
 from .core.constants import Color, Direction, State, Type
 from .core.world_object import WorldObj
 
@@ -18,6 +19,13 @@ class FullyObsWrapper(ObservationWrapper):
     """
     Fully observable gridworld using a compact grid encoding instead of agent view.
 
+    With ``incremental=True``, a single global encoding is kept up to date by
+    re-reading only the cells that changed (grid cells changed since the last
+    step, and the cells agents moved from / to), and every agent receives the
+    same read-only view of it. This costs O(agents) per step instead of
+    O(width * height), but the observation changes in place on the next step:
+    consumers that keep observations across steps must copy them.
+
     Examples
     --------
     >>> import gymnasium as gym
@@ -34,29 +42,87 @@ class FullyObsWrapper(ObservationWrapper):
     (16, 16, 3)
     """
 
-    def __init__(self, env: MultiGridEnv):
+    def __init__(self, env: MultiGridEnv, incremental: bool = False):
         """
+        Parameters
+        ----------
+        env : MultiGridEnv
+            Environment to wrap
+        incremental : bool
+            Whether to update one shared, read-only encoding in place
+            instead of encoding the whole grid at every step
         """
         super().__init__(env)
+        self.incremental = incremental
+
+        # Incremental encoding state
+        self._encoding = None # global encoding (writable)
+        self._encoding_view = None # read-only view handed out to agents
+        self._grid = None # grid the encoding was built from
+        self._grid_version = None # grid version the encoding is up to date with
+        self._agent_pos = None # agent positions stamped into the encoding
 
         # Update agent observation spaces
         for agent in self.env.agents:
             agent.observation_space['image'] = spaces.Box(
-                low=0, high=255, shape=(env.height, env.width, WorldObj.dim), dtype=int)
+                low=0,
+                high=255,
+                shape=(env.height, env.width, WorldObj.dim),
+                dtype=env.grid.dtype,
+            )
 
     def observation(self, obs: dict[AgentID, ObsType]) -> dict[AgentID, ObsType]:
         """
         :meta private:
         """
-        img = self.env.grid.encode()
-        for agent in self.env.agents:
-            img[agent.state.pos] = agent.encode()
+        if self.incremental:
+            img = self._update_encoding()
+        else:
+            img = self.env.grid.encode()
+            for agent in self.env.agents:
+                img[agent.state.pos] = agent.encode()
 
         for agent_id in obs:
-            obs[agent_id]['image'] = img
+            if agent_id != 'global': # skip shared (non-agent) observations
+                obs[agent_id]['image'] = img
 
         return obs
 
+    def _update_encoding(self) -> ndarray[np.int]:
+        """
+        Bring the global encoding up to date and return a read-only view of it.
+        """
+        env = self.env.unwrapped
+        grid, agent_states = env.grid, env.agent_states._view
+        agent_pos = agent_states[:, AgentState.POS].copy()
+
+        # Cells to re-read from the grid (None if the whole grid must be re-read)
+        cells = None
+        if grid is self._grid and len(agent_pos) == len(self._agent_pos):
+            cells = grid.changed_cells(self._grid_version)
+
+        if cells is None:
+            self._encoding = grid.state.copy()
+            self._encoding_view = self._encoding.view()
+            self._encoding_view.flags.writeable = False
+        else:
+            xs, ys = np.concatenate([
+                np.array(cells, dtype=int).reshape(-1, 2),
+                self._agent_pos,
+                agent_pos,
+            ]).T
+            self._encoding[xs, ys] = grid.state[xs, ys]
+
+        # Stamp agents (in index order, so later agents are drawn on top)
+        agent_encodings = agent_states[:, AgentState.ENCODING]
+        for i, (x, y) in enumerate(agent_pos.tolist()):
+            self._encoding[x, y] = agent_encodings[i]
+
+        self._grid = grid
+        self._grid_version = grid.version
+        self._agent_pos = agent_pos
+        return self._encoding_view
+
 
 class ImgObsWrapper(ObservationWrapper):
     """
@@ -93,7 +159,9 @@ class ImgObsWrapper(ObservationWrapper):
         :meta private:
         """
         for agent_id in obs:
-            obs[agent_id] = obs[agent_id]['image'].astype(np.uint8)
+            if agent_id != 'global': # skip shared (non-agent) observations
+                # No copy if the environment already uses compact (uint8) observations
+                obs[agent_id] = np.asarray(obs[agent_id]['image'], dtype=np.uint8)
 
         return obs
 
@@ -130,31 +198,190 @@ class OneHotObsWrapper(ObservationWrapper):
             [0, 0, 1, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 1, 1, 0, 0],
             [0, 0, 1, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 1, 1, 0, 0]],
             dtype=uint8)
+
+    Observations of all agents are encoded in one batch. When agents share the
+    same image (e.g. with :class:`FullyObsWrapper`), it is encoded only once
+    and copied for each agent.
+
+    With ``reuse_buffer=True``, images are instead encoded into a buffer that
+    is overwritten at every step, and agents get read-only views into it
+    (consumers that keep observations across steps must copy them).
+
+    With ``sparse=True``, each cell holds the indices of its active features
+    (one per encoding dimension) instead of a dense one-hot vector, which is
+    the input format of embedding-based models and stays small for large
+    fully observable grids:
+
+    >>> env = OneHotObsWrapper(gym.make('MultiGrid-Empty-5x5-v0'), sparse=True)
+    >>> obs, _ = env.reset()
+    >>> obs[0]['image'][0, 0]
+    array([ 2, 16, 17], dtype=uint8)
     """
 
-    def __init__(self, env: MultiGridEnv):
+    def __init__(
+        self,
+        env: MultiGridEnv,
+        sparse: bool = False,
+        reuse_buffer: bool = False):
         """
+        Parameters
+        ----------
+        env : MultiGridEnv
+            Environment to wrap
+        sparse : bool
+            Whether to output active feature indices instead of one-hot vectors
+        reuse_buffer : bool
+            Whether to encode into one output buffer that is overwritten at
+            every step (returning read-only views) instead of new arrays
         """
         super().__init__(env)
+        self.sparse = sparse
+        self.reuse_buffer = reuse_buffer
         self.dim_sizes = np.array([
             len(Type), len(Color), max(len(State), len(Direction))])
+        self.dim_offsets = np.concatenate([[0], np.cumsum(self.dim_sizes)[:-1]])
+
+        # Reusable input / output buffers, allocated on first use
+        # (the input is only read during `observation`, so it is always reused)
+        self._input = None
+        self._output = None
 
         # Update agent observation spaces
         dim = sum(self.dim_sizes)
-        for agent in self.env.agents:
-            view_height, view_width, _ = agent.observation_space['image'].shape
-            agent.observation_space['image'] = spaces.Box(
-                low=0, high=1, shape=(view_height, view_width, dim), dtype=np.uint8)
+        for agent in self.env.unwrapped.agents:
+            view_height, view_width, encode_dim = agent.observation_space['image'].shape
+            if sparse:
+                agent.observation_space['image'] = spaces.Box(
+                    low=0,
+                    high=dim - 1,
+                    shape=(view_height, view_width, encode_dim),
+                    dtype=np.uint8,
+                )
+            else:
+                agent.observation_space['image'] = spaces.Box(
+                    low=0, high=1, shape=(view_height, view_width, dim), dtype=np.uint8)
 
     def observation(self, obs: dict[AgentID, ObsType]) -> dict[AgentID, ObsType]:
         """
         :meta private:
         """
-        for agent_id in obs:
-            obs[agent_id]['image'] = self.one_hot(obs[agent_id]['image'], self.dim_sizes)
+        agent_ids = [agent_id for agent_id in obs if agent_id != 'global']
+        if not agent_ids:
+            return obs
+
+        # Encode a shared image once, otherwise all agent images in one batch
+        images = [obs[agent_id]['image'] for agent_id in agent_ids]
+        shared = all(image is images[0] for image in images)
+        batch = self._stack(images[:1] if shared else images)
+
+        if self.sparse:
+            out = self._buffer(batch.shape)
+            self.sparse_indices(batch, self.dim_offsets, out)
+        else:
+            out = self._buffer(batch.shape[:-1] + (self.dim_sizes.sum(),))
+            self.one_hot_batch(batch, self.dim_offsets, out)
+
+        for k, agent_id in enumerate(agent_ids):
+            if self.reuse_buffer:
+                image = out[0 if shared else k]
+                image.setflags(write=False)
+            elif shared:
+                image = out[0] if k == 0 else out[0].copy()
+            else:
+                image = out[k]
+            obs[agent_id]['image'] = image
 
         return obs
 
+    def _stack(self, images: list[ndarray]) -> ndarray:
+        """
+        Copy images into the reusable input buffer.
+        """
+        shape = (len(images),) + images[0].shape
+        if self._input is None or self._input.shape != shape:
+            self._input = np.empty(shape, dtype=images[0].dtype)
+        for k, image in enumerate(images):
+            np.copyto(self._input[k], image, casting='unsafe')
+        return self._input
+
+    def _buffer(self, shape: tuple[int, ...]) -> ndarray[np.uint8]:
+        """
+        Return an output buffer with the given shape (reused if ``reuse_buffer``).
+        """
+        if not self.reuse_buffer:
+            return np.empty(shape, dtype=np.uint8)
+        if self._output is None or self._output.shape != shape:
+            self._output = np.empty(shape, dtype=np.uint8)
+        return self._output
+
+    @staticmethod
+    @nb.njit(cache=True)
+    def one_hot_batch(
+        x: ndarray[np.int],
+        dim_offsets: ndarray[np.int],
+        out: ndarray[np.uint8]) -> ndarray[np.uint8]:
+        """
+        Batched one-hot encoding into a preallocated output array.
+
+        Parameters
+        ----------
+        x : ndarray[int] of shape (N, view_height, view_width, dim)
+            Batch of 3D arrays of integers to be one-hot encoded
+        dim_offsets : ndarray[int] of shape (dim,)
+            Offset of each dimension in the one-hot vector
+            (i.e. the cumulative sum of the dimension sizes)
+        out : ndarray[uint8] of shape (N, view_height, view_width, sum(dim_sizes))
+            Output array (overwritten)
+
+        Returns
+        -------
+        out : ndarray[uint8] of shape (N, view_height, view_width, sum(dim_sizes))
+            One-hot encoding
+
+        :meta private:
+        """
+        out[...] = 0
+        for n in range(x.shape[0]):
+            for i in range(x.shape[1]):
+                for j in range(x.shape[2]):
+                    for d in range(x.shape[3]):
+                        out[n, i, j, dim_offsets[d] + x[n, i, j, d]] = 1
+
+        return out
+
+    @staticmethod
+    @nb.njit(cache=True)
+    def sparse_indices(
+        x: ndarray[np.int],
+        dim_offsets: ndarray[np.int],
+        out: ndarray[np.uint8]) -> ndarray[np.uint8]:
+        """
+        Active one-hot feature indices of each cell, into a preallocated output array.
+
+        Parameters
+        ----------
+        x : ndarray[int] of shape (N, view_height, view_width, dim)
+            Batch of 3D arrays of integers to be encoded
+        dim_offsets : ndarray[int] of shape (dim,)
+            Offset of each dimension in the one-hot vector
+        out : ndarray[uint8] of shape (N, view_height, view_width, dim)
+            Output array (overwritten)
+
+        Returns
+        -------
+        out : ndarray[uint8] of shape (N, view_height, view_width, dim)
+            Index of the active one-hot feature for each dimension
+
+        :meta private:
+        """
+        for n in range(x.shape[0]):
+            for i in range(x.shape[1]):
+                for j in range(x.shape[2]):
+                    for d in range(x.shape[3]):
+                        out[n, i, j, d] = dim_offsets[d] + x[n, i, j, d]
+
+        return out
+
     @staticmethod
     @nb.njit(cache=True)
     def one_hot(x: ndarray[np.int], dim_sizes: ndarray[np.int]) -> ndarray[np.uint8]:
@@ -162,6 +389,8 @@ class OneHotObsWrapper(ObservationWrapper):
         Return a one-hot encoding of a 3D integer array,
         where each 2D slice is encoded separately.
 
+        Compiled separately for each input dtype (e.g. int or compact uint8).
+
         Parameters
         ----------
         x : ndarray[int] of shape (view_height, view_width, dim)
@@ -176,16 +405,15 @@ class OneHotObsWrapper(ObservationWrapper):
 
         :meta private:
         """
-        out = np.zeros((x.shape[0], x.shape[1], sum(dim_sizes)), dtype=np.uint8)
-
-        dim_offset = 0
-        for d in range(len(dim_sizes)):
-            for i in range(x.shape[0]):
-                for j in range(x.shape[1]):
-                    k = dim_offset + x[i, j, d]
-                    out[i, j, k] = 1
-
-            dim_offset += dim_sizes[d]
+        dim_offsets = np.zeros(len(dim_sizes), dtype=np.int64)
+        for d in range(1, len(dim_sizes)):
+            dim_offsets[d] = dim_offsets[d - 1] + dim_sizes[d - 1]
+
+        out = np.zeros((x.shape[0], x.shape[1], dim_sizes.sum()), dtype=np.uint8)
+        for i in range(x.shape[0]):
+            for j in range(x.shape[1]):
+                for d in range(len(dim_sizes)):
+                    out[i, j, dim_offsets[d] + x[i, j, d]] = 1
 
         return out
 
@@ -1,3 +1,4 @@
+from .coverage_planner import CoveragePlanner
 from .hybrid_planner import HybridPlanner
 from .prompt_planner import PromptPlanner
-from .super_planner import SuperPlanner
\ No newline at end of file
+from .super_planner import SuperPlanner
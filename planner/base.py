@@ -14,3 +14,15 @@ class BasePlanner(ABC):
     @abstractmethod
     def replan(self, observations, rewards, terminations, truncations, infos):
         pass
+
+    def close(self):
+        """
+        Release resources held by the planner (e.g. background workers).
+        """
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
@@ -0,0 +1,71 @@
+from typing import Dict, Optional, Tuple
+
+from langchain_core.language_models.chat_models import BaseChatModel
+
+from .base import BasePlanner
+from .utils.allocator import RegionAllocator, interior, split_strips
+from .utils.tracker import Tracker
+
+
+class CoveragePlanner(BasePlanner):
+    """
+    Deterministic, LLM-free planner that splits the grid interior into one
+    boustrophedon strip per agent and hands out the unvisited remainder
+    to agents as they go idle.
+
+    It serves as a coverage baseline and as a fallback for LLM planners.
+    """
+
+    tracker: Tracker
+    number_of_agents: int = -1
+    grid_size: int = -1
+    agent_positions: Dict[int, Tuple[int, int]]
+
+    def __init__(
+        self,
+        grid_size,
+        observations,
+        infos,
+        llm: Optional[BaseChatModel] = None,
+        tracker: Optional[Tracker] = None,
+    ) -> None:
+        # `llm` is accepted (and ignored) so this can replace any other planner
+        self.number_of_agents = len(observations.keys()) - 1
+        self.agent_positions = {i: (1, 1) for i in range(0, self.number_of_agents)}
+        self.grid_size = grid_size
+        self.tracker = tracker if tracker is not None else Tracker(grid_size)
+        self.allocator = RegionAllocator(self.tracker, grid_size)
+
+    def initial_plan(self) -> dict:
+        strips = split_strips(interior(self.grid_size), self.number_of_agents)
+        for rect in strips:
+            self.allocator.add(rect)
+        plan = self.assign(range(self.number_of_agents), self.agent_positions)
+        return self.describe(plan), plan
+
+    def replan(self, agents, observations, rewards, terminations, truncations, infos):
+        del observations["global"]
+        for k, v in observations.items():
+            self.agent_positions[k] = tuple(int(x) for x in v["location"])
+        self.tracker.observe(observations, rewards)
+
+        idle_agents = [i for i in range(self.number_of_agents) if agents.idle(i)]
+        if not idle_agents:
+            return "", {}
+
+        busy_agents = [i for i in range(self.number_of_agents) if not agents.idle(i)]
+        plan = self.assign(idle_agents, self.agent_positions, busy_agents)
+        return self.describe(plan), plan
+
+    def assign(self, agent_ids, agent_positions, busy_agents=()) -> dict:
+        """
+        Assign search regions to the given agents.
+        """
+        return self.allocator.assign(agent_ids, agent_positions, busy_agents)
+
+    @staticmethod
+    def describe(plan) -> str:
+        return "\n".join(
+            f"Agent {i}: " + ", ".join(action.serialize() for action in actions)
+            for i, actions in plan.items()
+        )
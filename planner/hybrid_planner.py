@@ -1,22 +1,27 @@
+import math
 import os
-from typing import Dict, Tuple
 
 from langchain_core.language_models.chat_models import BaseChatModel
 from langchain_prompty import create_chat_prompt
 
-from .base import BasePlanner
-from .schemas.plan import Plan
-from .utils.tracker import Tracker
+from .coverage_planner import CoveragePlanner
+from .schemas.prior import Prior
+from .utils.allocator import clip_rect, interior, split_strips
 
 
-class HybridPlanner(BasePlanner):
+class HybridPlanner(CoveragePlanner):
+    """
+    Planner that calls the LLM once, to turn the mission statement into
+    weighted candidate regions, and then plans algorithmically.
+
+    Candidate regions are swept first (highest weight first), followed by
+    the rest of the grid. All replans are done locally by the region
+    allocator over the `Tracker` coverage map, without any LLM call.
+    """
+
     llm: BaseChatModel
-    tracker: Tracker
     mission_statement: str = ""
-    number_of_agents: int = -1
-    grid_size: int = -1
     number_of_targets: int = -1
-    agent_positions: Dict[int, Tuple[int, int]]
 
     def __init__(
         self,
@@ -25,18 +30,17 @@ class HybridPlanner(BasePlanner):
         observations,
         infos,
     ) -> None:
+        super().__init__(grid_size, observations, infos)
         self.llm = llm
-        self.mission_statement = observations[0]["mission"]
-        self.number_of_agents = len(observations.keys()) - 1
+        self.mission_statement = str(observations[0]["mission"])
         self.number_of_targets = observations["global"]["num_goals"]
-        self.agent_positions = {i: (1, 1) for i in range(0, self.number_of_agents)}
-        self.grid_size = grid_size
+        self.prior_prompt = create_chat_prompt(
+            os.getcwd() + "/prompts/hybrid/prior.prompty"
+        )
 
     def initial_plan(self) -> dict:
-        model_with_structure = self.llm.with_structured_output(Plan)
-        prompt = create_chat_prompt(os.getcwd() + "/prompts/initial_planner.prompty")
-        initial_planner = prompt | model_with_structure
-        plan = initial_planner.invoke(
+        prior_extractor = self.prior_prompt | self.llm.with_structured_output(Prior)
+        prior = prior_extractor.invoke(
             {
                 "grid_length": self.grid_size,
                 "num_agents": self.number_of_agents,
@@ -44,14 +48,34 @@ class HybridPlanner(BasePlanner):
                 "mission": self.mission_statement,
             }
         )
-        return plan.agents
-
-    def replan(
-        self, agents, observations, rewards, terminations, truncations, infos
-    ) -> dict:
-        del observations["global"]
-        if any([r == 1 for r in rewards.values()]):
-            # Re-plan when a target is found
-            pass
-        self.tracker.observe(observations, rewards)
-        return {}
+
+        # Split candidate regions so their cells are shared evenly among agents,
+        # and serve them by expected number of targets per cell
+        bounds = interior(self.grid_size)
+        regions = [
+            (region.weight, rect)
+            for region in prior.regions
+            if (rect := clip_rect(region.rect, bounds)) is not None
+        ]
+        total_cells = sum(area(rect) for _, rect in regions)
+        cells_per_agent = max(1, math.ceil(total_cells / self.number_of_agents))
+        for weight, rect in regions:
+            num_parts = math.ceil(area(rect) / cells_per_agent)
+            for part in split_strips(rect, num_parts):
+                self.allocator.add(part, weight / area(rect))
+
+        # Sweep the remainder of the grid once the candidate regions are done
+        for rect in split_strips(bounds, self.number_of_agents):
+            self.allocator.add(rect, 0.0)
+
+        plan = self.assign(range(self.number_of_agents), self.agent_positions)
+        text_plan = "\n".join(
+            f"Region {region.rect} (weight {region.weight}): {region.description}"
+            for region in prior.regions
+        )
+        return text_plan, plan
+
+
+def area(rect) -> int:
+    x1, y1, x2, y2 = rect
+    return (x2 - x1 + 1) * (y2 - y1 + 1)
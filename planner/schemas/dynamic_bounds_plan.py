@@ -1,7 +1,11 @@
+import copy
+from functools import lru_cache
 from typing import Annotated, Union, List, Dict, Literal
-from pydantic import BaseModel, Field, field_serializer
+from pydantic import BaseModel, ConfigDict, Field, create_model, field_serializer
 from typing_extensions import TypeAlias
 
+from .plan import ActionType, MoveAction, Plan, SearchAction, StopAction
+
 # Define dynamic coordinate types using Annotated
 IntCoord: TypeAlias = Annotated[int, Field(ge=0)]  # Default min=0, no max yet
 IntCoordBounded: TypeAlias = Annotated[int, Field(ge=0, le=100)]  # Example placeholder
@@ -17,17 +21,10 @@ class HLA_Move(BaseModel):
     tar_x: IntCoord
     tar_y: IntCoord
 
-    @field_serializer("action", "cur_x", "cur_y", "tar_x", "tar_y")
-    def serialize_to_string(self, value, info):
-        # This serializer is applied to all fields, but we only use it to reconstruct the full string
-        pass  # We'll handle serialization via model_dump_json + custom __str__ or custom json_serializer
-
     def __str__(self):
         return f"move({self.cur_x}, {self.cur_y}, {self.tar_x}, {self.tar_y})"
 
-    @classmethod
-    def model_config(cls):
-        return {"json_schema_extra": {"example": "move(1, 1, 3, 3)"}}
+    model_config = ConfigDict(json_schema_extra={"example": "move(1, 1, 3, 3)"})
 
     # Custom JSON serializer for the entire model
     @field_serializer("action", "cur_x", "cur_y", "tar_x", "tar_y", when_used="json")
@@ -50,9 +47,7 @@ class HLA_Search(BaseModel):
     def __str__(self):
         return f"search({self.cur_x}, {self.cur_y}, {self.x1}, {self.y1}, {self.x2}, {self.y2})"
 
-    @classmethod
-    def model_config(cls):
-        return {"json_schema_extra": {"example": "search(1, 1, 0, 0, 5, 5)"}}
+    model_config = ConfigDict(json_schema_extra={"example": "search(1, 1, 0, 0, 5, 5)"})
 
     @field_serializer(
         "action", "cur_x", "cur_y", "x1", "y1", "x2", "y2", when_used="json"
@@ -67,9 +62,7 @@ class HLA_Stop(BaseModel):
     def __str__(self):
         return "stop()"
 
-    @classmethod
-    def model_config(cls):
-        return {"json_schema_extra": {"example": "stop()"}}
+    model_config = ConfigDict(json_schema_extra={"example": "stop()"})
 
     @field_serializer("action", when_used="json")
     def serialize_hla_stop(self, v, info):
@@ -102,64 +95,132 @@ class AgentHLAList(BaseModel):
     @classmethod
     def create_with_bounds(cls, min_coord: int, max_coord: int) -> type["AgentHLAList"]:
         """
-        Factory method to dynamically create a new AgentHLAList class with updated coordinate bounds.
-        Returns a new class with updated Annotated types.
+        Factory method to create an AgentHLAList class with the given coordinate bounds.
+        Classes are cached per (min_coord, max_coord), so repeated calls are free.
         """
-        global IntCoord, IntCoordBounded
-
-        # Redefine the coordinate type with dynamic bounds
-        IntCoordBounded = Annotated[int, Field(ge=min_coord, le=max_coord)]
-
-        # Rebuild the model with the new type
-        # We need to redefine the HLA types with the new IntCoordBounded
-        class HLA_Move(BaseModel):
-            action: Literal["move"]
-            cur_x: IntCoordBounded
-            cur_y: IntCoordBounded
-            tar_x: IntCoordBounded
-            tar_y: IntCoordBounded
-
-            def __str__(self):
-                return f"move({self.cur_x}, {self.cur_y}, {self.tar_x}, {self.tar_y})"
-
-        class HLA_Search(BaseModel):
-            action: Literal["search"]
-            cur_x: IntCoordBounded
-            cur_y: IntCoordBounded
-            x1: IntCoordBounded
-            y1: IntCoordBounded
-            x2: IntCoordBounded
-            y2: IntCoordBounded
-
-            def __str__(self):
-                return f"search({self.cur_x}, {self.cur_y}, {self.x1}, {self.y1}, {self.x2}, {self.y2})"
-
-        class HLA_Stop(BaseModel):
-            action: Literal["stop"]
-
-            def __str__(self):
-                return "stop()"
-
-        HLA: TypeAlias = Union[HLA_Move, HLA_Search, HLA_Stop]
-
-        class AgentHLA(BaseModel):
-            agent_id: int
-            actions: List[HLA]
-
-            @field_serializer("actions")
-            def serialize_actions(self, actions: List[HLA]) -> List[str]:
-                return [str(action) for action in actions]
-
-        class DynamicAgentHLAList(BaseModel):
-            agents: Dict[int, List[HLA]]
-
-            @field_serializer("agents")
-            def serialize_agents(
-                self, agents: Dict[int, List[HLA]]
-            ) -> Dict[int, List[str]]:
-                return {
-                    agent_id: [str(action) for action in actions]
-                    for agent_id, actions in agents.items()
-                }
-
-        return DynamicAgentHLAList
+        return _agent_hla_list_with_bounds(min_coord, max_coord)
+
+
+@lru_cache(maxsize=None)
+def _agent_hla_list_with_bounds(min_coord: int, max_coord: int) -> type[AgentHLAList]:
+    IntCoordBounded = Annotated[int, Field(ge=min_coord, le=max_coord)]
+
+    # Redefine the HLA types with the bounded coordinate type
+    class HLA_Move(BaseModel):
+        action: Literal["move"]
+        cur_x: IntCoordBounded
+        cur_y: IntCoordBounded
+        tar_x: IntCoordBounded
+        tar_y: IntCoordBounded
+
+        def __str__(self):
+            return f"move({self.cur_x}, {self.cur_y}, {self.tar_x}, {self.tar_y})"
+
+    class HLA_Search(BaseModel):
+        action: Literal["search"]
+        cur_x: IntCoordBounded
+        cur_y: IntCoordBounded
+        x1: IntCoordBounded
+        y1: IntCoordBounded
+        x2: IntCoordBounded
+        y2: IntCoordBounded
+
+        def __str__(self):
+            return f"search({self.cur_x}, {self.cur_y}, {self.x1}, {self.y1}, {self.x2}, {self.y2})"
+
+    class HLA_Stop(BaseModel):
+        action: Literal["stop"]
+
+        def __str__(self):
+            return "stop()"
+
+    HLA: TypeAlias = Union[HLA_Move, HLA_Search, HLA_Stop]
+
+    class DynamicAgentHLAList(BaseModel):
+        agents: Dict[int, List[HLA]]
+
+        @field_serializer("agents")
+        def serialize_agents(
+            self, agents: Dict[int, List[HLA]]
+        ) -> Dict[int, List[str]]:
+            return {
+                agent_id: [str(action) for action in actions]
+                for agent_id, actions in agents.items()
+            }
+
+    return DynamicAgentHLAList
+
+
+# Bounded Plan models ##########################################################
+
+# Plan class -> its JSON schema (with default arguments)
+_json_schemas: Dict[type, dict] = {}
+
+
+class BoundedPlan(Plan):
+    """
+    `Plan` whose JSON schema is generated once per class.
+
+    LangChain regenerates the schema on every `with_structured_output` call,
+    which is the expensive part of binding a schema to a chat model.
+    """
+
+    @classmethod
+    def model_json_schema(cls, *args, **kwargs) -> dict:
+        if args or kwargs:
+            return super().model_json_schema(*args, **kwargs)
+        if cls not in _json_schemas:
+            _json_schemas[cls] = super().model_json_schema()
+        return copy.deepcopy(_json_schemas[cls])
+
+
+@lru_cache(maxsize=None)
+def bounded_plan(min_coord: int, max_coord: int) -> type[BoundedPlan]:
+    """
+    `Plan` model whose action coordinates must lie in [min_coord, max_coord].
+
+    Models are cached per bounds, so planners for the same grid size share one
+    class (and its JSON schema). Actions are subclasses of `MoveAction`,
+    `SearchAction` and `StopAction` with the same names, so the schema seen by
+    the LLM only gains the coordinate bounds.
+    """
+    coord = (Annotated[int, Field(ge=min_coord, le=max_coord)], ...)
+    # A fixed action type per class, otherwise an out-of-bounds move
+    # still validates as a StopAction with action="move"
+    move = create_model(
+        "MoveAction",
+        __base__=MoveAction,
+        action=(Literal[ActionType.MOVE], ActionType.MOVE),
+        cur_x=coord,
+        cur_y=coord,
+        tar_x=coord,
+        tar_y=coord,
+    )
+    search = create_model(
+        "SearchAction",
+        __base__=SearchAction,
+        action=(Literal[ActionType.SEARCH], ActionType.SEARCH),
+        cur_x=coord,
+        cur_y=coord,
+        x1=coord,
+        y1=coord,
+        x2=coord,
+        y2=coord,
+    )
+    stop = create_model(
+        "StopAction",
+        __base__=StopAction,
+        action=(Literal[ActionType.STOP], ActionType.STOP),
+    )
+    return create_model(
+        "Plan",
+        __base__=BoundedPlan,
+        agents=(Dict[int, List[Union[move, search, stop]]], ...),
+    )
+
+
+def bounded_plan_schema(min_coord: int, max_coord: int) -> dict:
+    """
+    Precomputed JSON schema of `bounded_plan(min_coord, max_coord)`.
+    """
+    return bounded_plan(min_coord, max_coord).model_json_schema()
@@ -0,0 +1,25 @@
+from typing import List, Tuple
+
+from pydantic import BaseModel, Field
+
+
+class Region(BaseModel):
+    x1: int = Field(..., ge=0)
+    y1: int = Field(..., ge=0)
+    x2: int = Field(..., ge=0)
+    y2: int = Field(..., ge=0)
+    weight: float = Field(1.0, ge=0, description="Expected number of targets")
+    description: str = ""
+
+    @property
+    def rect(self) -> Tuple[int, int, int, int]:
+        return (
+            min(self.x1, self.x2),
+            min(self.y1, self.y2),
+            max(self.x1, self.x2),
+            max(self.y1, self.y2),
+        )
+
+
+class Prior(BaseModel):
+    regions: List[Region]
@@ -1,14 +1,27 @@
+import logging
 import os
-from typing import Dict, List, Tuple
+from concurrent.futures import Future, ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from typing import Optional, Set, Tuple
 
+from langchain_core.exceptions import OutputParserException
 from langchain_core.language_models.chat_models import BaseChatModel
 from langchain_core.messages.utils import count_tokens_approximately, trim_messages
 from langchain_prompty import create_chat_prompt
+from pydantic import ValidationError
 
 from .base import BasePlanner
-from .schemas.plan import Plan
+from .coverage_planner import CoveragePlanner
+from .schemas.dynamic_bounds_plan import bounded_plan
+from .utils.evaluator import coverage_score, predict_positions
+from .utils.events import EventDetector
 from .utils.tracker import Tracker
 
+logger = logging.getLogger(__name__)
+
+# Structured outputs that do not match the plan schema (e.g. coordinates off the grid)
+INVALID_PLAN_ERRORS = (ValidationError, OutputParserException)
+
 
 class SuperPlanner(BasePlanner):
     llm: BaseChatModel
@@ -17,8 +30,8 @@ class SuperPlanner(BasePlanner):
     number_of_agents: int = -1
     grid_size: int = -1
     number_of_targets: int = -1
-    agent_trajectories: Dict[int, List[Tuple[int, int]]]
-    found_targets = set()
+    events: EventDetector
+    found_targets: Set[Tuple[int, int]]
 
     def __init__(
         self,
@@ -26,14 +39,36 @@ class SuperPlanner(BasePlanner):
         grid_size,
         observations,
         infos,
+        num_candidates: int = 1,
+        speculative_horizon: Optional[int] = None,
+        llm_timeout: Optional[float] = None,
     ) -> None:
         self.llm = llm
+        # Number of plans sampled concurrently per (re)plan, best one is kept
+        self.num_candidates = num_candidates
+        # Prefetch the next plan once an agent has fewer actions left than this
+        self.speculative_horizon = speculative_horizon
+        # Seconds to wait for the LLM before falling back to the coverage planner
+        self.llm_timeout = llm_timeout
+        self.executor = ThreadPoolExecutor(max_workers=2)
+        self.pending: Optional[Future] = None
+        # Background requests from an older generation are stale (see `discard_pending`)
+        self.generation = 0
         self.mission_statement = str(observations[0]["mission"])
         self.number_of_agents = len(observations.keys()) - 1
         self.number_of_targets = observations["global"]["num_goals"]
-        self.agent_trajectories = {i: [(1, 1)] for i in range(0, self.number_of_agents)}
+        # Replan triggers and recent agent trajectories
+        self.events = EventDetector(self.number_of_agents, start=(1, 1))
+        self.found_targets = set()
         self.grid_size = grid_size
+        # Plan model with coordinates bounded by the grid (shared by all planners
+        # for this grid size), bound to the LLM once instead of on every request
+        self.plan_model = bounded_plan(0, grid_size - 1)
+        self.structured_llm = self.llm.with_structured_output(self.plan_model)
         self.tracker = Tracker(grid_size)
+        self.fallback = CoveragePlanner(
+            grid_size, observations, infos, tracker=self.tracker
+        )
         # Load all prompt templates
         self.system_prompt = create_chat_prompt(
             os.getcwd() + "/prompts/super/system.prompty"
@@ -64,94 +99,251 @@ class SuperPlanner(BasePlanner):
             }
         ).messages
         self.history += initial_prompt
-        ai_message = self.llm.invoke(self.history)
+        result = self.request_plan(self.history)
+        if result is None:
+            return self.fallback.initial_plan()
+        ai_message, hla_plan = result
         text_plan = ai_message.content
         self.history.append(ai_message)
-        hla_plan = self.llm.with_structured_output(Plan).invoke(
-            self.history + self.restructure_prompt.invoke({}).messages,
-            config={"temperature": 0.3},
-        )
         # Always restructure into JSON HLAs
         return text_plan, hla_plan.agents
 
     def replan(self, agents, observations, rewards, terminations, truncations, infos):
         del observations["global"]
-        for k, v in observations.items():
-            location = tuple(int(x) for x in v["location"])
-            self.agent_trajectories[k].append(location)
-        # stuck = False
-        # for k, v in self.agent_trajectories.items():
-        #     if v[-1] == v[-2]:
-        #         stuck = True
-        #         break
+        agent_ids = range(self.number_of_agents)
+        events = self.events.observe(
+            [rewards[i] for i in agent_ids],
+            [len(agents.agents[i].action_queue) for i in agent_ids],
+            [observations[i]["location"] for i in agent_ids],
+        )
+        self.tracker.observe(observations, rewards)
 
-        if (
-            any([r == 1 for r in rewards.values()])
-            or any(agents.idle(i) for i in range(self.number_of_agents))
-            # or stuck
-        ):
+        if events.replan:
             reason = ""
-            if any([r == 1 for r in rewards.values()]):
-                found_targets_agents = [k for k, v in rewards.items() if v == 1]
-                found_targets_locations = [
-                    tuple(int(x) for x in observations[i]["location"])
-                    for i in found_targets_agents
-                ]
-                for i, target in zip(found_targets_agents, found_targets_locations):
+            if events.found:
+                for i, target in events.found:
                     reason += f"Agent {i} has found the target at {target}\n"
-
-            elif any(agents.idle(i) for i in range(self.number_of_agents)):
-                idle_agents = [
-                    i for i in range(self.number_of_agents) if agents.idle(i)
-                ]
-                reason = f"The following agents are idle: {str(idle_agents)}"
+            else:
+                reason = f"The following agents are idle: {str(events.idle)}"
 
             # print(f"Re-planning due to: {reason}")
 
             # Re-plan when a target is found
-            found_targets_agents = [k for k, v in rewards.items() if v == 1]
-            found_targets_locations = [
-                tuple(int(x) for x in observations[i]["location"])
-                for i in found_targets_agents
-            ]
-            self.found_targets.update(found_targets_locations)
-            agent_locations = {
-                k: tuple(int(x) for x in v["location"]) for k, v in observations.items()
-            }
+            self.found_targets.update(target for _, target in events.found)
+            agent_locations = self.events.positions()
 
-            truncated_history = trim_messages(
-                self.history,
-                include_system=True,
-                max_tokens=20000,
-                token_counter=count_tokens_approximately,
-            )
-            replan_prompt = self.replan_prompt.invoke(
-                {
-                    "reason": reason,
-                    "targets_found": self.found_targets,
-                    "agent_locations": agent_locations,
+            result, timed_out = None, False
+            if self.pending is not None:
+                if events.found:
+                    # A target was found, the speculative plan is stale
+                    self.discard_pending()
+                else:
+                    try:
+                        result = self.pending.result(timeout=self.llm_timeout)
+                    except FutureTimeoutError:
+                        self.discard_pending()
+                        timed_out = True
+                    except Exception as e:
+                        logger.info(f"Speculative replan failed, reissuing: {e}")
+                self.pending = None
+
+            if result is None and not timed_out:
+                messages = self.replan_messages(reason, agent_locations)
+                queues = {
+                    k: list(agent.action_queue) for k, agent in agents.agents.items()
                 }
-            ).messages
-            truncated_history += replan_prompt
-            ai_message = self.llm.invoke(truncated_history)
+                result = self.request_plan(messages, agent_locations, queues)
+            if result is None:
+                return self.fallback_plan(agents, agent_locations)
+            ai_message, hla_plan = result
             text_plan = ai_message.content
             self.history.append(ai_message)
-            truncated_history.append(ai_message)
-            hla_plan = self.llm.with_structured_output(Plan).invoke(
-                truncated_history + self.restructure_prompt.invoke({}).messages,
-                config={"temperature": 0.3},
-            )
             # Always restructure into JSON HLAs
             return text_plan, hla_plan.agents
 
-        self.tracker.observe(observations, rewards)
+        if (
+            self.speculative_horizon is not None
+            and self.pending is None
+            and any(
+                len(agent.action_queue) < self.speculative_horizon
+                for agent in agents.agents.values()
+            )
+        ):
+            self.speculate(agents)
+
         return "", {}
 
+    def speculate(self, agents):
+        """
+        Request the next plan in the background, as it would be requested
+        once the agents with the shortest queues go idle.
+        """
+        positions = self.events.positions()
+        agent_locations = predict_positions(agents, self.tracker, positions)
+        idle_agents = [
+            k
+            for k, agent in agents.agents.items()
+            if len(agent.action_queue) < self.speculative_horizon
+        ]
+        reason = f"The following agents are idle: {str(idle_agents)}"
+        messages = self.replan_messages(reason, agent_locations)
+        self.pending = self.submit_plan(messages, agent_locations)
+
+    def replan_messages(self, reason, agent_locations):
+        truncated_history = trim_messages(
+            self.history,
+            include_system=True,
+            max_tokens=20000,
+            token_counter=count_tokens_approximately,
+        )
+        replan_prompt = self.replan_prompt.invoke(
+            {
+                "reason": reason,
+                "targets_found": set(self.found_targets),
+                "agent_locations": agent_locations,
+            }
+        ).messages
+        return truncated_history + replan_prompt
+
+    def request_plan(self, messages, positions=None, queues=None):
+        """
+        Sample a plan, or return None if the LLM does not answer within
+        `llm_timeout` or only returns invalid plans.
+        """
+        if self.llm_timeout is None:
+            return self.sample_plan(messages, positions, queues)
+        future = self.submit_plan(messages, positions, queues)
+        try:
+            return future.result(timeout=self.llm_timeout)
+        except FutureTimeoutError:
+            future.cancel()
+            self.generation += 1
+            logger.info(f"LLM did not answer within {self.llm_timeout}s, falling back")
+            return None
+
+    def submit_plan(self, messages, positions=None, queues=None) -> Future:
+        """
+        Run `sample_plan` in the background on a snapshot of the planner state
+        (messages, agent positions and tracker map), so that later steps do not
+        change what the request sees.
+        """
+        if positions is None:
+            positions = self.events.positions()
+        return self.executor.submit(
+            self.sample_plan,
+            list(messages),
+            positions,
+            queues,
+            tracker=self.tracker.copy(),
+            generation=self.generation,
+        )
+
+    def discard_pending(self):
+        """
+        Discard the speculative request. A request that is already running cannot
+        be interrupted, so it is marked stale instead: it stops after its current
+        LLM call and its result is dropped, freeing the worker.
+        """
+        if self.pending is not None:
+            self.pending.cancel()
+            self.pending = None
+        self.generation += 1
+
+    def close(self):
+        """
+        Discard pending requests and shut down the background workers.
+        """
+        self.discard_pending()
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+    def fallback_plan(self, agents, agent_locations):
+        """
+        Assign the idle agents a region with the LLM-free coverage planner.
+        """
+        idle_agents = [i for i in range(self.number_of_agents) if agents.idle(i)]
+        if not idle_agents:
+            return "", {}
+        busy_agents = [i for i in range(self.number_of_agents) if not agents.idle(i)]
+        plan = self.fallback.assign(idle_agents, agent_locations, busy_agents)
+        return self.fallback.describe(plan), plan
+
+    def sample_plan(
+        self, messages, positions=None, queues=None, tracker=None, generation=None
+    ):
+        """
+        Request a textual plan and restructure it into HLAs.
+
+        With `num_candidates` > 1, k plans are requested concurrently and the one
+        covering the most unvisited cells of the tracker map is returned.
+        Plans with coordinates outside the grid fail validation like any other
+        invalid structured output (see `bounded_plan`). Invalid candidates are
+        dropped, and None is returned if no valid plan is left.
+
+        Background requests pass a `tracker` snapshot and their `generation`,
+        and return None as soon as they notice they have become stale.
+        """
+        if tracker is None:
+            tracker = self.tracker
+        restructure = self.restructure_prompt.invoke({}).messages
+        structured_llm = self.structured_llm
+        if self.num_candidates <= 1:
+            ai_message = self.llm.invoke(messages)
+            if self.is_stale(generation):
+                return None
+            try:
+                hla_plan = structured_llm.invoke(
+                    messages + [ai_message] + restructure,
+                    config={"temperature": 0.3},
+                )
+            except INVALID_PLAN_ERRORS as e:
+                logger.info(f"Invalid plan, falling back: {e}")
+                return None
+            if self.is_stale(generation):
+                return None
+            return ai_message, hla_plan
+
+        k = self.num_candidates
+        ai_messages = self.llm.batch([messages] * k, config={"max_concurrency": k})
+        if self.is_stale(generation):
+            return None
+        hla_plans = structured_llm.batch(
+            [messages + [ai_message] + restructure for ai_message in ai_messages],
+            config={"temperature": 0.3, "max_concurrency": k},
+            return_exceptions=True,
+        )
+
+        if positions is None:
+            positions = self.events.positions()
+        best, best_score = None, None
+        for i, (ai_message, hla_plan) in enumerate(zip(ai_messages, hla_plans)):
+            if isinstance(hla_plan, Exception):
+                logger.info(f"Candidate {i}: invalid plan ({hla_plan})")
+                continue
+            covered, makespan = coverage_score(
+                hla_plan.agents, tracker, positions, queues
+            )
+            logger.info(f"Candidate {i}: covered={covered} makespan={makespan}")
+            score = (covered, -makespan)
+            if best_score is None or score > best_score:
+                best, best_score = (ai_message, hla_plan), score
+
+        if best is None:
+            for error in hla_plans:
+                if not isinstance(error, INVALID_PLAN_ERRORS):
+                    raise error
+            logger.info("No valid candidate plan, falling back")
+            return None
+        if self.is_stale(generation):
+            return None
+        return best
+
+    def is_stale(self, generation) -> bool:
+        return generation is not None and generation != self.generation
+
     def restructure_text_plan(self, text_plan) -> dict:
         # Convert the textual plan into structured instructions
         prompt = create_chat_prompt(os.getcwd() + "/prompts/plan_structurer.prompty")
-        model_with_structure = self.llm.with_structured_output(Plan)
-        plan_structurer = prompt | model_with_structure
+        plan_structurer = prompt | self.structured_llm
         plan = plan_structurer.invoke(
             {
                 "grid_length": self.grid_size,
@@ -0,0 +1,187 @@
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from ..schemas.plan import SearchAction
+from .tracker import Tracker
+
+# Inclusive rectangle (x1, y1, x2, y2), with x1 <= x2 and y1 <= y2
+Rect = Tuple[int, int, int, int]
+
+UNVISITED = 0
+VISITED = 1
+
+
+def interior(grid_size: int) -> Rect:
+    """
+    Rectangle of all cells inside the surrounding walls.
+    """
+    return (1, 1, grid_size - 2, grid_size - 2)
+
+
+def clip_rect(rect: Rect, bounds: Rect) -> Optional[Rect]:
+    """
+    Intersect `rect` with `bounds`, or return None if they do not overlap.
+    """
+    x1 = max(min(rect[0], rect[2]), bounds[0])
+    y1 = max(min(rect[1], rect[3]), bounds[1])
+    x2 = min(max(rect[0], rect[2]), bounds[2])
+    y2 = min(max(rect[1], rect[3]), bounds[3])
+    if x1 > x2 or y1 > y2:
+        return None
+    return (x1, y1, x2, y2)
+
+
+def split_strips(rect: Rect, n: int) -> List[Rect]:
+    """
+    Split a rectangle into `n` vertical strips of (almost) equal width
+    for boustrophedon coverage. Fewer strips are returned if the rectangle
+    is narrower than `n` cells.
+    """
+    x1, y1, x2, y2 = rect
+    edges = np.linspace(x1, x2 + 1, min(n, x2 - x1 + 1) + 1).round().astype(int)
+    return [(int(a), y1, int(b) - 1, y2) for a, b in zip(edges[:-1], edges[1:])]
+
+
+def split_rows(rect: Rect) -> Tuple[Rect, Optional[Rect]]:
+    """
+    Split a rectangle into its top and bottom halves.
+    """
+    x1, y1, x2, y2 = rect
+    if y1 == y2:
+        return rect, None
+    mid = (y1 + y2) // 2
+    return (x1, y1, x2, mid), (x1, mid + 1, x2, y2)
+
+
+def unvisited_bbox(grid: np.ndarray, rect: Rect) -> Optional[Rect]:
+    """
+    Bounding box of the unvisited cells of the coverage map within `rect`.
+    """
+    x1, y1, x2, y2 = rect
+    mask = grid[x1 : x2 + 1, y1 : y2 + 1] == UNVISITED
+    xs = np.flatnonzero(mask.any(axis=1))
+    if len(xs) == 0:
+        return None
+    ys = np.flatnonzero(mask.any(axis=0))
+    return (x1 + int(xs[0]), y1 + int(ys[0]), x1 + int(xs[-1]), y1 + int(ys[-1]))
+
+
+def num_unvisited(grid: np.ndarray, rect: Rect) -> int:
+    x1, y1, x2, y2 = rect
+    return int(np.count_nonzero(grid[x1 : x2 + 1, y1 : y2 + 1] == UNVISITED))
+
+
+def search(position: Tuple[int, int], rect: Rect) -> SearchAction:
+    x1, y1, x2, y2 = rect
+    return SearchAction(
+        cur_x=position[0], cur_y=position[1], x1=x1, y1=y1, x2=x2, y2=y2
+    )
+
+
+class RegionAllocator:
+    """
+    Hands out rectangular search regions to idle agents, using the
+    `Tracker` coverage map to skip and shrink regions that were already swept.
+
+    Regions are served by decreasing weight, then by distance to the agent.
+    Once no queued region is left, the unvisited remainder of the grid
+    is split among the idle agents, or the region of a busy agent is shared.
+    """
+
+    def __init__(self, tracker: Tracker, grid_size: int) -> None:
+        self.tracker = tracker
+        self.bounds = interior(grid_size)
+        self.pending: List[Tuple[float, Rect]] = []
+        self.assigned: Dict[int, Rect] = {}
+
+    def add(self, rect: Rect, weight: float = 1.0) -> None:
+        rect = clip_rect(rect, self.bounds)
+        if rect is not None:
+            self.pending.append((weight, rect))
+
+    def assign(
+        self,
+        agent_ids: Iterable[int],
+        positions: Dict[int, Tuple[int, int]],
+        busy: Iterable[int] = (),
+    ) -> Dict[int, list]:
+        """
+        Assign a search region to each of the given (idle) agents.
+
+        Returns a plan mapping agent id to a list of HLAs. Busy agents may
+        appear in the plan too, when their region is split with an idle agent.
+        """
+        grid = self.tracker.grid
+        busy = [i for i in busy if i in self.assigned]
+        for i in list(self.assigned):
+            if i not in busy:
+                del self.assigned[i]
+
+        plan = {}
+        idle = []
+        for i in agent_ids:
+            rect = self.next_region(positions[i])
+            if rect is None:
+                idle.append(i)
+                continue
+            self.assigned[i] = rect
+            plan[i] = [search(positions[i], rect)]
+
+        if not idle:
+            return plan
+
+        # Split the unvisited remainder among the agents that got nothing
+        remaining = grid.copy()
+        for x1, y1, x2, y2 in self.assigned.values():
+            remaining[x1 : x2 + 1, y1 : y2 + 1] = VISITED
+        rect = unvisited_bbox(remaining, self.bounds)
+        if rect is not None:
+            for i, strip in zip(idle, split_strips(rect, len(idle))):
+                strip = unvisited_bbox(grid, strip)
+                if strip is not None:
+                    self.assigned[i] = strip
+                    plan[i] = [search(positions[i], strip)]
+            return plan
+
+        # Everything left is being swept, share the largest region
+        for i in idle:
+            candidates = [
+                (num_unvisited(grid, r), j, r)
+                for j, r in self.assigned.items()
+                if j in busy and j not in plan
+            ]
+            if not candidates:
+                break
+            count, j, rect = max(candidates)
+            rect = unvisited_bbox(grid, rect)
+            if count < 2 or rect is None:
+                break
+            top, bottom = split_rows(rect)
+            if bottom is None:
+                break
+            self.assigned[j], self.assigned[i] = top, bottom
+            plan[j] = [search(positions[j], top)]
+            plan[i] = [search(positions[i], bottom)]
+        return plan
+
+    def next_region(self, position: Tuple[int, int]) -> Optional[Rect]:
+        """
+        Pop the best pending region for an agent at `position`,
+        shrunk to the cells that are still unvisited.
+        """
+        grid = self.tracker.grid
+        candidates = []
+        for weight, rect in self.pending:
+            shrunk = unvisited_bbox(grid, rect)
+            if shrunk is not None:
+                distance = abs(shrunk[0] - position[0]) + abs(shrunk[1] - position[1])
+                candidates.append((-weight, distance, shrunk, rect))
+
+        if not candidates:
+            self.pending.clear()
+            return None
+
+        _, _, shrunk, rect = min(candidates)
+        self.pending = [(-w, r) for w, _, _, r in candidates if r != rect]
+        return shrunk
@@ -0,0 +1,138 @@
+from typing import Dict, List, Optional, Tuple
+
+import numba as nb
+import numpy as np
+
+from agents import AgentCollection, BaseAgent
+
+from .tracker import Tracker
+
+# Tracker cell values
+UNVISITED = 0
+WALL = 7
+
+# (dx, dy) for each ActionUpDown value, indexed by action
+ACTION_DELTAS = np.array(
+    [
+        [-1, 0],  # left
+        [1, 0],  # right
+        [0, -1],  # up
+        [0, 1],  # down
+        [0, 0],  # pickup
+        [0, 0],  # drop
+        [0, 0],  # toggle
+        [0, 0],  # done
+    ],
+    dtype=np.int64,
+)
+
+
+def expand_plan(plan: Dict[int, list]) -> Dict[int, List[int]]:
+    """
+    Expand a structured plan into low-level action queues,
+    using the same HLA semantics as `BaseAgent`.
+    """
+    queues = {}
+    for agent_id, actions in plan.items():
+        agent = BaseAgent(agent_id)
+        for action in actions:
+            agent.tell_action(action)
+        queues[agent_id] = agent.action_queue
+    return queues
+
+
+@nb.njit(cache=True)
+def simulate_coverage(
+    grid: np.ndarray,
+    starts: np.ndarray,
+    moves: np.ndarray,
+    lengths: np.ndarray,
+    deltas: np.ndarray,
+    horizon: int,
+):
+    """
+    Replay action queues from the given start positions and count how many
+    unvisited cells of the coverage map are stepped on.
+
+    Moves into walls are blocked, as they are in the environment.
+    Returns the number of newly covered cells, the makespan and the
+    final position of each agent.
+    """
+    covered = np.zeros(grid.shape, dtype=np.bool_)
+    ends = starts.copy()
+    num_new = 0
+    makespan = 0
+    for agent in range(moves.shape[0]):
+        x, y = starts[agent, 0], starts[agent, 1]
+        steps = min(lengths[agent], horizon)
+        for t in range(steps):
+            nx = x + deltas[moves[agent, t], 0]
+            ny = y + deltas[moves[agent, t], 1]
+            if 0 <= nx < grid.shape[0] and 0 <= ny < grid.shape[1]:
+                if grid[nx, ny] != WALL:
+                    x, y = nx, ny
+            if grid[x, y] == UNVISITED and not covered[x, y]:
+                covered[x, y] = True
+                num_new += 1
+        ends[agent, 0], ends[agent, 1] = x, y
+        makespan = max(makespan, steps)
+    return num_new, makespan, ends
+
+
+def replay(
+    queues: Dict[int, List[int]],
+    tracker: Tracker,
+    positions: Dict[int, Tuple[int, int]],
+    horizon: Optional[int] = None,
+):
+    """
+    Pack the action queues into arrays and run `simulate_coverage`.
+    """
+    agent_ids = [i for i in queues if i in positions]
+    lengths = np.array([len(queues[i]) for i in agent_ids], dtype=np.int64)
+    moves = np.zeros((len(agent_ids), lengths.max(initial=1)), dtype=np.int64)
+    for row, i in enumerate(agent_ids):
+        moves[row, : lengths[row]] = queues[i]
+    starts = np.array([positions[i] for i in agent_ids], dtype=np.int64)
+    starts = starts.reshape(-1, 2)
+
+    if horizon is None:
+        horizon = tracker.grid.size
+    num_new, makespan, ends = simulate_coverage(
+        tracker.grid, starts, moves, lengths, ACTION_DELTAS, horizon
+    )
+    ends = {i: (int(ends[row, 0]), int(ends[row, 1])) for row, i in enumerate(agent_ids)}
+    return num_new, makespan, ends
+
+
+def coverage_score(
+    plan: Dict[int, list],
+    tracker: Tracker,
+    positions: Dict[int, Tuple[int, int]],
+    queues: Optional[Dict[int, List[int]]] = None,
+) -> Tuple[int, int]:
+    """
+    Score a candidate plan by the number of unvisited cells its trajectories cover.
+
+    Agents that are not part of the plan keep executing their current queue
+    (if `queues` is given), so overlap with their sweeps is not rewarded.
+    Returns (newly covered cells, makespan); higher coverage is better,
+    ties are broken by the shorter makespan.
+    """
+    plan_queues = expand_plan(plan)
+    for name, queue in (queues or {}).items():
+        plan_queues.setdefault(name, queue)
+    num_new, makespan, _ = replay(plan_queues, tracker, positions)
+    return num_new, makespan
+
+
+def predict_positions(
+    agents: AgentCollection,
+    tracker: Tracker,
+    positions: Dict[int, Tuple[int, int]],
+) -> Dict[int, Tuple[int, int]]:
+    """
+    Predict where each agent will be once its current action queue is exhausted.
+    """
+    queues = {name: list(agent.action_queue) for name, agent in agents.agents.items()}
+    return replay(queues, tracker, positions)[2]
@@ -0,0 +1,111 @@
+from typing import List, NamedTuple, Tuple
+
+import numpy as np
+
+# Agent index and the (x, y) position where it found a target
+Found = Tuple[int, Tuple[int, int]]
+
+
+class Events(NamedTuple):
+    """
+    Replanning events detected in one step (or one segment of steps).
+    """
+
+    found: List[Found]
+    idle: List[int]
+
+    @property
+    def replan(self) -> bool:
+        return bool(self.found or self.idle)
+
+
+class EventDetector:
+    """
+    Detect replanning events from per-agent arrays, and keep the recent
+    trajectory of each agent in a fixed-size ring buffer.
+
+    Examples
+    --------
+    >>> events = EventDetector(2, capacity=3)
+    >>> events.observe([-1, 1], [4, 0], [(2, 1), (5, 5)])
+    Events(found=[(1, (5, 5))], idle=[1])
+
+    Older positions are overwritten once the buffer is full:
+
+    >>> for x in (3, 4, 5):
+    ...     _ = events.observe([-1, -1], [3, 1], [(x, 1), (5, 5)])
+    >>> events.trajectory(0).tolist(), events.positions()
+    ([[3, 1], [4, 1], [5, 1]], {0: (5, 1), 1: (5, 5)})
+
+    A segment of steps, longer than the buffer:
+
+    >>> rewards = [[-1, -1]] * 3 + [[1, -1]]
+    >>> positions = [[(x, 1), (5, 5)] for x in (6, 7, 8, 9)]
+    >>> events.observe(rewards, [2, 0], positions)
+    Events(found=[(0, (9, 1))], idle=[1])
+    >>> events.trajectory(0).tolist()
+    [[7, 1], [8, 1], [9, 1]]
+    """
+
+    def __init__(self, num_agents: int, capacity: int = 256, start=(1, 1)) -> None:
+        self.num_agents = num_agents
+        self.capacity = capacity
+        self.trajectories = np.empty((num_agents, capacity, 2), dtype=np.int16)
+        self.trajectories[:, 0] = start
+        self.count = 1
+
+    def observe(self, rewards, queue_lengths, positions) -> Events:
+        """
+        Record the positions of all agents and return the detected events.
+
+        `rewards` has shape (num_agents,) and `positions` (num_agents, 2) for
+        one step, or (steps, num_agents) and (steps, num_agents, 2) for a
+        segment of steps. `queue_lengths` are the numbers of actions left
+        after the last step.
+        """
+        rewards = np.asarray(rewards)
+        positions = np.asarray(positions, dtype=np.int16)
+        if rewards.ndim == 1:
+            self.trajectories[:, self.count % self.capacity] = positions
+            self.count += 1
+            rewards, positions = rewards[None], positions[None]
+        else:
+            self.record(positions)
+
+        # Only locate events when there are any (the common step has none)
+        found, idle = [], []
+        hits = rewards == 1
+        if np.count_nonzero(hits):
+            steps, agents = np.nonzero(hits)
+            found = [
+                (int(i), (int(positions[t, i, 0]), int(positions[t, i, 1])))
+                for t, i in zip(steps.tolist(), agents.tolist())
+            ]
+        queue_lengths = np.asarray(queue_lengths)
+        if np.count_nonzero(queue_lengths) < len(queue_lengths):
+            idle = np.flatnonzero(queue_lengths == 0).tolist()
+        return Events(found, idle)
+
+    def record(self, positions: np.ndarray) -> None:
+        """
+        Append a (steps, num_agents, 2) array of positions to the trajectories.
+        """
+        self.count += len(positions)
+        positions = positions[-self.capacity :]
+        index = (self.count - len(positions) + np.arange(len(positions))) % self.capacity
+        self.trajectories[:, index] = positions.transpose(1, 0, 2)
+
+    def positions(self) -> dict:
+        """
+        Last recorded (x, y) position of each agent.
+        """
+        last = self.trajectories[:, (self.count - 1) % self.capacity].tolist()
+        return {i: (x, y) for i, (x, y) in enumerate(last)}
+
+    def trajectory(self, i: int) -> np.ndarray:
+        """
+        Recorded positions of agent `i`, oldest first (at most `capacity`).
+        """
+        n = min(self.count, self.capacity)
+        index = (self.count - n + np.arange(n)) % self.capacity
+        return self.trajectories[i, index]
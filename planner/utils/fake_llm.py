@@ -0,0 +1,218 @@
+import ast
+import asyncio
+import json
+import re
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, BaseMessage
+from langchain_core.messages.utils import count_tokens_approximately
+from langchain_core.outputs import ChatGeneration, ChatResult
+from langchain_core.runnables import RunnableLambda
+from pydantic import BaseModel, PrivateAttr
+
+from ..schemas.plan import Plan
+from ..schemas.prior import Prior, Region
+from .allocator import interior, search, split_strips
+
+GRID_SIZE = re.compile(r"^N=(\d+)", re.MULTILINE)
+NUM_AGENTS = re.compile(r"^M=(\d+)", re.MULTILINE)
+AGENT_LOCATIONS = re.compile(r"agent_locations: (\{.*\})")
+IDLE_AGENTS = re.compile(r"agents are idle: (\[.*\])")
+NUM_TARGETS = re.compile(r"^T=(\d+)", re.MULTILINE)
+MISSION_RECTS = re.compile(r"\((\d+), *(\d+)\) to \((\d+), *(\d+)\)")
+
+
+class FakePlanChatModel(BaseChatModel):
+    """
+    Offline stand-in for the chat models in `models.py`.
+
+    Structured plans are either replayed from `plans` (in order, cycling),
+    or generated from the grid geometry found in the planner prompts:
+    every agent sweeps one vertical strip of the grid interior, and idle
+    agents are handed the next strip in turn. A mission `Prior` covers
+    the rectangles named in the mission, or else the grid interior, and
+    other schemas get their field defaults. Plans are validated against the
+    requested schema, so replayed plans off the grid raise ValidationError. Every call sleeps for
+    `latency` seconds and reports approximate token usage.
+    """
+
+    grid_size: Optional[int] = None
+    num_agents: Optional[int] = None
+    plans: List[Plan] = []
+    latency: float = 0.0
+
+    _lock: threading.Lock = PrivateAttr(default_factory=threading.Lock)
+    _calls: int = PrivateAttr(default=0)
+    _next_plan: int = PrivateAttr(default=0)
+    _next_strip: int = PrivateAttr(default=0)
+    _usage: Dict[str, int] = PrivateAttr(
+        default_factory=lambda: {"input_tokens": 0, "output_tokens": 0}
+    )
+
+    @classmethod
+    def from_jsonl(cls, path: str, **kwargs) -> "FakePlanChatModel":
+        """
+        Replay plans recorded one JSON object per line, e.g.
+        ``{"agents": {"0": [{"action": "search", "cur_x": 1, ...}]}}``.
+        """
+        with open(path) as f:
+            plans = [Plan.model_validate(json.loads(line)) for line in f if line.strip()]
+        return cls(plans=plans, **kwargs)
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-plan"
+
+    @property
+    def usage(self) -> Dict[str, int]:
+        """
+        Total approximate token usage of all calls so far.
+        """
+        with self._lock:
+            return dict(self._usage, calls=self._calls)
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        time.sleep(self.latency)
+        return self._result(messages)
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        await asyncio.sleep(self.latency)
+        return self._result(messages)
+
+    def with_structured_output(self, schema, *, include_raw: bool = False, **kwargs):
+        if isinstance(schema, type) and issubclass(schema, Plan):
+            # Validate against the bound schema (e.g. `bounded_plan`) like a real
+            # provider's structured output, so invalid plans raise ValidationError
+            generate = lambda messages: schema.model_validate(
+                {
+                    "agents": {
+                        i: [dict(action) for action in actions]
+                        for i, actions in self._plan(messages).agents.items()
+                    }
+                }
+            )
+        elif isinstance(schema, type) and issubclass(schema, Prior):
+            generate = self._prior
+        elif isinstance(schema, type) and issubclass(schema, BaseModel):
+            # Any other schema: its field defaults, without validation
+            generate = lambda messages: schema.model_construct()
+        else:
+            generate = lambda messages: {}
+
+        def structured(input: Any) -> Any:
+            messages = self._convert_input(input).to_messages()
+            time.sleep(self.latency)
+            parsed = generate(messages)
+            if isinstance(parsed, BaseModel):
+                raw = AIMessage(content=parsed.model_dump_json())
+            else:
+                raw = AIMessage(content=json.dumps(parsed))
+            self._account(messages, raw)
+            if include_raw:
+                return {"raw": raw, "parsed": parsed, "parsing_error": None}
+            return parsed
+
+        return RunnableLambda(structured)
+
+    def _result(self, messages: List[BaseMessage]) -> ChatResult:
+        plan = self._plan(messages, peek=True)
+        content = "\n".join(
+            f"Agent {i}: " + ", ".join(action.serialize() for action in actions)
+            for i, actions in plan.agents.items()
+        )
+        message = AIMessage(content=content)
+        self._account(messages, message)
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _account(self, messages: List[BaseMessage], reply: AIMessage) -> None:
+        input_tokens = count_tokens_approximately(messages)
+        output_tokens = count_tokens_approximately([reply])
+        reply.usage_metadata = {
+            "input_tokens": input_tokens,
+            "output_tokens": output_tokens,
+            "total_tokens": input_tokens + output_tokens,
+        }
+        with self._lock:
+            self._calls += 1
+            self._usage["input_tokens"] += input_tokens
+            self._usage["output_tokens"] += output_tokens
+
+    def _plan(self, messages: List[BaseMessage], peek: bool = False) -> Plan:
+        """
+        Next recorded plan, or a plan generated from the prompts. With `peek`,
+        the plan is returned without advancing the replay or strip rotation,
+        so the text answer matches the structured plan that follows it.
+        """
+        with self._lock:
+            if self.plans:
+                plan = self.plans[self._next_plan % len(self.plans)]
+                if not peek:
+                    self._next_plan += 1
+                return plan
+            grid_size, num_agents, locations, idle = self._parse(messages)
+            strips = split_strips(interior(grid_size), num_agents)
+            if idle is None:
+                # Initial plan: one strip per agent
+                agent_ids, first = list(range(num_agents)), 0
+            else:
+                agent_ids, first = idle, self._next_strip
+            plan = {}
+            for k, i in enumerate(agent_ids):
+                rect = strips[(first + k) % len(strips)]
+                plan[i] = [search(locations.get(i, (1, 1)), rect)]
+            if not peek and idle is not None:
+                self._next_strip = (first + len(agent_ids)) % len(strips)
+            return Plan(agents=plan)
+
+    def _prior(self, messages: List[BaseMessage]) -> Prior:
+        """
+        Prior over the rectangles named in the mission (e.g. "from (3, 3) to (5, 5)"),
+        or over the whole grid interior, sharing the targets evenly among them.
+        """
+        grid_size, _, _, _ = self._parse(messages)
+        num_targets, rects = 1, []
+        for message in messages:
+            if message.type == "system":
+                continue
+            text = message.text if isinstance(message.text, str) else message.text()
+            if match := NUM_TARGETS.search(text):
+                num_targets = int(match.group(1))
+            rects += [tuple(map(int, match)) for match in MISSION_RECTS.findall(text)]
+        rects = rects or [interior(grid_size)]
+        weight = num_targets / len(rects)
+        return Prior(
+            regions=[
+                Region(x1=x1, y1=y1, x2=x2, y2=y2, weight=weight, description="mission")
+                for x1, y1, x2, y2 in rects
+            ]
+        )
+
+    def _parse(
+        self, messages: List[BaseMessage]
+    ) -> Tuple[int, int, Dict[int, Tuple[int, int]], Optional[List[int]]]:
+        """
+        Recover the grid geometry from the most recent planner prompts.
+        """
+        grid_size, num_agents, locations, idle = None, None, {}, None
+        for message in messages:
+            if message.type == "system":
+                continue
+            text = message.text if isinstance(message.text, str) else message.text()
+            if match := GRID_SIZE.search(text):
+                grid_size = int(match.group(1))
+            if match := NUM_AGENTS.search(text):
+                num_agents = int(match.group(1))
+            if match := AGENT_LOCATIONS.search(text):
+                locations = ast.literal_eval(match.group(1))
+            if "Reason for re-planning" in text:
+                match = IDLE_AGENTS.search(text)
+                idle = ast.literal_eval(match.group(1)) if match else []
+        grid_size = self.grid_size or grid_size
+        num_agents = self.num_agents or num_agents
+        if grid_size is None or num_agents is None:
+            raise ValueError("Grid size and number of agents not found in the prompt")
+        locations = {int(i): tuple(int(v) for v in pos) for i, pos in locations.items()}
+        return grid_size, num_agents, locations, idle
@@ -0,0 +1,353 @@
+import asyncio
+import json
+import random
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+from email.utils import parsedate_to_datetime
+from typing import Dict, List, Optional, Tuple
+
+import httpx
+
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+# Rough size of a token in bytes of request JSON
+BYTES_PER_TOKEN = 4
+
+
+class TokenBucket:
+    """
+    Token bucket refilled continuously at `per_minute` tokens per minute,
+    holding at most one minute worth of tokens.
+
+    `reserve` never blocks: it takes the tokens (the level may go negative)
+    and returns how long the caller has to wait before using them, so the
+    same bucket works for threads and event loops.
+    """
+
+    def __init__(self, per_minute: float) -> None:
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.level = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def reserve(self, amount: float) -> float:
+        with self.lock:
+            now = time.monotonic()
+            self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+            self.updated = now
+            self.level -= min(amount, self.capacity)
+            return max(0.0, -self.level / self.rate)
+
+
+class RateLimiter:
+    """
+    Admission control and retry policy shared by all LLM HTTP clients.
+
+    The in-flight limit is shared by synchronous and asynchronous clients:
+    threads wait on a condition variable, coroutines on a future of their own
+    event loop (so the limiter works with any number of loops).
+
+    Parameters
+    ----------
+    max_in_flight : int
+        Maximum number of concurrent requests
+    rpm : float or None
+        Requests per minute (unlimited if None)
+    tpm : float or None
+        Tokens per minute (unlimited if None). Requests are charged with an
+        estimate of their prompt size plus their completion token limit.
+    max_retries : int
+        Number of retries on 429/5xx responses and connection errors
+    backoff : float
+        Base delay in seconds of the exponential backoff (full jitter)
+    max_backoff : float
+        Maximum delay in seconds between retries
+    """
+
+    def __init__(
+        self,
+        max_in_flight: int = 8,
+        rpm: Optional[float] = None,
+        tpm: Optional[float] = None,
+        max_retries: int = 5,
+        backoff: float = 1.0,
+        max_backoff: float = 60.0,
+    ) -> None:
+        self.max_in_flight = max_in_flight
+        self.in_flight = 0
+        self.slot_freed = threading.Condition()
+        self.async_waiters: List[Tuple[asyncio.AbstractEventLoop, asyncio.Future]] = []
+        self.requests = TokenBucket(rpm) if rpm else None
+        self.tokens = TokenBucket(tpm) if tpm else None
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.lock = threading.Lock()
+        self.reset_stats()
+
+    def reset_stats(self) -> None:
+        with self.lock:
+            self._stats = {
+                "llm_requests": 0,
+                "llm_retries": 0,
+                "llm_failures": 0,
+                "llm_queue_wait_s": 0.0,
+                "llm_service_s": 0.0,
+            }
+
+    def stats(self) -> Dict[str, float]:
+        """
+        Totals since the last reset. Queue wait (concurrency limit, rate limits
+        and retry backoff) is reported separately from service time.
+        """
+        with self.lock:
+            return dict(self._stats)
+
+    def record(self, **values) -> None:
+        with self.lock:
+            for name, value in values.items():
+                self._stats[name] += value
+
+    @contextmanager
+    def slot(self):
+        """
+        Hold one of the `max_in_flight` request slots (blocking the thread).
+        """
+        with self.slot_freed:
+            while self.in_flight >= self.max_in_flight:
+                self.slot_freed.wait()
+            self.in_flight += 1
+        try:
+            yield
+        finally:
+            self.release()
+
+    @asynccontextmanager
+    async def async_slot(self):
+        """
+        Hold one of the `max_in_flight` request slots (suspending the coroutine).
+        """
+        loop = asyncio.get_running_loop()
+        while True:
+            with self.slot_freed:
+                if self.in_flight < self.max_in_flight:
+                    self.in_flight += 1
+                    break
+                waiter = loop.create_future()
+                self.async_waiters.append((loop, waiter))
+            await waiter
+        try:
+            yield
+        finally:
+            self.release()
+
+    def release(self) -> None:
+        """
+        Free a request slot and wake up the threads and coroutines waiting for one
+        (they compete for it again).
+        """
+        with self.slot_freed:
+            self.in_flight -= 1
+            self.slot_freed.notify()
+            waiters, self.async_waiters = self.async_waiters, []
+        for loop, waiter in waiters:
+            loop.call_soon_threadsafe(_wake, waiter)
+
+    def rate_delay(self, request: httpx.Request) -> float:
+        """
+        Reserve rate limit capacity for a request and return the time to wait.
+        """
+        delay = 0.0
+        if self.requests is not None:
+            delay = max(delay, self.requests.reserve(1))
+        if self.tokens is not None:
+            delay = max(delay, self.tokens.reserve(estimate_tokens(request)))
+        return delay
+
+    def retry_delay(self, attempt: int, response: Optional[httpx.Response]) -> float:
+        if response is not None:
+            retry_after = parse_retry_after(response.headers.get("retry-after"))
+            if retry_after is not None:
+                return min(retry_after, self.max_backoff)
+        return random.uniform(0, min(self.max_backoff, self.backoff * 2**attempt))
+
+    def should_retry(self, attempt: int, response: Optional[httpx.Response]) -> bool:
+        if attempt >= self.max_retries:
+            return False
+        return response is None or response.status_code in RETRY_STATUS_CODES
+
+
+class RateLimitedTransport(httpx.BaseTransport):
+    """
+    Synchronous httpx transport applying a `RateLimiter` around another transport.
+
+    Response bodies are downloaded while the request holds its slot, so the
+    in-flight limit and `llm_service_s` cover the download. Event streams
+    are returned unread, and only their headers are covered.
+    """
+
+    def __init__(self, transport: httpx.BaseTransport, limiter: RateLimiter) -> None:
+        self.transport = transport
+        self.limiter = limiter
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        limiter = self.limiter
+        request.read()
+        attempt, wait = 0, 0.0
+        while True:
+            # Wait for rate limit capacity before taking a slot, so that
+            # sleeping requests do not hold slots
+            start = time.perf_counter()
+            time.sleep(limiter.rate_delay(request))
+            with limiter.slot():
+                wait += time.perf_counter() - start
+
+                start = time.perf_counter()
+                response, error = None, None
+                try:
+                    response = self.transport.handle_request(request)
+                    if unread(response):
+                        # Download the body within the slot too
+                        response = buffered(response, b"".join(response.iter_raw()))
+                except httpx.TransportError as e:
+                    if response is not None:
+                        response.close()
+                    response, error = None, e
+                limiter.record(llm_service_s=time.perf_counter() - start)
+
+            if error is None and response.status_code not in RETRY_STATUS_CODES:
+                limiter.record(llm_requests=1, llm_queue_wait_s=wait)
+                return response
+            if not limiter.should_retry(attempt, response):
+                limiter.record(llm_requests=1, llm_failures=1, llm_queue_wait_s=wait)
+                if error is not None:
+                    raise error
+                return response
+
+            delay = limiter.retry_delay(attempt, response)
+            if response is not None:
+                response.close()
+            limiter.record(llm_retries=1)
+            time.sleep(delay)
+            wait += delay
+            attempt += 1
+
+    def close(self) -> None:
+        self.transport.close()
+
+
+class AsyncRateLimitedTransport(httpx.AsyncBaseTransport):
+    """
+    Asynchronous counterpart of `RateLimitedTransport`.
+    """
+
+    def __init__(
+        self, transport: httpx.AsyncBaseTransport, limiter: RateLimiter
+    ) -> None:
+        self.transport = transport
+        self.limiter = limiter
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        limiter = self.limiter
+        await request.aread()
+        attempt, wait = 0, 0.0
+        while True:
+            start = time.perf_counter()
+            await asyncio.sleep(limiter.rate_delay(request))
+            async with limiter.async_slot():
+                wait += time.perf_counter() - start
+
+                start = time.perf_counter()
+                response, error = None, None
+                try:
+                    response = await self.transport.handle_async_request(request)
+                    if unread(response):
+                        raw = b"".join([chunk async for chunk in response.aiter_raw()])
+                        response = buffered(response, raw)
+                except httpx.TransportError as e:
+                    if response is not None:
+                        await response.aclose()
+                    response, error = None, e
+                limiter.record(llm_service_s=time.perf_counter() - start)
+
+            if error is None and response.status_code not in RETRY_STATUS_CODES:
+                limiter.record(llm_requests=1, llm_queue_wait_s=wait)
+                return response
+            if not limiter.should_retry(attempt, response):
+                limiter.record(llm_requests=1, llm_failures=1, llm_queue_wait_s=wait)
+                if error is not None:
+                    raise error
+                return response
+
+            delay = limiter.retry_delay(attempt, response)
+            if response is not None:
+                await response.aclose()
+            limiter.record(llm_retries=1)
+            await asyncio.sleep(delay)
+            wait += delay
+            attempt += 1
+
+    async def aclose(self) -> None:
+        await self.transport.aclose()
+
+
+def unread(response: httpx.Response) -> bool:
+    """
+    Whether a transport response has a body left to download (event streams
+    are left to the caller).
+    """
+    if response.is_stream_consumed:
+        return False
+    return not response.headers.get("content-type", "").startswith("text/event-stream")
+
+
+def buffered(response: httpx.Response, raw: bytes) -> httpx.Response:
+    """
+    Copy of a transport response whose raw (still encoded) body was downloaded
+    (which closed the original response).
+    """
+    return httpx.Response(
+        response.status_code,
+        headers=response.headers,
+        stream=httpx.ByteStream(raw),
+        extensions=response.extensions,
+    )
+
+
+def _wake(waiter: asyncio.Future) -> None:
+    if not waiter.done():
+        waiter.set_result(None)
+
+
+def estimate_tokens(request: httpx.Request) -> int:
+    """
+    Estimate the tokens a chat completion request counts against a TPM limit.
+    """
+    body = request.content
+    tokens = len(body) // BYTES_PER_TOKEN
+    try:
+        payload = json.loads(body)
+        tokens += int(
+            payload.get("max_completion_tokens") or payload.get("max_tokens") or 0
+        )
+    except (ValueError, AttributeError):
+        pass
+    return tokens
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """
+    Parse a Retry-After header given in seconds or as an HTTP date.
+    """
+    if value is None:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
@@ -0,0 +1,200 @@
+import functools
+import json
+import threading
+import time
+from collections import defaultdict
+from typing import Callable, Dict, List, Optional, Tuple
+
+
+class Profiler:
+    """
+    Per-phase latency and token instrumentation for the planning loop.
+
+    While enabled, the methods listed in `targets()` are wrapped with timers
+    (times are inclusive, e.g. ``planner.replan`` contains its LLM calls).
+    A call nested in another call of the same phase on the same thread (e.g.
+    a planner falling back to another planner's ``initial_plan``) is counted
+    as part of the outer call only.
+    Nothing is patched while disabled, so instrumentation costs nothing
+    unless it is used.
+
+    Pass `trace_path` to also append every timed call to a JSON lines file.
+
+    Examples
+    --------
+    >>> from agents import AgentCollection
+    >>> from multigrid.envs import EmptyEnvV2
+    >>> from planner.super_planner import SuperPlanner
+    >>> from planner.utils.fake_llm import FakePlanChatModel
+    >>> env = EmptyEnvV2(size=8, agents=2)
+    >>> observations, infos = env.reset(seed=0)
+    >>> planner = SuperPlanner(
+    ...     llm=FakePlanChatModel(), grid_size=8, observations=observations, infos=infos
+    ... )
+    >>> agents = AgentCollection(num=2)
+    >>> profiler = Profiler()
+    >>> with profiler:
+    ...     _, plan = planner.initial_plan()
+    ...     agents.tell_plan(plan)
+    ...     for _ in range(10):
+    ...         _ = env.step(agents.act())
+    >>> summary = profiler.summary()
+    >>> summary["planner_initial_plan_n"], summary["llm_call_n"], summary["env_step_n"]
+    (1, 1, 10)
+    >>> summary["llm_input_tokens"] > 0
+    True
+    >>> planner.close()
+    """
+
+    def __init__(self, trace_path: Optional[str] = None) -> None:
+        self.trace_path = trace_path
+        self.trace_file = None
+        self.lock = threading.Lock()
+        self.active = threading.local()
+        self.patches: List[Tuple[type, str, Callable]] = []
+        self.reset()
+
+    def reset(self) -> None:
+        """
+        Clear all timers and counters (e.g. at the start of a trial).
+        """
+        self.times: Dict[str, float] = defaultdict(float)
+        self.calls: Dict[str, int] = defaultdict(int)
+        self.counters: Dict[str, int] = defaultdict(int)
+
+    def record(self, phase: str, start: float, duration: float, **extra) -> None:
+        with self.lock:
+            self.times[phase] += duration
+            self.calls[phase] += 1
+            for name, value in extra.items():
+                self.counters[name] += value
+            if self.trace_file is not None:
+                event = {
+                    "phase": phase,
+                    "start": start,
+                    "duration": duration,
+                    "thread": threading.get_ident(),
+                    **extra,
+                }
+                self.trace_file.write(json.dumps(event) + "\n")
+
+    def count(self, name: str, value: int = 1) -> None:
+        with self.lock:
+            self.counters[name] += value
+
+    def summary(self) -> Dict[str, float]:
+        """
+        Flat per-trial summary, suitable for extra results CSV columns.
+        """
+        out = {}
+        for phase in sorted(self.calls):
+            key = phase.replace(".", "_")
+            out[f"{key}_s"] = round(self.times[phase], 6)
+            out[f"{key}_n"] = self.calls[phase]
+        out.update(sorted(self.counters.items()))
+        return out
+
+    def timed(self, phase: str, fn: Callable) -> Callable:
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            active = getattr(self.active, "phases", None)
+            if active is None:
+                active = self.active.phases = set()
+            if phase in active:
+                return fn(*args, **kwargs)
+            active.add(phase)
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                self.record(phase, start, time.perf_counter() - start)
+                active.discard(phase)
+
+        return wrapper
+
+    def timed_llm(self, phase: str, fn: Callable) -> Callable:
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            message = fn(*args, **kwargs)
+            usage = getattr(message, "usage_metadata", None) or {}
+            self.record(
+                phase,
+                start,
+                time.perf_counter() - start,
+                llm_input_tokens=usage.get("input_tokens", 0),
+                llm_output_tokens=usage.get("output_tokens", 0),
+            )
+            return message
+
+        return wrapper
+
+    def targets(self):
+        """
+        Methods to instrument, as (class, method name, phase, wrapper factory).
+        """
+        from langchain_core.language_models.chat_models import BaseChatModel
+        from langchain_core.output_parsers import (
+            BaseGenerationOutputParser,
+            BaseOutputParser,
+        )
+        from langchain_core.prompts.base import BasePromptTemplate
+
+        from agents import AgentCollection
+        from multigrid.base import MultiGridEnv
+        from multigrid.base_multigoal import MultiGoalGridEnv
+
+        from ..base import BasePlanner
+
+        targets = []
+        for env_cls in (MultiGridEnv, MultiGoalGridEnv):
+            targets += [
+                (env_cls, "step", "env.step", self.timed),
+                (env_cls, "gen_obs", "env.gen_obs", self.timed),
+                (env_cls, "render", "env.render", self.timed),
+            ]
+        targets += [
+            (AgentCollection, "act", "agents.act", self.timed),
+            (AgentCollection, "tell", "agents.tell", self.timed),
+            (AgentCollection, "tell_plan", "agents.tell_plan", self.timed),
+            (AgentCollection, "compile", "agents.compile", self.timed),
+            (BasePromptTemplate, "invoke", "llm.prompt", self.timed),
+            (BaseChatModel, "invoke", "llm.call", self.timed_llm),
+            (BaseOutputParser, "invoke", "llm.parse", self.timed),
+            (BaseGenerationOutputParser, "invoke", "llm.parse", self.timed),
+        ]
+        planner_classes = [BasePlanner]
+        while planner_classes:
+            cls = planner_classes.pop()
+            planner_classes += cls.__subclasses__()
+            for name in ("initial_plan", "replan"):
+                targets.append((cls, name, f"planner.{name}", self.timed))
+        return targets
+
+    def enable(self) -> None:
+        if self.patches:
+            return
+        if self.trace_path is not None:
+            self.trace_file = open(self.trace_path, "a")
+        for cls, name, phase, wrap in self.targets():
+            # Only patch methods defined on the class itself, so that
+            # inherited methods are not timed twice
+            if name in cls.__dict__ and not getattr(cls.__dict__[name], "__isabstractmethod__", False):
+                original = cls.__dict__[name]
+                setattr(cls, name, wrap(phase, original))
+                self.patches.append((cls, name, original))
+
+    def disable(self) -> None:
+        for cls, name, original in reversed(self.patches):
+            setattr(cls, name, original)
+        self.patches.clear()
+        if self.trace_file is not None:
+            self.trace_file.close()
+            self.trace_file = None
+
+    def __enter__(self) -> "Profiler":
+        self.enable()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.disable()
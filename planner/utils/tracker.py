@@ -10,6 +10,11 @@ class Tracker:
         self.grid[:, 0] = 7
         self.grid[:, -1] = 7
 
+    def copy(self) -> "Tracker":
+        tracker = Tracker.__new__(Tracker)
+        tracker.grid = self.grid.copy()
+        return tracker
+
     def observe(self, observations, rewards):
         for k, v in observations.items():
             if k == "global":
@@ -15,9 +15,12 @@ from models import local_llm as llm
 #####################################################
 # TODO: Import helper functions and classes, if any.
 from planner import SuperPlanner as Planner
+from planner.utils.profiling import Profiler
 
 #####################################################
 section = "env.8"
+profile = False  # Add per-phase timings and token counts to the results
+trace = False  # Also write a JSONL trace of every timed call
 
 # Set up logging
 logging.basicConfig(
@@ -29,6 +32,9 @@ logging.basicConfig(
     ],
 )
 os.makedirs("gif", exist_ok=True)
+profiler = Profiler(trace_path=f"trace_{section}.jsonl" if trace else None)
+if profile:
+    profiler.enable()
 
 # Load test environment configurations
 config = configparser.ConfigParser()
@@ -52,6 +58,8 @@ results_i = []
 for trial in range(1, num_trials + 1):
     logging.info(f"Trial {trial}/{num_trials} for {section}")
     frames = []
+    profiler.reset()
+    planner = None
 
     try:
         # Create the environment with specified parameters
@@ -77,14 +85,14 @@ for trial in range(1, num_trials + 1):
             infos=infos,
         )
         text_plan, plan = planner.initial_plan()
-        for agent, actions in plan.items():
-            for action in actions:
-                agents.tell({agent: action.serialize()})
+        agents.tell_plan(plan)
 
         #####################################################
 
         while not env.unwrapped.is_done():
-            a = agents.act()
+            # Agents re-anchor their plans if they are not where they expect
+            positions = {i: observations[i]["location"] for i in range(M)}
+            a = agents.act(positions)
             observations, rewards, terminations, truncations, infos = env.step(a)
             frames.append(env.render())
             #####################################################
@@ -92,10 +100,7 @@ for trial in range(1, num_trials + 1):
             text_plan, plan = planner.replan(
                 agents, observations, rewards, terminations, truncations, infos
             )
-            for agent, actions in plan.items():
-                agents.tell({agent: "stop()"})
-                for action in actions:
-                    agents.tell({agent: action.serialize()})
+            agents.tell_plan(plan, replace=True)
             #####################################################
 
         logging.info(f"Number of steps taken: {env.unwrapped.step_count}")
@@ -127,8 +132,12 @@ for trial in range(1, num_trials + 1):
         )
 
     finally:
+        if planner is not None:
+            # Stop background LLM requests that are still running
+            planner.close()
         results_i = {
             "env_name": section,
+            "planner": Planner.__name__,
             "trial_id": trial,
             "num_agents": M,
             "gridsize": N,
@@ -138,7 +147,10 @@ for trial in range(1, num_trials + 1):
             "targets_found": targets_found,
             "targets_remaining": num_targets_left,
         }
+        if profile:
+            results_i.update(profiler.summary())
         results.append(results_i)
         env.close()
 
+profiler.disable()
 pd.DataFrame(results).to_csv(f"results_{section}.csv", sep=";", index=False)